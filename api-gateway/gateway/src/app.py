@@ -1,17 +1,52 @@
+import asyncio
 import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Response
 from starlette.responses import JSONResponse, Response as StarResponse
 from .gateway_pipeline import GatewayPipeline
+from .middlewares.routing import RoutingMiddleware
+from .middlewares.security import SecurityMiddleware
 from .routes.rag import router as rag_router
-from .routes.rag_content_loader import router as rag_loader_router
+from .routes.rag_content_loader import router as rag_loader_router, run_ingest_job
 from .routes.rag_delete import router as rag_delete_router
 from .routes.rag_upsert import router as rag_upsert_router
+from .services.http_clients import http_clients
+from .services.ingest_jobs import INGEST_WORKERS, ingest_jobs
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Background Markdown/PDF ingestion; jobs cut off by a crash or restart run
+    # again once their lease expires
+    workers = []
+    if INGEST_WORKERS > 0:
+        workers = ingest_jobs.start_workers(run_ingest_job, INGEST_WORKERS)
+    try:
+        yield
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        app.state.routing.stop()
+        # The upstream pools are a module-level registry on purpose: the RAG helpers
+        # and pipeline stages that use them have no request or app at hand
+        await http_clients.aclose()
+
 
 def build_app() -> FastAPI:
     from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
-    app = FastAPI(title='HX API Gateway')
+    app = FastAPI(title='HX API Gateway', lifespan=lifespan)
     pipeline = GatewayPipeline()
+    # RAG search routes sit outside the pipeline; they check keys with its SecurityMiddleware
+    app.state.security = next(
+        stage for stage in pipeline.stages if isinstance(stage, SecurityMiddleware)
+    )
+    # Its config poller runs on the serving loop and is stopped with it
+    app.state.routing = next(
+        stage for stage in pipeline.stages if isinstance(stage, RoutingMiddleware)
+    )
     app.include_router(rag_router, tags=['rag'])
     app.include_router(rag_upsert_router, tags=['rag'])
     app.include_router(rag_delete_router, tags=['rag'])
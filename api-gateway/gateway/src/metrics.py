@@ -1,5 +1,5 @@
 from __future__ import annotations
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 rag_upserts = Counter("rag_upserts_total", "Total RAG upsert requests", ["result"])
 rag_deletes = Counter("rag_deletes_total", "Total RAG delete requests", ["result", "mode"])
@@ -7,3 +7,11 @@ rag_search  = Counter("rag_search_total",  "Total RAG search requests",  ["resul
 
 embed_latency = Histogram("rag_embedding_seconds", "Embedding call latency (s)")
 qdrant_latency = Histogram("rag_qdrant_seconds", "Qdrant call latency (s)", ["op"])
+
+routing_config_version = Gauge("routing_config_version", "Version of the loaded routing/registry config")
+routing_config_reloads = Counter("routing_config_reloads_total", "Routing config reload attempts", ["result"])
+upstream_retries = Counter("upstream_retries_total", "Upstream re-dispatches after a failed attempt", ["reason"])
+circuit_breaker_state = Gauge("circuit_breaker_state", "Circuit state per upstream target (0=closed, 1=half-open, 2=open)", ["target"])
+embed_cache = Counter("rag_embedding_cache_total", "Query embedding cache lookups", ["result"])
+doc_embed_cache = Counter("rag_document_embedding_cache_total", "Document (upsert) embedding cache lookups", ["result"])
+search_cache_lookups = Counter("rag_search_cache_total", "RAG search result cache lookups", ["result"])
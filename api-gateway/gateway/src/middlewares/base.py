@@ -5,3 +5,17 @@ from typing import Any
 class MiddlewareBase:
     async def process(self, context: dict[str, Any]) -> dict[str, Any]:
         return context
+
+
+async def read_body(context: dict[str, Any]) -> bytes:
+    """
+    Read the request body at most once and share it across pipeline stages.
+
+    Stages that need to inspect the body must go through this helper; if none
+    does, ExecutionMiddleware forwards the raw request stream upstream instead.
+    """
+    body: bytes | None = context.get("request_body_bytes")
+    if body is None:
+        body = await context["request"].body()
+        context["request_body_bytes"] = body
+    return body
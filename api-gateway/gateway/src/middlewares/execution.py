@@ -1,12 +1,26 @@
 # /opt/HX-Infrastructure-/api-gateway/gateway/src/middlewares/execution.py
+import asyncio
 import json
+import logging
+import math
 import os
+import time
+from collections.abc import AsyncIterator, Callable
 from typing import Any
 
 import httpx
 from fastapi import Response
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
 
+from ..metrics import upstream_retries
+from ..routing.retry import RETRYABLE_STATUS, RetryPolicy, is_retry_safe
+from ..routing.selector import load_tracker
+from ..services.circuit_breaker import CircuitOpenError, get_breaker
 from .base import MiddlewareBase
+from .payload import RequestPayload, body_rewritten, effective_body
+
+logger = logging.getLogger(__name__)
 
 
 class ExecutionMiddleware(MiddlewareBase):
@@ -30,10 +44,13 @@ class ExecutionMiddleware(MiddlewareBase):
         path = request.url.path
         method = request.method.upper()
 
-        # Use transformed body if available, otherwise original request body
-        body = context.get("transformed_body")
+        # Single "effective body" shared by all stages (see payload.effective_body);
+        # when no stage touched it, stream the untouched request body upstream.
+        body = effective_body(context)
+        rewritten = body_rewritten(context)
+        passthrough = body is None and self._has_body(request)
         if body is None:
-            body = await request.body()
+            body = request.stream() if passthrough else b""
 
         # Build upstream URL, preserving the query string
         url = f"{self._client.base_url}{path}"
@@ -78,9 +95,14 @@ class ExecutionMiddleware(MiddlewareBase):
         }
 
         # If the body was transformed, content-encoding may no longer be valid.
-        if "transformed_body" in context:
+        if rewritten:
             fwd_headers.pop("content-encoding", None)
 
+        # A streamed body is byte-identical to the original, so keep its declared
+        # length rather than letting httpx fall back to chunked transfer encoding.
+        if passthrough and request.headers.get("content-length"):
+            fwd_headers["Content-Length"] = request.headers["content-length"]
+
         # Upstream authentication
         upstream_key = os.getenv("HX_UPSTREAM_KEY")
         if upstream_key:
@@ -93,29 +115,270 @@ class ExecutionMiddleware(MiddlewareBase):
         ):
             fwd_headers["X-HX-Client-IP"] = request.client.host
 
-        try:
-            upstream_response = await self._client.request(
-                method, url, headers=fwd_headers, content=body
+        policy: RetryPolicy = context.get("retry_policy") or RetryPolicy()
+        deadline = time.monotonic() + policy.deadline_s
+        # A streamed body is consumed by the first attempt, so only buffered
+        # bodies of side-effect-free requests can be re-dispatched.
+        replayable = not passthrough and is_retry_safe(method, path)
+        attempts = 1 + policy.total if replayable else 1
+        model = context.get("routed_model")
+        plan = [model]
+        if replayable and "transformed_body" not in context:
+            plan.extend(context.get("failover_models") or ())
+
+        streaming = self._wants_stream(context, request)
+        attempt = 0
+        while True:
+            # Walk the failover order; once exhausted, keep retrying its last model
+            target = plan[min(attempt, len(plan) - 1)]
+            if target is not None and target != model:
+                model = target
+                body = self._retarget(context, model)
+
+            breaker = get_breaker(f"upstream:{model}" if model else "upstream")
+            if not breaker.allow():
+                # Fail fast instead of waiting out the timeout; fail over if we can
+                error = CircuitOpenError(breaker.target, breaker.retry_after())
+                if attempt + 1 >= attempts:
+                    context["response"] = self._circuit_open_response(error)
+                    return context
+                upstream_retries.labels(reason="circuit_open").inc()
+                logger.warning(f"{error}; skipping attempt {attempt + 1}/{attempts}")
+                attempt += 1
+                continue
+
+            # Feed in-flight counts and latency EWMA back into model selection
+            finish = self._track_load(model)
+            started = time.monotonic()
+            try:
+                upstream_response = await self._send(
+                    method, url, fwd_headers, body, self._attempt_timeout(deadline), streaming
+                )
+            except httpx.HTTPError as e:
+                finish()
+                breaker.record(False)
+                delay = self._next_delay(policy, attempt, attempts, deadline)
+                if delay is None or not isinstance(e, httpx.TransportError):
+                    context["response"] = (
+                        self._timeout_response(e)
+                        if isinstance(e, httpx.TimeoutException)
+                        else self._unreachable_response(e)
+                    )
+                    return context
+                reason = "timeout" if isinstance(e, httpx.TimeoutException) else "connect"
+                detail = str(e) or type(e).__name__
+            except BaseException:
+                finish()
+                breaker.release()
+                raise
+            else:
+                breaker.record(
+                    upstream_response.status_code < 500, time.monotonic() - started
+                )
+                delay = None
+                if upstream_response.status_code in RETRYABLE_STATUS:
+                    delay = self._next_delay(policy, attempt, attempts, deadline)
+                if delay is None:
+                    context["response"] = await self._build_response(
+                        upstream_response, finish, streaming
+                    )
+                    return context
+                await self._close_upstream(upstream_response, finish)
+                reason = "status"
+                detail = f"HTTP {upstream_response.status_code}"
+
+            upstream_retries.labels(reason=reason).inc()
+            logger.warning(
+                f"Upstream attempt {attempt + 1}/{attempts} for {model or path} failed "
+                f"({detail}); retrying in {delay:.2f}s"
             )
-        except httpx.TimeoutException as e:
-            context["response"] = Response(
-                status_code=504,
-                content=json.dumps(
-                    {"error": "upstream_timeout", "detail": str(e)}
-                ).encode(),
-                media_type="application/json",
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        fwd_headers: dict[str, str],
+        body: bytes | AsyncIterator[bytes],
+        timeout: httpx.Timeout,
+        streaming: bool,
+    ) -> httpx.Response:
+        """One upstream attempt; streaming responses are returned before the body is read."""
+        if not streaming:
+            return await self._client.request(
+                method, url, headers=fwd_headers, content=body, timeout=timeout
             )
-            return context
-        except httpx.HTTPError as e:
-            context["response"] = Response(
-                status_code=502,
-                content=json.dumps(
-                    {"error": "upstream_unreachable", "detail": str(e)}
-                ).encode(),
-                media_type="application/json",
+        upstream_request = self._client.build_request(
+            method, url, headers=fwd_headers, content=body, timeout=timeout
+        )
+        return await self._client.send(upstream_request, stream=True)
+
+    @staticmethod
+    def _retarget(context: dict[str, Any], model: str) -> bytes:
+        """Point the shared payload at a failover model and return the new body."""
+        payload: RequestPayload = context["payload"]
+        payload.data["model"] = model
+        payload.mark_dirty()
+        context["routed_model"] = model
+        return payload.to_bytes()
+
+    def _attempt_timeout(self, deadline: float) -> httpx.Timeout:
+        """Client timeouts, clamped so a single attempt cannot overrun the request deadline."""
+        remaining = max(0.001, deadline - time.monotonic())
+        configured = self._client.timeout
+
+        def clamp(value: float | None) -> float:
+            return remaining if value is None else min(value, remaining)
+
+        return httpx.Timeout(
+            connect=clamp(configured.connect),
+            read=clamp(configured.read),
+            write=clamp(configured.write),
+            pool=clamp(configured.pool),
+        )
+
+    @staticmethod
+    def _next_delay(
+        policy: RetryPolicy, attempt: int, attempts: int, deadline: float
+    ) -> float | None:
+        """Backoff before the next attempt, or None when retries or the deadline are spent."""
+        if attempt + 1 >= attempts:
+            return None
+        delay = policy.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    @staticmethod
+    def _track_load(model: str | None) -> Callable[[], None]:
+        """Count a call against `model`'s load; returns an idempotent completion callback."""
+        if not model:
+            return lambda: None
+        started_at = load_tracker.start(model)
+        finished = False
+
+        def finish() -> None:
+            nonlocal finished
+            if not finished:
+                finished = True
+                load_tracker.finish(model, started_at)
+
+        return finish
+
+    @staticmethod
+    def _has_body(request: Any) -> bool:
+        """True when the client declared a request body (fixed-length or chunked)."""
+        content_length = request.headers.get("content-length")
+        if content_length is not None:
+            return content_length.strip() not in ("", "0")
+        return "transfer-encoding" in request.headers
+
+    @staticmethod
+    def _wants_stream(context: dict[str, Any], request: Any) -> bool:
+        """Streaming is requested via `"stream": true` (flagged by routing) or an SSE Accept header."""
+        if context.get("stream"):
+            return True
+        return "text/event-stream" in request.headers.get("accept", "").lower()
+
+    async def _build_response(
+        self,
+        upstream_response: httpx.Response,
+        finish: Callable[[], None],
+        streaming: bool,
+    ) -> Response:
+        """Relay SSE chunks as they arrive when streaming; buffer everything else."""
+        if not streaming:
+            finish()
+            return Response(
+                content=upstream_response.content,
+                status_code=upstream_response.status_code,
+                headers=self._response_headers(upstream_response),
+            )
+
+        content_type = upstream_response.headers.get("content-type", "").lower()
+        if upstream_response.status_code >= 400 or not content_type.startswith(
+            "text/event-stream"
+        ):
+            # Errors and non-SSE replies are small; buffer them like the regular path
+            try:
+                content = await upstream_response.aread()
+            except httpx.TimeoutException as e:
+                return self._timeout_response(e)
+            except httpx.HTTPError as e:
+                return self._unreachable_response(e)
+            finally:
+                await self._close_upstream(upstream_response, finish)
+            return Response(
+                content=content,
+                status_code=upstream_response.status_code,
+                headers=self._response_headers(upstream_response),
             )
-            return context
 
+        resp_headers = self._response_headers(upstream_response)
+        # Prevent intermediaries (e.g. nginx) from re-buffering the event stream
+        resp_headers["X-Accel-Buffering"] = "no"
+
+        return StreamingResponse(
+            self._relay_chunks(upstream_response, finish),
+            status_code=upstream_response.status_code,
+            headers=resp_headers,
+            # Safety net: both steps are idempotent, so this is harmless if the relay already ran them
+            background=BackgroundTask(self._close_upstream, upstream_response, finish),
+        )
+
+    @classmethod
+    async def _relay_chunks(
+        cls, upstream_response: httpx.Response, finish: Callable[[], None]
+    ) -> AsyncIterator[bytes]:
+        """Yield raw upstream chunks; always release the upstream connection, even on client disconnect."""
+        try:
+            async for chunk in upstream_response.aiter_raw():
+                yield chunk
+        except httpx.HTTPError as e:
+            # Headers are already sent, so the only option is to end the stream early
+            logger.warning(f"Upstream stream terminated early: {e}")
+        finally:
+            await cls._close_upstream(upstream_response, finish)
+
+    @staticmethod
+    async def _close_upstream(
+        upstream_response: httpx.Response, finish: Callable[[], None]
+    ) -> None:
+        await upstream_response.aclose()
+        finish()
+
+    @staticmethod
+    def _timeout_response(e: Exception) -> Response:
+        return Response(
+            status_code=504,
+            content=json.dumps({"error": "upstream_timeout", "detail": str(e)}).encode(),
+            media_type="application/json",
+        )
+
+    @staticmethod
+    def _unreachable_response(e: Exception) -> Response:
+        return Response(
+            status_code=502,
+            content=json.dumps(
+                {"error": "upstream_unreachable", "detail": str(e)}
+            ).encode(),
+            media_type="application/json",
+        )
+
+    @staticmethod
+    def _circuit_open_response(e: CircuitOpenError) -> Response:
+        return Response(
+            status_code=503,
+            content=json.dumps(
+                {"error": "upstream_circuit_open", "detail": str(e)}
+            ).encode(),
+            media_type="application/json",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+    @staticmethod
+    def _response_headers(upstream_response: httpx.Response) -> dict[str, str]:
         # Filter response headers and add security headers
         resp_headers = {
             k: v
@@ -157,9 +420,4 @@ class ExecutionMiddleware(MiddlewareBase):
                     "default-src 'none'; frame-ancestors 'none';"
                 )
 
-        context["response"] = Response(
-            content=upstream_response.content,
-            status_code=upstream_response.status_code,
-            headers=resp_headers,
-        )
-        return context
+        return resp_headers
@@ -0,0 +1,103 @@
+# /opt/HX-Infrastructure-/api-gateway/gateway/src/middlewares/payload.py
+import json
+from types import ModuleType
+from typing import Any
+
+from .base import read_body
+
+# Optional fast path: orjson parses/serializes several times faster than stdlib json.
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the same type.
+orjson: ModuleType | None
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only when orjson is absent
+    orjson = None
+
+
+def _loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _dumps(data: Any) -> bytes:
+    if orjson is not None:
+        encoded: bytes = orjson.dumps(data)
+        return encoded
+    return json.dumps(data).encode("utf-8")
+
+
+class RequestPayload:
+    """
+    JSON request body shared by all pipeline stages.
+
+    The raw bytes are parsed lazily on first access to `data` and memoized.
+    Stages that mutate `data` call `mark_dirty()`; the body is re-serialized
+    once, by ExecutionMiddleware, via `to_bytes()`. `modified` stays set after
+    serialization so the executor knows the bytes differ from the client's.
+    """
+
+    __slots__ = ("_data", "_parsed", "dirty", "modified", "raw")
+
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw
+        self.dirty = False
+        self.modified = False
+        self._data: Any = None
+        self._parsed = False
+
+    @property
+    def data(self) -> Any:
+        """Parsed JSON body (empty body parses as `{}`); raises json.JSONDecodeError."""
+        if not self._parsed:
+            self._data = _loads(self.raw) if self.raw else {}
+            self._parsed = True
+        return self._data
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+        self.modified = True
+
+    def to_bytes(self) -> bytes:
+        """Body to send upstream: the original bytes unless a stage changed `data`."""
+        if self.dirty:
+            self.raw = _dumps(self._data)
+            self.dirty = False
+        return self.raw
+
+
+async def get_payload(context: dict[str, Any]) -> RequestPayload:
+    """Return the request's shared RequestPayload, reading the body on first use."""
+    payload = context.get("payload")
+    if payload is None:
+        payload = RequestPayload(await read_body(context))
+        context["payload"] = payload
+    return payload
+
+
+# ---- Effective body contract --------------------------------------------------
+# Every stage that needs the body reads it via get_payload()/read_body() and
+# edits `payload.data` in place (plus mark_dirty()). ExecutionMiddleware then
+# sends exactly one "effective body", chosen in this order:
+#   1. context["transformed_body"]  - explicit raw-bytes override (custom stages)
+#   2. context["payload"]           - shared payload, re-serialized if modified
+#   3. context["request_body_bytes"] - body buffered by read_body()
+# None means no stage touched the body, so it is streamed through untouched.
+
+
+def effective_body(context: dict[str, Any]) -> bytes | None:
+    """Return the body to send upstream, or None to stream the original."""
+    body: bytes | None = context.get("transformed_body")
+    if body is not None:
+        return body
+    payload: RequestPayload | None = context.get("payload")
+    if payload is not None:
+        return payload.to_bytes()
+    buffered: bytes | None = context.get("request_body_bytes")
+    return buffered
+
+
+def body_rewritten(context: dict[str, Any]) -> bool:
+    """True when the effective body differs from what the client sent."""
+    payload = context.get("payload")
+    return "transformed_body" in context or (payload is not None and payload.modified)
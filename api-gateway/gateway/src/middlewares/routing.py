@@ -4,11 +4,12 @@ import logging
 import os
 from typing import Any
 
-import yaml
 from fastapi import Response
 
-from ..routing.selector import ModelSelectionAlgorithm
+from ..routing.config import RoutingConfig
+from ..routing.tokens import PromptSize
 from .base import MiddlewareBase
+from .payload import get_payload
 
 CFG_DIR = os.environ.get(
     "API_GATEWAY_CFG_DIR", "/opt/HX-Infrastructure-/api-gateway/config/api-gateway"
@@ -17,111 +18,49 @@ CFG_DIR = os.environ.get(
 
 class RoutingMiddleware(MiddlewareBase):
     def __init__(self) -> None:
-        self._registry = None
-        self._routing = None
-        self._algo = ModelSelectionAlgorithm()
+        # Parsed, validated and hot-reloaded off the request path
+        self._config = RoutingConfig(CFG_DIR)
         self.logger = logging.getLogger(__name__)
         # Cache environment variables to avoid repeated lookups
         self._max_body_size = int(os.environ.get("HX_MAX_ROUTING_BODY_SIZE", "65536"))
 
-    def _load_configs(self):
-        """Load configuration files with comprehensive error handling and validation"""
-        if self._registry is None:
-            try:
-                registry_path = f"{CFG_DIR}/model_registry.yaml"
-                with open(registry_path) as f:
-                    content = f.read()
-                    if not content.strip():
-                        self.logger.warning(
-                            f"Model registry file {registry_path} is empty"
-                        )
-                        self._registry = {}
-                    else:
-                        self._registry = yaml.safe_load(content)
-                        if not isinstance(self._registry, dict):
-                            self.logger.error(
-                                f"Model registry must be a dictionary, got {type(self._registry)}"
-                            )
-                            self._registry = {}
-
-                        # Validate registry structure
-                        if "models" in self._registry and not isinstance(
-                            self._registry["models"], list
-                        ):
-                            self.logger.error(
-                                "Model registry 'models' field must be a list"
-                            )
-                            self._registry = {}
-
-            except FileNotFoundError:
-                self.logger.warning(
-                    f"Model registry file not found: {CFG_DIR}/model_registry.yaml"
-                )
-                self._registry = {}
-            except PermissionError as e:
-                self.logger.error(f"Permission denied reading model registry: {e}")
-                self._registry = {}
-            except yaml.YAMLError as e:
-                self.logger.error(f"YAML parse error in model registry: {e}")
-                self._registry = {}
-            except Exception as e:
-                self.logger.error(f"Unexpected error loading model registry: {e}")
-                self._registry = {}
-
-        if self._routing is None:
-            try:
-                routing_path = f"{CFG_DIR}/routing.yaml"
-                with open(routing_path) as f:
-                    content = f.read()
-                    if not content.strip():
-                        self.logger.warning(
-                            f"Routing config file {routing_path} is empty"
-                        )
-                        self._routing = {}
-                    else:
-                        self._routing = yaml.safe_load(content)
-                        if not isinstance(self._routing, dict):
-                            self.logger.error(
-                                f"Routing config must be a dictionary, got {type(self._routing)}"
-                            )
-                            self._routing = {}
-
-            except FileNotFoundError:
-                self.logger.warning(
-                    f"Routing config file not found: {CFG_DIR}/routing.yaml"
-                )
-                self._routing = {}
-            except PermissionError as e:
-                self.logger.error(f"Permission denied reading routing config: {e}")
-                self._routing = {}
-            except yaml.YAMLError as e:
-                self.logger.error(f"YAML parse error in routing config: {e}")
-                self._routing = {}
-            except Exception as e:
-                self.logger.error(f"Unexpected error loading routing config: {e}")
-                self._routing = {}
+    def stop(self) -> None:
+        """Stop the config hot-reload poller (app shutdown)."""
+        self._config.stop()
+
+    def _context_exceeded(self, req_ctx: dict[str, Any], target: str) -> Response:
+        self.logger.warning(
+            f"Request of ~{req_ctx['estimated_tokens']} tokens exceeds context_length for {target}"
+        )
+        return Response(
+            status_code=400,
+            content=json.dumps(
+                {
+                    "error": "context_length_exceeded",
+                    "detail": f"Estimated {req_ctx['estimated_tokens']} tokens exceeds "
+                    f"the context window of {target}",
+                }
+            ).encode(),
+            media_type="application/json",
+        )
 
     async def process(self, context: dict[str, Any]) -> dict[str, Any]:
-        self._load_configs()
+        self._config.ensure_watching()
+        # One consistent config version for the whole request
+        snapshot = self._config.snapshot
+        context["retry_policy"] = snapshot.retry_policy
         req = context["request"]
         if not req.url.path.startswith("/v1/chat/completions"):
             return context
 
-        # Build req_ctx (future: estimate tokens/complexity)
-        req_ctx = {
-            "estimated_tokens": 512,
-            "complexity_score": 1.0,
-            "domain": req.headers.get("x-hx-domain"),
-        }
-
         # Parse body so we can set model if group provided (or default group)
         try:
-            body_bytes = await req.body()
+            shared_payload = await get_payload(context)
             # Validate body size to prevent memory exhaustion
             max_body_size = self._max_body_size  # 64KB default
-            if len(body_bytes) > max_body_size:
+            if len(shared_payload.raw) > max_body_size:
                 self.logger.error(
-                    f"Request body too large: {len(body_bytes)} bytes (max: {max_body_size})"
+                    f"Request body too large: {len(shared_payload.raw)} bytes (max: {max_body_size})"
                 )
                 context["response"] = Response(
                     status_code=413,
@@ -130,7 +69,7 @@ class RoutingMiddleware(MiddlewareBase):
                 )
                 return context
 
-            payload = json.loads(body_bytes or "{}")
+            payload = shared_payload.data
             if not isinstance(payload, dict):
                 self.logger.error(
                     f"Invalid payload type: expected dict, got {type(payload)}"
@@ -159,42 +98,61 @@ class RoutingMiddleware(MiddlewareBase):
             )
             return context
 
-        # If caller already set an explicit model, respect it
+        # Let ExecutionMiddleware relay SSE chunks instead of buffering the whole generation
+        context["stream"] = payload.get("stream") is True
+
+        # Build req_ctx from the already-parsed messages (future: complexity)
+        prompt_size = PromptSize.from_payload(payload)
+        req_ctx = {
+            "prompt_size": prompt_size,
+            "estimated_tokens": prompt_size.prompt_tokens(),
+            "complexity_score": 1.0,
+            "domain": req.headers.get("x-hx-domain"),
+        }
+        if req_ctx["domain"]:
+            req_ctx["specialists"] = snapshot.by_specialization.get(req_ctx["domain"], frozenset())
+
+        # If caller already set an explicit model, respect it (unless it cannot fit)
         if "model" in payload and isinstance(payload["model"], str):
-            context["normalized_body"] = json.dumps(payload).encode("utf-8")
+            explicit = snapshot.models.get(payload["model"])
+            if explicit is not None and not snapshot.algo.fits(explicit, req_ctx):
+                context["response"] = self._context_exceeded(
+                    req_ctx, f"model '{payload['model']}'"
+                )
+                return context
+            context["routed_model"] = payload["model"]
             return context
 
-        # Safe configuration access with defaults
-        routing_config = (
-            self._routing.get("routing", {}) if isinstance(self._routing, dict) else {}
-        )
-        default_group = routing_config.get("default_group", "default")
-        group = req.headers.get("x-hx-model-group") or default_group
+        group = req.headers.get("x-hx-model-group") or snapshot.default_group
+        candidates = snapshot.groups.get(group, ())
 
-        all_models: list[dict[str, Any]] = (
-            self._registry.get("models", []) if isinstance(self._registry, dict) else []
+        selected = snapshot.algo.select(candidates, req_ctx) if candidates else None
+        if candidates and not selected:
+            # Every model in the group is too small; don't waste an inference slot
+            context["response"] = self._context_exceeded(req_ctx, f"group '{group}'")
+            return context
+
+        model_identifier = None
+        if selected:
+            model_identifier = selected.name
+        elif snapshot.failover_order:
+            # Unknown or empty group: fall back to the head of the failover order
+            model_identifier = snapshot.failover_order[0]
+
+        if not model_identifier:
+            # Nothing routable: leave the body untouched rather than sending "model": null
+            self.logger.warning(f"No model resolved for group '{group}'; forwarding as-is")
+            return context
+
+        payload["model"] = model_identifier
+        context["routed_model"] = model_identifier
+        # Where ExecutionMiddleware re-dispatches if this model's node fails
+        context["failover_models"] = tuple(
+            name
+            for name in snapshot.failover_order
+            if name != model_identifier
+            and (name not in snapshot.models or snapshot.algo.fits(snapshot.models[name], req_ctx))
         )
-        candidates = [
-            m for m in all_models if isinstance(m, dict) and m.get("group") == group
-        ]
-
-        selected = self._algo.select(candidates, req_ctx) if candidates else None
-
-        if not selected:
-            # Fallback to static weights / failover order with safe access
-            failover_order = routing_config.get("failover_order", [])
-            payload["model"] = (
-                failover_order[0]
-                if isinstance(failover_order, list) and failover_order
-                else None
-            )
-        else:
-            # Safe access to selected model name or id, avoid null values
-            if isinstance(selected, dict):
-                model_identifier = selected.get("name") or selected.get("id")
-                if model_identifier:
-                    payload["model"] = model_identifier
-                # If neither name nor id exists, don't set the model key to avoid JSON null
-
-        context["normalized_body"] = json.dumps(payload).encode("utf-8")
+        # The shared payload is the effective body; ExecutionMiddleware serializes it once
+        shared_payload.mark_dirty()
         return context
@@ -119,24 +119,11 @@ class SecurityMiddleware(MiddlewareBase):
                     "or provide HX_DEV_CONFIG_PATH for development, or set HX_ALLOW_DEV_KEY=true for dev mode."
                 )
 
-    async def process(self, context: dict[str, Any]) -> dict[str, Any]:
-        request: Request = context["request"]
-
-        # Allow health endpoints without auth
-        if request.url.path in ("/healthz", "/livez", "/readyz"):
-            return context
-
-        # Get authorization header safely
-        auth_header = request.headers.get("authorization", "")
-
+    def is_authorized(self, auth_header: str) -> bool:
+        """Whether an Authorization header carries the gateway's bearer key."""
         # Extract token with case-insensitive scheme check but preserve token case
         if not auth_header.lower().startswith("bearer "):
-            context["response"] = JSONResponse(
-                {"error": "Unauthorized"},
-                status_code=401,
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-            return context
+            return False
 
         # Extract token (preserve original case)
         provided_token = (
@@ -144,9 +131,21 @@ class SecurityMiddleware(MiddlewareBase):
         )
 
         # Use constant-time comparison to prevent timing attacks
-        if not provided_token or not hmac.compare_digest(
+        return bool(provided_token) and hmac.compare_digest(
             provided_token, self.master_key
-        ):
+        )
+
+    async def process(self, context: dict[str, Any]) -> dict[str, Any]:
+        request: Request = context["request"]
+
+        # Allow health endpoints without auth
+        if request.url.path in ("/healthz", "/livez", "/readyz"):
+            return context
+
+        # Get authorization header safely
+        auth_header = request.headers.get("authorization", "")
+
+        if not self.is_authorized(auth_header):
             context["response"] = JSONResponse(
                 {"error": "Unauthorized"},
                 status_code=401,
@@ -6,6 +6,7 @@ from typing import Any
 from starlette.responses import JSONResponse
 
 from .base import MiddlewareBase
+from .payload import get_payload
 
 
 class TransformMiddleware(MiddlewareBase):
@@ -21,20 +22,9 @@ class TransformMiddleware(MiddlewareBase):
             return context
 
         try:
-            body_bytes = await request.body()
-            if not body_bytes:
+            payload = await get_payload(context)
+            if not payload.raw:
                 return context  # Pass through if no body
-
-            # Cache the body so it can be read again by downstream middleware
-            context["request_body_bytes"] = body_bytes
-
-            # Create a new `receive` callable that returns the cached body
-            async def receive():
-                return {"type": "http.request", "body": body_bytes, "more_body": False}
-
-            # Replace the original `receive` callable
-            request._receive = receive
-
         except Exception as e:
             self.logger.error(f"Failed to read request body for /v1/embeddings: {e}")
             context["response"] = JSONResponse(
@@ -43,7 +33,7 @@ class TransformMiddleware(MiddlewareBase):
             return context
 
         try:
-            payload = json.loads(body_bytes)
+            data = payload.data
         except json.JSONDecodeError as e:
             self.logger.error(f"Invalid JSON in request for /v1/embeddings: {e}")
             context["response"] = JSONResponse(
@@ -52,10 +42,10 @@ class TransformMiddleware(MiddlewareBase):
             return context
 
         # Idempotent transformation: map 'prompt' to 'input' only if 'input' is missing.
-        if "prompt" in payload and "input" not in payload:
+        if isinstance(data, dict) and "prompt" in data and "input" not in data:
             self.logger.debug("Transforming 'prompt' to 'input' for /v1/embeddings")
-            payload["input"] = payload.pop("prompt")
-            # Store the modified body back in the context for the ExecutionMiddleware.
-            context["transformed_body"] = json.dumps(payload).encode("utf-8")
+            data["input"] = data.pop("prompt")
+            # ExecutionMiddleware re-serializes the shared payload once before forwarding.
+            payload.mark_dirty()
 
         return context
@@ -29,6 +29,8 @@ class UpsertDoc(BaseModel):
 class UpsertRequest(BaseModel):
     documents: list[UpsertDoc] = Field(..., min_length=1, max_length=100)
     batch_size: int = Field(default=32, ge=1, le=128)
+    # Skip text documents whose content-derived id already exists (explicit ids always upsert)
+    if_changed: bool = False
 
 
 class UpsertResponse(BaseModel):
@@ -1,15 +1,44 @@
 # /opt/HX-Infrastructure-/api-gateway/gateway/src/routes/rag.py
 
-import os
+import asyncio
+import json
 import logging
-from typing import Annotated, Any, Optional
+import os
+from collections.abc import AsyncIterator
+from typing import Annotated, Any, Literal
 
 import httpx
-from fastapi import APIRouter, Body, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from ..services import security as security_helpers
-from ..services.security import get_embedding_auth_from_request
+from ..services.circuit_breaker import (
+    CircuitOpenError,
+    circuit_open_http_error,
+    get_breaker,
+)
+from ..services.embedding_cache import embedding_cache, normalize_query
+from ..services.http_clients import EMBEDDINGS, QDRANT, RERANK, http_clients
+from ..services.rerank import (
+    RAG_MMR_LAMBDA,
+    RAG_RERANK_CANDIDATES,
+    RAG_RERANK_MODEL,
+    RAG_RERANK_TEXT_FIELDS,
+    hit_text,
+    mmr_select,
+    rerank_local,
+    rescored,
+    without_vector,
+)
+from ..services.search_cache import search_cache
+from ..services.sparse import (
+    DENSE_VECTOR_NAME,
+    RAG_HYBRID_ENABLED,
+    SPARSE_VECTOR_NAME,
+    query_sparse_vector,
+    rrf_fuse,
+)
 
 router = APIRouter(tags=["rag"])
 logger = logging.getLogger(__name__)
@@ -19,22 +48,95 @@ GATEWAY_BASE = os.environ.get("GATEWAY_BASE", "http://127.0.0.1:4000").rstrip("/
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://192.168.10.30:6333").rstrip("/")
 QDRANT_COLLECTION = os.environ.get("QDRANT_COLLECTION", "hx_rag_default")
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "emb-premium")
+RAG_SEARCH_MAX_BATCH = int(os.environ.get("RAG_SEARCH_MAX_BATCH", "64"))
+# Hybrid mode: candidates fetched per leg (dense, sparse) = limit * factor, before fusion
+RAG_HYBRID_PREFETCH_FACTOR = int(os.environ.get("RAG_HYBRID_PREFETCH_FACTOR", "2"))
+# Payload keys left out of search hits unless the request picks its own fields
+RAG_SEARCH_EXCLUDE_FIELDS = tuple(
+    f.strip()
+    for f in os.environ.get(
+        "RAG_SEARCH_EXCLUDE_FIELDS", "chunk_chars,extracted_chars,created_at,expires_at,ttl_days"
+    ).split(",")
+    if f.strip()
+)
 
 # ---- Request / Response Models ---------------------------------------------
 
 
 class RagSearchRequest(BaseModel):
-    query: Optional[str] = Field(default=None, description="Free text to embed")
-    vector: Optional[list[float]] = Field(
+    query: str | None = Field(default=None, description="Free text to embed")
+    vector: list[float] | None = Field(
         default=None, description="Precomputed embedding vector"
     )
     limit: int = Field(default=5, ge=1, le=100)
-    score_threshold: Optional[float] = Field(
+    score_threshold: float | None = Field(
         default=None, description="Optional min similarity score (Qdrant)"
     )
-    namespace: Optional[str] = Field(
+    namespace: str | None = Field(
         default=None, description="Optional namespace filter (payload.namespace)"
     )
+    mode: Literal["dense", "hybrid"] = Field(
+        default="dense",
+        description="'hybrid' fuses dense and sparse BM25 hits (needs RAG_HYBRID_ENABLED)",
+    )
+    rerank: bool = Field(
+        default=False,
+        description="Fetch a wider candidate set and re-rank it down to `limit`",
+    )
+    rerank_candidates: int | None = Field(
+        default=None,
+        ge=1,
+        le=100,
+        description="Candidates fetched for re-ranking / MMR (default RAG_RERANK_CANDIDATES)",
+    )
+    mmr: bool = Field(
+        default=False,
+        description="Diversify results with maximal marginal relevance over stored vectors",
+    )
+    mmr_lambda: float | None = Field(
+        default=None,
+        ge=0.0,
+        le=1.0,
+        description="MMR relevance/diversity trade-off (default RAG_MMR_LAMBDA; 1.0 = relevance only)",
+    )
+    fields: list[str] | None = Field(
+        default=None,
+        description="Payload keys to return for each hit ([] = no payload)",
+    )
+    exclude_fields: list[str] | None = Field(
+        default=None,
+        description="Payload keys to leave out (default RAG_SEARCH_EXCLUDE_FIELDS; [] = whole payload)",
+    )
+
+
+class RagSearchBatchRequest(BaseModel):
+    searches: list[RagSearchRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=RAG_SEARCH_MAX_BATCH,
+        description="Searches to run in one embedding call and one Qdrant round-trip",
+    )
+
+
+class RagScrollRequest(BaseModel):
+    namespace: str | None = Field(
+        default=None, description="Optional namespace filter (payload.namespace)"
+    )
+    limit: int = Field(default=100, ge=1, le=1000, description="Points per Qdrant scroll page")
+    offset: int | str | None = Field(
+        default=None, description="Point id to start from (a previous next_page_offset)"
+    )
+    max_points: int | None = Field(
+        default=None, ge=1, description="Stop after this many points (default: all)"
+    )
+    fields: list[str] | None = Field(
+        default=None,
+        description="Payload keys to return for each point ([] = no payload)",
+    )
+    exclude_fields: list[str] | None = Field(
+        default=None,
+        description="Payload keys to leave out (default RAG_SEARCH_EXCLUDE_FIELDS; [] = whole payload)",
+    )
 
 
 class RagSearchResponse(BaseModel):
@@ -45,51 +147,106 @@ class RagSearchResponse(BaseModel):
 # ---- Helpers ---------------------------------------------------------------
 
 
-async def _compute_embedding(
-    text: str, auth_header: str | None
-) -> list[float]:
+async def _compute_embeddings(
+    texts: list[str], auth_header: str | None
+) -> list[list[float]]:
+    """Embed several texts in one /v1/embeddings call (results in input order)."""
     if not auth_header:
         raise HTTPException(401, "Authorization required for embedding computation")
-    
-    payload = {"model": EMBEDDING_MODEL, "input": text}
+
+    payload = {"model": EMBEDDING_MODEL, "input": texts}
     headers = {"Authorization": auth_header, "Content-Type": "application/json"}
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            r = await client.post(
-                f"{GATEWAY_BASE}/v1/embeddings", headers=headers, json=payload
+        client = http_clients.get(EMBEDDINGS)
+        r = await get_breaker(EMBEDDINGS).call(
+            lambda: client.post(
+                f"{GATEWAY_BASE}/v1/embeddings", headers=headers, json=payload, timeout=20.0
             )
+        )
+    except CircuitOpenError as e:
+        raise circuit_open_http_error(e) from e
     except httpx.RequestError as e:
         raise HTTPException(502, f"Could not connect to embedding service: {e}")
     if r.status_code != 200:
         raise HTTPException(r.status_code, f"Embeddings error: {r.text}")
     try:
-        data = r.json()
-        return data["data"][0]["embedding"]
+        rows = sorted(r.json()["data"], key=lambda row: row.get("index", 0))
+        vectors = [row["embedding"] for row in rows]
     except Exception:
         raise HTTPException(500, "Unexpected embedding response format.")
+    if len(vectors) != len(texts):
+        raise HTTPException(500, "Unexpected embedding response format.")
+    return vectors
 
 
-async def _qdrant_search(
-    vector: list[float],
+async def _compute_embedding(
+    text: str, auth_header: str | None
+) -> list[float]:
+    return (await _compute_embeddings([text], auth_header))[0]
+
+
+async def _embed_query(text: str, auth_header: str | None) -> list[float]:
+    """Embedding for a search query, served from the query embedding cache when possible."""
+    vector = await embedding_cache.get(EMBEDDING_MODEL, text)
+    if vector is None:
+        vector = await _compute_embedding(text, auth_header)
+        await embedding_cache.put(EMBEDDING_MODEL, text, vector)
+    return vector
+
+
+async def _embed_queries(texts: list[str], auth_header: str | None) -> list[list[float]]:
+    """Embeddings for many queries: cache hits first, the rest in a single upstream call."""
+    vectors: dict[str, list[float]] = {}
+    for text in texts:
+        if text not in vectors:
+            cached = await embedding_cache.get(EMBEDDING_MODEL, text)
+            if cached is not None:
+                vectors[text] = cached
+    missing = [t for t in dict.fromkeys(texts) if t not in vectors]
+    if missing:
+        for text, vector in zip(missing, await _compute_embeddings(missing, auth_header)):
+            vectors[text] = vector
+            await embedding_cache.put(EMBEDDING_MODEL, text, vector)
+    return [vectors[text] for text in texts]
+
+
+def _dense_query_vector(vector: list[float]) -> Any:
+    """Dense query vector, named when the hybrid collection uses a named dense vector."""
+    if RAG_HYBRID_ENABLED and DENSE_VECTOR_NAME:
+        return {"name": DENSE_VECTOR_NAME, "vector": vector}
+    return vector
+
+
+def _search_body(
+    vector: Any,
     limit: int,
-    threshold: Optional[float],
-    namespace: Optional[str],
+    threshold: float | None,
+    namespace: str | None,
+    with_vectors: Any = False,
+    with_payload: Any = True,
 ) -> dict[str, Any]:
     body: dict[str, Any] = {
         "vector": vector,
         "limit": limit,
-        "with_payload": True,
-        "with_vectors": False,
+        "with_payload": with_payload,
+        "with_vectors": with_vectors,
     }
     if threshold is not None and threshold > 0:
         body["score_threshold"] = threshold
     if namespace:
         body["filter"] = {"must": [{"key": "namespace", "match": {"value": namespace}}]}
+    return body
 
-    url = f"{QDRANT_URL}/collections/{QDRANT_COLLECTION}/points/search"
+
+async def _qdrant_post(path: str, body: dict[str, Any]) -> dict[str, Any]:
+    url = f"{QDRANT_URL}/collections/{QDRANT_COLLECTION}/{path}"
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            r = await client.post(url, json=body)
+        client = http_clients.get(QDRANT)
+        r = await get_breaker(QDRANT).call(
+            lambda: client.post(url, json=body, timeout=15.0)
+        )
+    except CircuitOpenError as e:
+        raise circuit_open_http_error(e) from e
     except httpx.RequestError as e:
         raise HTTPException(503, f"Could not connect to Qdrant: {e}")
     if r.status_code != 200:
@@ -97,39 +254,440 @@ async def _qdrant_search(
     return r.json()
 
 
-async def _search_qdrant(vector: list[float], limit: int) -> dict[str, Any]:
-    """Simplified search wrapper for basic RAG search."""
-    return await _qdrant_search(
-        vector=vector,
-        limit=limit,
-        threshold=None,
-        namespace=None
+async def _qdrant_search_batch(searches: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Run several search bodies in one Qdrant round-trip; one search-shaped result each."""
+    data = await _qdrant_post("points/search/batch", {"searches": searches})
+    results = data.get("result") or []
+    if len(results) != len(searches):
+        raise HTTPException(502, "Qdrant batch search returned an unexpected number of results")
+    status = data.get("status", "ok")
+    return [{"status": status, "result": result} for result in results]
+
+
+def _validate_search(search: RagSearchRequest, label: str = "Search") -> None:
+    if not search.vector and not (search.query and search.query.strip()):
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "error": f"{label}: provide a non-empty query or vector",
+                "type": "validation_error",
+            },
+        )
+    if search.fields is not None and search.exclude_fields is not None:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "error": f"{label}: use either fields or exclude_fields, not both",
+                "type": "validation_error",
+            },
+        )
+    if search.mode == "hybrid" and not RAG_HYBRID_ENABLED:
+        raise HTTPException(400, "Hybrid search is not enabled (set RAG_HYBRID_ENABLED)")
+
+
+def _cache_key(search: RagSearchRequest) -> str:
+    # A vector keys the dense leg only; the query text still scores the sparse BM25
+    # leg and both re-rankers (lexical overlap, cross-encoder)
+    scores_text = search.mode == "hybrid" or search.rerank
+    return search_cache.key(
+        EMBEDDING_MODEL,
+        search.query,
+        search.vector,
+        search.limit,
+        search.score_threshold,
+        search.namespace,
+        mode=search.mode,
+        rerank=search.rerank,
+        # Re-ranking and MMR both pick from the widened candidate set
+        candidates=_fetch_limit(search) if _refines(search) else None,
+        mmr=_mmr_lambda(search) if search.mmr else None,
+        payload=_payload_projection(search),
+        text=normalize_query(search.query or "") if scores_text else None,
     )
 
 
+def _mmr_lambda(search: RagSearchRequest) -> float:
+    return RAG_MMR_LAMBDA if search.mmr_lambda is None else search.mmr_lambda
+
+
+def _refines(search: RagSearchRequest) -> bool:
+    """Whether hits are post-processed (re-ranked and/or diversified) before the final cut."""
+    return search.rerank or search.mmr
+
+
+def _fetch_limit(search: RagSearchRequest) -> int:
+    """Hits to retrieve before the final cut: `limit`, or the candidate count when refining."""
+    if not _refines(search):
+        return search.limit
+    return min(100, max(search.limit, search.rerank_candidates or RAG_RERANK_CANDIDATES))
+
+
+def _local_rerank(search: RagSearchRequest) -> bool:
+    # The cross-encoder needs query text; vector-only searches are re-ranked locally
+    return search.rerank and not (RAG_RERANK_MODEL and search.query)
+
+
+def _with_vectors(search: RagSearchRequest) -> Any:
+    """`with_vectors` for the search bodies: only the local re-ranker and MMR need stored vectors."""
+    if not (_local_rerank(search) or search.mmr):
+        return False
+    if RAG_HYBRID_ENABLED and DENSE_VECTOR_NAME:
+        return [DENSE_VECTOR_NAME]
+    return True
+
+
+def _payload_projection(
+    search: RagSearchRequest | RagScrollRequest,
+) -> tuple[list[str] | None, list[str]]:
+    """(include, exclude) payload keys for the response; include None = all but `exclude`."""
+    if search.fields is not None:
+        return sorted(set(search.fields)), []
+    if search.exclude_fields is not None:
+        return None, sorted(set(search.exclude_fields))
+    return None, sorted(set(RAG_SEARCH_EXCLUDE_FIELDS))
+
+
+def _with_payload(
+    search: RagSearchRequest | RagScrollRequest, keep: tuple[str, ...] = ()
+) -> Any:
+    """Qdrant `with_payload` selector for the projection, plus the `keep` keys."""
+    include, exclude = _payload_projection(search)
+    if include is not None:
+        include += [f for f in keep if f not in include]
+        return {"include": include} if include else False
+    exclude = [f for f in exclude if f not in keep]
+    return {"exclude": exclude} if exclude else True
+
+
+def _project_payload(search: RagSearchRequest, hit: dict[str, Any]) -> dict[str, Any]:
+    """Apply the response projection to a hit whose payload carried extra scoring fields."""
+    if "payload" not in hit:
+        return hit
+    include, exclude = _payload_projection(search)
+    payload = hit["payload"] or {}
+    if include is not None:
+        payload = {k: v for k, v in payload.items() if k in include}
+    else:
+        payload = {k: v for k, v in payload.items() if k not in exclude}
+    return {**hit, "payload": payload}
+
+
+def _search_bodies(search: RagSearchRequest, vector: list[float]) -> list[dict[str, Any]]:
+    """Qdrant search bodies for one request: the dense leg, plus a sparse leg in hybrid mode."""
+    fetch = _fetch_limit(search)
+    with_vectors = _with_vectors(search)
+    # Keep the text the re-rankers read; _refine projects it away afterwards
+    with_payload = _with_payload(search, RAG_RERANK_TEXT_FIELDS if search.rerank else ())
+    if search.mode != "hybrid":
+        return [
+            _search_body(
+                _dense_query_vector(vector),
+                fetch,
+                search.score_threshold,
+                search.namespace,
+                with_vectors,
+                with_payload,
+            )
+        ]
+    # Refining already widens the candidate set; otherwise over-fetch each leg for fusion
+    candidates = fetch if _refines(search) else min(100, fetch * RAG_HYBRID_PREFETCH_FACTOR)
+    bodies = [
+        _search_body(
+            _dense_query_vector(vector),
+            candidates,
+            search.score_threshold,
+            search.namespace,
+            with_vectors,
+            with_payload,
+        )
+    ]
+    sparse = query_sparse_vector(search.query or "")
+    if sparse["indices"]:
+        # Sparse scores are on a different scale, so score_threshold applies to the dense leg only
+        bodies.append(
+            _search_body(
+                {"name": SPARSE_VECTOR_NAME, "vector": sparse},
+                candidates,
+                None,
+                search.namespace,
+                with_vectors,
+                with_payload,
+            )
+        )
+    return bodies
+
+
+def _combine_legs(search: RagSearchRequest, legs: list[dict[str, Any]]) -> dict[str, Any]:
+    """Single search result from its leg results (RRF-fused when hybrid)."""
+    if search.mode != "hybrid":
+        return legs[0]
+    return {
+        "status": legs[0].get("status", "ok"),
+        "result": rrf_fuse([leg.get("result") or [] for leg in legs], _fetch_limit(search)),
+    }
+
+
+async def _rerank_upstream(
+    query: str, hits: list[dict[str, Any]], limit: int, auth_header: str | None
+) -> list[dict[str, Any]]:
+    """Re-rank `hits` with RAG_RERANK_MODEL through the gateway's /v1/rerank endpoint."""
+    payload = {
+        "model": RAG_RERANK_MODEL,
+        "query": query,
+        "documents": [hit_text(hit) for hit in hits],
+        "top_n": limit,
+    }
+    headers = {"Authorization": auth_header or "", "Content-Type": "application/json"}
+    try:
+        client = http_clients.get(RERANK)
+        r = await get_breaker(RERANK).call(
+            lambda: client.post(
+                f"{GATEWAY_BASE}/v1/rerank", headers=headers, json=payload, timeout=10.0
+            )
+        )
+    except CircuitOpenError as e:
+        raise circuit_open_http_error(e) from e
+    except httpx.RequestError as e:
+        raise HTTPException(502, f"Could not connect to rerank service: {e}") from e
+    if r.status_code != 200:
+        raise HTTPException(r.status_code, f"Rerank error: {r.text}")
+    try:
+        rows = r.json()["results"]
+        return [rescored(hits[row["index"]], row["relevance_score"]) for row in rows[:limit]]
+    except Exception as e:
+        raise HTTPException(500, "Unexpected rerank response format.") from e
+
+
+async def _rerank(
+    search: RagSearchRequest,
+    vector: list[float],
+    hits: list[dict[str, Any]],
+    auth_header: str | None,
+) -> list[dict[str, Any]]:
+    """Order candidates by re-rank score; all of them are kept when MMR picks afterwards."""
+    keep = len(hits) if search.mmr else search.limit
+    if _local_rerank(search) or not search.query:
+        return rerank_local(vector, search.query, hits, keep)
+    try:
+        return await _rerank_upstream(search.query, hits, keep, auth_header)
+    except HTTPException as e:
+        # Re-ranking only refines the order; degrade to retrieval order rather than fail
+        logger.warning(f"Rerank failed, keeping retrieval order: {e.detail}")
+        return hits[:keep]
+
+
+async def _refine(
+    search: RagSearchRequest,
+    vector: list[float],
+    result: dict[str, Any],
+    auth_header: str | None,
+) -> dict[str, Any]:
+    """Cut a widened candidate list down to `search.limit` (re-rank, then MMR)."""
+    hits = result.get("result") or []
+    if search.rerank:
+        hits = await _rerank(search, vector, hits, auth_header)
+    if search.mmr:
+        hits = mmr_select(hits, search.limit, _mmr_lambda(search))
+    hits = [without_vector(hit) for hit in hits[: search.limit]]
+    if search.rerank:
+        # Drop text fields fetched only for re-ranking
+        hits = [_project_payload(search, hit) for hit in hits]
+    return {**result, "result": hits}
+
+
+async def _run_search(
+    search: RagSearchRequest, vector: list[float], auth_header: str | None
+) -> dict[str, Any]:
+    """One search: its Qdrant leg(s), fusion, then re-ranking / MMR when requested."""
+    bodies = _search_bodies(search, vector)
+    if len(bodies) == 1:
+        legs = [await _qdrant_post("points/search", bodies[0])]
+    else:
+        legs = await _qdrant_search_batch(bodies)
+    result = _combine_legs(search, legs)
+    if _refines(search):
+        result = await _refine(search, vector, result, auth_header)
+    return result
+
+
+def _wants_ndjson(request: Request) -> bool:
+    return "application/x-ndjson" in request.headers.get("accept", "")
+
+
+def _ndjson_line(item: dict[str, Any]) -> bytes:
+    return json.dumps(item, separators=(",", ":")).encode() + b"\n"
+
+
+async def _ndjson_lines(hits: list[dict[str, Any]]) -> AsyncIterator[bytes]:
+    # Async so Starlette iterates on the event loop rather than one threadpool hop per hit.
+    # Search hits are in memory already: fusion, re-ranking and MMR need the whole list.
+    for hit in hits:
+        yield _ndjson_line(hit)
+
+
+def _search_response(request: Request, result: dict[str, Any]) -> Any:
+    """The search result as JSON, or as one hit per line when the client accepts NDJSON."""
+    if _wants_ndjson(request):
+        return StreamingResponse(
+            _ndjson_lines(result.get("result") or []), media_type="application/x-ndjson"
+        )
+    return result
+
+
+def _scroll_body(req: RagScrollRequest, offset: int | str | None, sent: int) -> dict[str, Any]:
+    limit = req.limit if req.max_points is None else min(req.limit, req.max_points - sent)
+    body: dict[str, Any] = {
+        "limit": limit,
+        "with_payload": _with_payload(req),
+        "with_vector": False,
+    }
+    if offset is not None:
+        body["offset"] = offset
+    if req.namespace:
+        body["filter"] = {"must": [{"key": "namespace", "match": {"value": req.namespace}}]}
+    return body
+
+
+async def _scroll_lines(req: RagScrollRequest, page: dict[str, Any]) -> AsyncIterator[bytes]:
+    """Stream points page by page, fetching the next Qdrant page once the current one is sent."""
+    sent = 0
+    while True:
+        points = page.get("points") or []
+        for point in points:
+            yield _ndjson_line(point)
+        sent += len(points)
+        offset = page.get("next_page_offset")
+        if offset is None or not points or (req.max_points is not None and sent >= req.max_points):
+            return
+        try:
+            data = await _qdrant_post("points/scroll", _scroll_body(req, offset, sent))
+        except HTTPException as e:
+            # The 200 is already sent; a last line tells the client the stream is cut short
+            logger.error(f"RAG scroll stopped after {sent} points: {e.detail}")
+            yield _ndjson_line({"error": f"Scroll stopped after {sent} points: {e.detail}"})
+            return
+        page = data.get("result") or {}
+
+
 # ---- Route -----------------------------------------------------------------
 
 
 @router.post("/v1/rag/search", summary="Search RAG documents")
 async def search_rag(
-    auth: Annotated[str, Depends(security_helpers.get_embedding_auth)],
-    query: str = Body(..., description="Search query text"),
-    limit: int = Body(5, description="Number of results to return", ge=1, le=100)
+    req: RagSearchRequest,
+    request: Request,
+    auth: Annotated[str, Depends(security_helpers.require_gateway_auth)],
 ):
-    if not query or not query.strip():
-        raise HTTPException(
-            status_code=422, 
-            detail={"error": "Query cannot be empty", "type": "validation_error"}
-        )
-    
+    """Search; send `Accept: application/x-ndjson` to receive one hit per line."""
+    _validate_search(req)
+
+    # `auth` is already checked (require_gateway_auth), so cache hits need no upstream call.
+    # Read the generation before searching so a concurrent write leaves this entry stale
+    cache_key = _cache_key(req)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return _search_response(request, cached)
+    generation = search_cache.generation(req.namespace)
+
+    # Callers with a precomputed vector skip the embedding round-trip entirely; nothing
+    # upstream sees their key then, which is why the route checks it itself
+    # (`_validate_search` guarantees a non-empty query when there is no vector)
+    search_vector = req.vector or await _embed_query(req.query or "", auth)
+
     try:
-        search_vector = await _compute_embedding(query, auth)
+        response = await _run_search(req, search_vector, auth)
+        search_cache.put(cache_key, req.namespace, generation, response)
+        return _search_response(request, response)
     except HTTPException:
-        raise  # Re-raise embedding computation errors as-is
-    
-    try:
-        response = await _search_qdrant(search_vector, limit)
-        return response
+        raise  # Keep upstream status codes (e.g. 503 while Qdrant's circuit is open)
     except Exception as e:
         logger.error(f"RAG search failed: {e}")
         raise HTTPException(500, f"Search failed: {e}")
+
+
+@router.post("/v1/rag/scroll", summary="Scroll RAG documents")
+async def scroll_rag(
+    req: RagScrollRequest,
+    request: Request,
+    auth: Annotated[str, Depends(security_helpers.require_gateway_auth)],
+) -> Any:
+    """
+    One page of points (Qdrant's scroll result), or with `Accept: application/x-ndjson`
+    every point from `offset` on, one per line, streamed as Qdrant returns its pages.
+    """
+    if req.fields is not None and req.exclude_fields is not None:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "error": "Scroll: use either fields or exclude_fields, not both",
+                "type": "validation_error",
+            },
+        )
+    # The first page is fetched up front so upstream errors still get their status code
+    data = await _qdrant_post("points/scroll", _scroll_body(req, req.offset, 0))
+    if _wants_ndjson(request):
+        return StreamingResponse(
+            _scroll_lines(req, data.get("result") or {}), media_type="application/x-ndjson"
+        )
+    return data
+
+
+@router.post("/v1/rag/search_batch", summary="Search RAG documents (batch)")
+async def search_rag_batch(
+    req: RagSearchBatchRequest,
+    auth: Annotated[str, Depends(security_helpers.require_gateway_auth)],
+) -> dict[str, Any]:
+    for i, search in enumerate(req.searches):
+        _validate_search(search, f"Search {i}")
+
+    # Same cache keys as /v1/rag/search, so single and batch lookups share hits;
+    # like there, `auth` was checked before any lookup
+    results: list[dict[str, Any] | None] = []
+    pending: list[tuple[int, str, Any]] = []  # (index, cache key, generation)
+    for i, search in enumerate(req.searches):
+        key = _cache_key(search)
+        results.append(search_cache.get(key))
+        if results[-1] is None:
+            pending.append((i, key, search_cache.generation(search.namespace)))
+
+    if pending:
+        to_embed = [i for i, _, _ in pending if not req.searches[i].vector]
+        embedded = dict(
+            zip(
+                to_embed,
+                await _embed_queries([req.searches[i].query or "" for i in to_embed], auth),
+            )
+        )
+        # Every leg of every pending search goes out in one Qdrant batch request
+        bodies: list[dict[str, Any]] = []
+        spans: list[tuple[int, int]] = []
+        for i, _, _ in pending:
+            search_bodies = _search_bodies(req.searches[i], req.searches[i].vector or embedded[i])
+            spans.append((len(bodies), len(bodies) + len(search_bodies)))
+            bodies.extend(search_bodies)
+        try:
+            legs = await _qdrant_search_batch(bodies)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"RAG batch search failed: {e}")
+            raise HTTPException(500, f"Search failed: {e}") from e
+        combined = [
+            _combine_legs(req.searches[i], legs[start:end])
+            for (i, _, _), (start, end) in zip(pending, spans)
+        ]
+        refined = await asyncio.gather(
+            *(
+                _refine(req.searches[i], req.searches[i].vector or embedded[i], result, auth)
+                for (i, _, _), result in zip(pending, combined)
+                if _refines(req.searches[i])
+            )
+        )
+        refined_iter = iter(refined)
+        for (i, key, generation), result in zip(pending, combined):
+            if _refines(req.searches[i]):
+                result = next(refined_iter)
+            search_cache.put(key, req.searches[i].namespace, generation, result)
+            results[i] = result
+
+    return {"status": "ok", "results": results}
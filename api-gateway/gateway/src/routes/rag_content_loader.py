@@ -8,23 +8,31 @@ Integrates with existing embedding pipeline and vector database operations.
 # NOTE: Do NOT enable postponed annotations here; it breaks OpenAPI with Pydantic v2
 # (i.e., do not use: from __future__ import annotations)
 
+import asyncio
 import json
 import logging
-from typing import Any, Optional
+import sqlite3
+from collections.abc import Awaitable, Callable
+from typing import Any
 
 from fastapi import APIRouter, Body, Depends, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
 from ..models.rag_upsert_models import UpsertResponse
+from ..services import rag_delete_helpers as delsvc
 from ..services import rag_upsert_helpers as upsvc
+from ..services.batch_pipeline import run_pipeline
 from ..services.document_loader import (
     load_markdown,
     load_pdf_bytes,
     validate_chunking_params,
 )
+from ..services.ingest_jobs import INGEST_WORKERS, IngestJob, ingest_jobs
 from ..services.security import require_rag_write
 from ..utils.structured_logging import log_request_response
 
+
 # --- Patchable indirection (default delegates to service) ---
 async def embed_texts(texts, headers):
     return await upsvc.embed_texts(texts, headers)
@@ -35,13 +43,27 @@ async def qdrant_upsert(points):
 def auth_headers(auth_override=None):
     return upsvc.auth_headers(auth_override)
 
-def hash_id(namespace, text):
-    return upsvc.hash_id(namespace, text)
+def hash_id(namespace: str | None, text: str, scope: str | None = None) -> str:
+    return upsvc.hash_id(namespace, text, scope)
+
+async def qdrant_existing_ids(ids: list[str]) -> set[str]:
+    return await upsvc.qdrant_existing_ids(ids)
+
+async def set_payloads(payloads: dict[str, dict[str, Any]]) -> tuple[bool, str]:
+    return await upsvc.qdrant_set_payloads(payloads)
+
+async def delete_by_filter(qfilter: dict[str, Any]) -> tuple[bool, str, int]:
+    return await delsvc.qdrant_delete_by_filter(qfilter)
 # -----------------------------------------------------------------------
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["rag"])
 
+# Payload key naming the document a chunk came from (scope for delete_stale)
+SOURCE_DOC_FIELD = "source_doc"
+
+Progress = Callable[[dict[str, Any]], Awaitable[None]]
+
 
 class MarkdownUpsertRequest(BaseModel):
     text: str = Field(
@@ -50,10 +72,168 @@ class MarkdownUpsertRequest(BaseModel):
     namespace: str = Field(
         ..., min_length=1, max_length=200, description="Document namespace"
     )
-    metadata: Optional[dict[str, Any]] = Field(None, description="Extra metadata")
+    metadata: dict[str, Any] | None = Field(None, description="Extra metadata")
     chunk_chars: int = Field(1500, ge=100, le=8000, description="Chars per chunk")
     overlap: int = Field(200, ge=0, le=2000, description="Overlap chars")
-    batch_size: int = Field(128, ge=1, le=1000, description="Embedding batch size")
+    batch_size: int = Field(128, ge=1, le=1000, description="Chunks per embedding/upsert batch")
+    if_changed: bool = Field(
+        False, description="Only embed chunks not already stored; stored ones get a payload refresh"
+    )
+    source_doc: str | None = Field(
+        None, min_length=1, max_length=500, description="Source document id stored on each chunk"
+    )
+    delete_stale: bool = Field(
+        False, description="Delete this source_doc's chunks that the new version no longer has"
+    )
+    background: bool = Field(
+        False, description="Queue as an ingestion job and return 202 with its id"
+    )
+
+
+async def _store_chunks(
+    docs: list[Any],
+    namespace: str,
+    source_doc: str | None,
+    if_changed: bool,
+    delete_stale: bool,
+    batch_size: int,
+    progress: Progress | None = None,
+    scope_ids: bool = True,
+) -> tuple[int, int, list[dict[str, Any]]]:
+    """
+    Embed and upsert loader chunks in `batch_size` batches.
+
+    Returns (chunks written, chunks failed, details). Batches run through
+    the shared embed -> upsert pipeline, and each batch reports its own
+    outcome. If every batch fails, the first batch's error is raised.
+    With `scope_ids`, content-derived ids are scoped to `source_doc`, so the
+    same text in two documents is two points and one document's cleanup
+    never touches the other's chunks; without it ids are the plain
+    namespace + text hash, as for documents stored before scoping existed.
+    `if_changed` skips embedding chunks whose id is already
+    stored; their payload is still rewritten so timestamps and TTL stay
+    current. `delete_stale` then removes stored chunks of `source_doc` that
+    are not part of this version; the cleanup only runs if every write
+    succeeded. `progress` is awaited with running totals after each batch.
+    """
+    details: list[dict[str, Any]] = []
+    scope = source_doc if scope_ids else None
+    point_ids = [doc.id or hash_id(doc.namespace, doc.text or "", scope) for doc in docs]
+
+    def chunk_payload(i: int) -> dict[str, Any]:
+        doc = docs[i]
+        payload = dict(doc.metadata or {})
+        if doc.namespace:
+            payload["namespace"] = doc.namespace
+        if source_doc:
+            payload[SOURCE_DOC_FIELD] = source_doc
+        return payload
+
+    pending = list(range(len(docs)))
+    unrefreshed = 0  # unchanged chunks whose payload could not be rewritten
+    if if_changed:
+        existing = await qdrant_existing_ids(point_ids)
+        unchanged = [i for i in pending if point_ids[i] in existing]
+        pending = [i for i in pending if point_ids[i] not in existing]
+        details.append({"skipped_unchanged": len(unchanged)})
+        if unchanged:
+            try:
+                ok, message = await set_payloads({point_ids[i]: chunk_payload(i) for i in unchanged})
+            except Exception as e:
+                logger.error(f"Qdrant payload refresh failed: {e}")
+                ok, message = False, str(e)
+            if not ok:
+                unrefreshed = len(unchanged)
+                details.append({"error": f"Payload refresh of unchanged chunks failed: {message[:300]}"})
+
+    headers = auth_headers(None)  # falls back to EMBEDDING_AUTH_HEADER if set
+
+    async def embed_batch(start: int) -> tuple[int, Any]:
+        """(batch start, points), or (batch start, HTTPException) if embedding failed."""
+        batch = pending[start : start + batch_size]
+        texts = [docs[i].text or "" for i in batch]
+        try:
+            # Unchanged chunks reuse cached vectors; only new text reaches the embedder
+            vectors = await upsvc.cached_embed_texts(texts, headers, embed_texts)
+        except HTTPException as e:
+            return start, e
+        except Exception as e:
+            logger.error(f"Embedding generation failed: {e}")
+            return start, HTTPException(502, f"Embedding service error: {str(e)}")
+
+        points = [
+            upsvc.build_point(point_ids[i], vectors[j], chunk_payload(i), docs[i].text)
+            for j, i in enumerate(batch)
+        ]
+        return start, points
+
+    async def upsert_points(points: Any) -> tuple[int, HTTPException | None]:
+        if isinstance(points, HTTPException):
+            return 0, points
+        try:
+            success, message = await qdrant_upsert(points)
+        except Exception as e:
+            logger.error(f"Qdrant upsert failed: {e}")
+            return 0, HTTPException(502, f"Vector database error: {str(e)}")
+        if not success:
+            return 0, HTTPException(502, f"Vector database upsert failed: {message[:300]}")
+        return len(points), None
+
+    starts = range(0, len(pending), batch_size)
+    totals = {
+        "chunks_total": len(pending),
+        "chunks_done": 0,
+        "chunks_failed": 0,
+        "batches_total": len(starts),
+        "batches_done": 0,
+    }
+
+    async def write_batch(prepared: tuple[int, Any]) -> tuple[int, HTTPException | None]:
+        """(chunks written, error) for one batch; running totals go to `progress`."""
+        start, points = prepared
+        count, error = await upsert_points(points)
+        if error is None:
+            totals["chunks_done"] += count
+        else:
+            totals["chunks_failed"] += len(pending[start : start + batch_size])
+        totals["batches_done"] += 1
+        if progress is not None:
+            await progress(dict(totals))
+        return count, error
+
+    outcomes = await run_pipeline(starts, embed_batch, write_batch)
+
+    written, failed = 0, unrefreshed
+    errors: list[HTTPException] = []
+    for start, (count, error) in zip(starts, outcomes):
+        if error is None:
+            written += count
+            details.append({"batch_start": start, "result": f"upserted {count} chunks"})
+        else:
+            failed += len(pending[start : start + batch_size])
+            errors.append(error)
+            details.append({"batch_start": start, "error": str(error.detail)[:300]})
+    if errors and not written:
+        raise errors[0]
+
+    if delete_stale and source_doc:
+        if errors or unrefreshed:
+            details.append({"error": "Stale chunk cleanup skipped: some writes failed"})
+        else:
+            qfilter = {
+                "must": [
+                    {"key": "namespace", "match": {"value": namespace}},
+                    {"key": SOURCE_DOC_FIELD, "match": {"value": source_doc}},
+                ],
+                "must_not": [{"has_id": point_ids}],
+            }
+            ok, message, deleted = await delete_by_filter(qfilter)
+            if ok:
+                details.append({"deleted_stale": deleted})
+            else:
+                details.append({"error": f"Stale chunk cleanup failed: {message[:300]}"})
+
+    return written, failed, details
 
 
 @router.post(
@@ -64,55 +244,15 @@ class MarkdownUpsertRequest(BaseModel):
     description="Process Markdown text into RAG chunks with embedding and vector storage",
 )
 @log_request_response("upsert_markdown")
-async def upsert_markdown(req: MarkdownUpsertRequest = Body(...)) -> UpsertResponse:
+async def upsert_markdown(req: MarkdownUpsertRequest = Body(...)) -> Any:
     validate_chunking_params(req.chunk_chars, req.overlap)
+    if req.delete_stale and not req.source_doc:
+        raise HTTPException(422, "delete_stale requires source_doc")
 
-    try:
-        docs = load_markdown(
-            req.text, req.namespace, req.metadata, req.chunk_chars, req.overlap
-        )
-    except Exception as e:
-        logger.error(f"Markdown processing failed: {e}")
-        raise HTTPException(400, f"Failed to process Markdown: {str(e)}")
-
-    if not docs:
-        raise HTTPException(400, "No valid chunks generated from Markdown")
-
-    texts = [doc.text or "" for doc in docs]
-    headers = auth_headers(None)  # falls back to EMBEDDING_AUTH_HEADER if set
-
-    try:
-        vectors = await embed_texts(texts, headers)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Embedding generation failed: {e}")
-        raise HTTPException(502, f"Embedding service error: {str(e)}")
-
-    points = []
-    for i, doc in enumerate(docs):
-        vector = vectors[i]
-        point_id = doc.id or hash_id(doc.namespace, doc.text or "")
-        payload = dict(doc.metadata or {})
-        if doc.namespace:
-            payload["namespace"] = doc.namespace
-        points.append({"id": point_id, "vector": vector, "payload": payload})
-
-    try:
-        success, message = await qdrant_upsert(points)
-    except Exception as e:
-        logger.error(f"Qdrant upsert failed: {e}")
-        raise HTTPException(502, f"Vector database error: {str(e)}")
-
-    if success:
-        logger.info(f"Successfully upserted {len(points)} Markdown chunks")
-        return UpsertResponse(
-            status="ok",
-            upserted=len(points),
-            failed=0,
-            details=[{"result": f"upserted {len(points)} chunks"}],
-        )
-    raise HTTPException(502, f"Vector database upsert failed: {message[:300]}")
+    params = req.model_dump(exclude={"text", "background"})
+    if req.background:
+        return await _enqueue("markdown", req.text.encode("utf-8"), params)
+    return await _ingest_markdown(req.text, params)
 
 
 @router.post(
@@ -127,11 +267,27 @@ async def upsert_pdf(
     namespace: str = Form(
         ..., min_length=1, max_length=200, description="Document namespace"
     ),
-    metadata_json: Optional[str] = Form(None, description="JSON metadata for chunks"),
+    metadata_json: str | None = Form(None, description="JSON metadata for chunks"),
     chunk_chars: int = Form(1500, ge=100, le=8000, description="Characters per chunk"),
     overlap: int = Form(200, ge=0, le=2000, description="Overlap between chunks"),
+    batch_size: int = Form(128, ge=1, le=1000, description="Chunks per embedding/upsert batch"),
+    if_changed: bool = Form(
+        False, description="Only embed chunks not already stored; stored ones get a payload refresh"
+    ),
+    source_doc: str | None = Form(
+        None,
+        max_length=500,
+        description=(
+            "Source document id (default: the file name). Only an explicit value scopes chunk"
+            " ids, so PDFs stored before it keep matching their existing points"
+        ),
+    ),
+    delete_stale: bool = Form(
+        False, description="Delete this source_doc's chunks that the new version no longer has"
+    ),
+    background: bool = Form(False, description="Queue as an ingestion job and return 202"),
     file: UploadFile = File(..., description="PDF file to process"),
-) -> UpsertResponse:
+) -> Any:
     if not file.content_type or file.content_type != "application/pdf":
         raise HTTPException(400, "File must be a PDF (application/pdf)")
 
@@ -165,8 +321,78 @@ async def upsert_pdf(
         }
     )
 
+    params = {
+        "namespace": namespace,
+        "metadata": metadata,
+        "chunk_chars": chunk_chars,
+        "overlap": overlap,
+        "batch_size": batch_size,
+        "if_changed": if_changed,
+        "source_doc": source_doc or file.filename,
+        # The file-name fallback tags chunks but keeps the unscoped ids of earlier uploads
+        "scope_ids": source_doc is not None,
+        "delete_stale": delete_stale,
+    }
+    if background:
+        return await _enqueue("pdf", pdf_bytes, params)
+    return await _ingest_pdf(pdf_bytes, params)
+
+
+# ---- Ingestion (inline or as a background job) ------------------------------
+
+
+async def _ingest_markdown(
+    text: str, params: dict[str, Any], progress: Progress | None = None
+) -> UpsertResponse:
     try:
-        docs = load_pdf_bytes(pdf_bytes, namespace, metadata, chunk_chars, overlap)
+        # Chunking runs in a thread so large documents don't stall the event loop
+        docs = await asyncio.to_thread(
+            load_markdown,
+            text,
+            params["namespace"],
+            params["metadata"],
+            params["chunk_chars"],
+            params["overlap"],
+        )
+    except Exception as e:
+        logger.error(f"Markdown processing failed: {e}")
+        raise HTTPException(400, f"Failed to process Markdown: {str(e)}")
+
+    if not docs:
+        raise HTTPException(400, "No valid chunks generated from Markdown")
+
+    written, failed, batch_details = await _store_chunks(
+        docs,
+        params["namespace"],
+        params["source_doc"],
+        params["if_changed"],
+        params["delete_stale"],
+        params["batch_size"],
+        progress,
+    )
+    logger.info(f"Successfully upserted {written} Markdown chunks")
+    return UpsertResponse(
+        status="ok" if failed == 0 else "partial",
+        upserted=written,
+        failed=failed,
+        details=[{"result": f"upserted {written} chunks"}, *batch_details],
+    )
+
+
+async def _ingest_pdf(
+    pdf_bytes: bytes, params: dict[str, Any], progress: Progress | None = None
+) -> UpsertResponse:
+    metadata = params["metadata"]
+    try:
+        # PDF text extraction is CPU-bound; keep it off the event loop
+        docs = await asyncio.to_thread(
+            load_pdf_bytes,
+            pdf_bytes,
+            params["namespace"],
+            metadata,
+            params["chunk_chars"],
+            params["overlap"],
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -176,43 +402,65 @@ async def upsert_pdf(
     if not docs:
         raise HTTPException(400, "No readable text found in PDF")
 
-    texts = [doc.text or "" for doc in docs]
-    headers = auth_headers(None)
+    written, failed, batch_details = await _store_chunks(
+        docs,
+        params["namespace"],
+        params["source_doc"],
+        params["if_changed"],
+        params["delete_stale"],
+        params["batch_size"],
+        progress,
+        scope_ids=params.get("scope_ids", False),
+    )
+    page_count = metadata.get("page_count", "unknown")
+    logger.info(f"Successfully upserted {written} PDF chunks from {page_count} pages")
+    return UpsertResponse(
+        status="ok" if failed == 0 else "partial",
+        upserted=written,
+        failed=failed,
+        details=[
+            {"result": f"upserted {written} chunks from {page_count} pages"},
+            *batch_details,
+        ],
+    )
 
+
+async def _enqueue(kind: str, data: bytes, params: dict[str, Any]) -> JSONResponse:
+    if INGEST_WORKERS <= 0:
+        # Nothing in this process would ever run the job
+        raise HTTPException(503, "Background ingestion is disabled (HX_INGEST_WORKERS=0)")
     try:
-        vectors = await embed_texts(texts, headers)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Embedding generation failed: {e}")
-        raise HTTPException(502, f"Embedding service error: {str(e)}")
+        job_id = await ingest_jobs.enqueue(kind, data, params)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Queueing {kind} ingestion job failed: {e}")
+        raise HTTPException(503, "Ingestion job queue unavailable") from e
+    logger.info(f"Queued {kind} ingestion job {job_id} ({len(data)} bytes)")
+    return JSONResponse(
+        status_code=202,
+        content={"status": "queued", "job_id": job_id, "status_url": f"/v1/rag/jobs/{job_id}"},
+    )
 
-    points = []
-    for i, doc in enumerate(docs):
-        vector = vectors[i]
-        point_id = doc.id or hash_id(doc.namespace, doc.text or "")
-        payload = dict(doc.metadata or {})
-        if doc.namespace:
-            payload["namespace"] = doc.namespace
-        points.append({"id": point_id, "vector": vector, "payload": payload})
 
-    try:
-        success, message = await qdrant_upsert(points)
-    except Exception as e:
-        logger.error(f"Qdrant upsert failed: {e}")
-        raise HTTPException(502, f"Vector database error: {str(e)}")
+async def run_ingest_job(job: IngestJob, progress: Progress) -> dict[str, Any]:
+    """Worker entry point: ingest a spooled document; the result is stored on the job."""
+    data = await ingest_jobs.read_spool(job)
+    if job.kind == "markdown":
+        response = await _ingest_markdown(data.decode("utf-8"), job.params, progress)
+    elif job.kind == "pdf":
+        response = await _ingest_pdf(data, job.params, progress)
+    else:
+        raise ValueError(f"Unknown ingestion job kind: {job.kind}")
+    return response.model_dump()
 
-    if success:
-        page_count = metadata.get("page_count", "unknown")
-        logger.info(
-            f"Successfully upserted {len(points)} PDF chunks from {page_count} pages"
-        )
-        return UpsertResponse(
-            status="ok",
-            upserted=len(points),
-            failed=0,
-            details=[
-                {"result": f"upserted {len(points)} chunks from {page_count} pages"}
-            ],
-        )
-    raise HTTPException(502, f"Vector database upsert failed: {message[:300]}")
+
+@router.get(
+    "/v1/rag/jobs/{job_id}",
+    dependencies=[Depends(require_rag_write)],
+    summary="Ingestion Job Status",
+    description="Status, progress and result of a queued Markdown/PDF ingestion job",
+)
+async def get_ingest_job(job_id: str) -> dict[str, Any]:
+    job = await ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown job: {job_id}")
+    return job
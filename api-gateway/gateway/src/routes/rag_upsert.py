@@ -11,10 +11,15 @@ from typing import Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, Request
 
 from ..models.rag_upsert_models import UpsertRequest, UpsertResponse
+from ..services.batch_pipeline import run_pipeline
 from ..services.rag_upsert_helpers import (
     auth_headers,
+    build_point,
+    cached_embed_texts,
     embed_texts,
     hash_id,
+    qdrant_existing_ids,
+    qdrant_set_payloads,
     qdrant_upsert,
 )
 from ..services.security import get_embedding_auth_from_request, require_rag_write
@@ -26,6 +31,33 @@ EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "0"))  # 0 = disabled
 TEXT_PREVIEW_CHARS = int(os.environ.get("TEXT_PREVIEW_CHARS", "200"))
 
 
+def _point_payload(doc: Any, point_id: str) -> dict[str, Any]:
+    payload: dict[str, Any] = doc.metadata.copy() if doc.metadata else {}
+    payload["doc_id"] = point_id  # stable identifier for indexing/cleanup
+    if doc.namespace:
+        payload["namespace"] = doc.namespace
+    if doc.text and TEXT_PREVIEW_CHARS > 0:
+        preview = doc.text[:TEXT_PREVIEW_CHARS]
+        if len(doc.text) > TEXT_PREVIEW_CHARS:
+            preview += "…"
+        payload["text_preview"] = preview
+    return payload
+
+
+class _PreparedBatch:
+    """One batch moving through the embed -> upsert pipeline, with its own outcome."""
+
+    __slots__ = ("details", "failed", "had_candidates", "points", "start", "upserted")
+
+    def __init__(self, start: int) -> None:
+        self.start = start
+        self.points: list[dict[str, Any]] = []
+        self.had_candidates = False
+        self.upserted = 0
+        self.failed = 0
+        self.details: list[dict[str, Any]] = []
+
+
 @router.post(
     "/v1/rag/upsert",
     response_model=UpsertResponse,
@@ -63,6 +95,9 @@ async def rag_upsert(
     - Text (auto-embedded), or
     - Pre-computed vectors (used as-is)
 
+    With `if_changed`, text documents whose content-derived id is already
+    stored are not re-embedded; only their payload is rewritten.
+
     Uses write-scope authentication via `X-HX-Admin-Key`.
     """
     # Build auth for embeddings (caller Authorization or service fallback)
@@ -76,10 +111,32 @@ async def rag_upsert(
     failed = 0
     details: list[dict[str, Any]] = []
 
-    # Process in batches
-    for i in range(0, len(docs), batch_size):
-        chunk = docs[i : i + batch_size]
-        chunk_start_index = i
+    # Content-derived ids already in Qdrant mean unchanged text: one lookup for the request
+    unchanged: set[int] = set()
+    if req.if_changed:
+        content_ids = {
+            i: hash_id(doc.namespace, doc.text)
+            for i, doc in enumerate(docs)
+            if doc.text and not doc.id
+        }
+        existing = await qdrant_existing_ids(list(content_ids.values()))
+        unchanged = {i for i, point_id in content_ids.items() if point_id in existing}
+        if unchanged:
+            details.append({"skipped_unchanged": len(unchanged)})
+            # Not re-embedded, but the payload (metadata, TTL fields) is rewritten
+            try:
+                ok, msg = await qdrant_set_payloads(
+                    {content_ids[i]: _point_payload(docs[i], content_ids[i]) for i in unchanged}
+                )
+            except Exception as e:
+                ok, msg = False, str(e)
+            if not ok:
+                failed += len(unchanged)
+                details.append({"error": f"Payload refresh failed: {msg[:300]}"})
+
+    async def embed_batch(chunk_start_index: int) -> _PreparedBatch:
+        chunk = docs[chunk_start_index : chunk_start_index + batch_size]
+        batch = _PreparedBatch(chunk_start_index)
 
         # Collect for embedding
         texts_to_embed: list[str] = []
@@ -87,18 +144,19 @@ async def rag_upsert(
         final_vectors: list[Optional[list[float]]] = [None] * len(chunk)
 
         # First pass: categorize & validate
-        had_candidates = False
         for idx, doc in enumerate(chunk):
+            if chunk_start_index + idx in unchanged:
+                continue
             if doc.vector is not None:
-                had_candidates = True
+                batch.had_candidates = True
                 final_vectors[idx] = doc.vector
             elif doc.text:
-                had_candidates = True
+                batch.had_candidates = True
                 texts_to_embed.append(doc.text)
                 embed_indices.append(idx)
             else:
-                failed += 1
-                details.append(
+                batch.failed += 1
+                batch.details.append(
                     {
                         "index": chunk_start_index + idx,
                         "error": "Document must provide either 'text' or 'vector'",
@@ -108,13 +166,15 @@ async def rag_upsert(
         # Generate embeddings where needed
         if texts_to_embed:
             try:
-                embedded_vectors = await embed_texts(texts_to_embed, headers)
+                embedded_vectors = await cached_embed_texts(
+                    texts_to_embed, headers, embed_texts
+                )
                 for j, original_idx in enumerate(embed_indices):
                     if j < len(embedded_vectors):
                         final_vectors[original_idx] = embedded_vectors[j]
                     else:
-                        failed += 1
-                        details.append(
+                        batch.failed += 1
+                        batch.details.append(
                             {
                                 "index": chunk_start_index + original_idx,
                                 "error": "Embedding generation failed - missing vector",
@@ -122,8 +182,8 @@ async def rag_upsert(
                         )
             except HTTPException as e:
                 for original_idx in embed_indices:
-                    failed += 1
-                    details.append(
+                    batch.failed += 1
+                    batch.details.append(
                         {
                             "index": chunk_start_index + original_idx,
                             "error": f"Embedding failed: {e.detail}",
@@ -131,52 +191,44 @@ async def rag_upsert(
                     )
 
         # Prepare points
-        points_to_upsert: list[dict[str, Any]] = []
         for idx, doc in enumerate(chunk):
             vector = final_vectors[idx]
             if not vector:
                 continue
 
             point_id = doc.id or hash_id(doc.namespace, doc.text or "")
-            payload: dict[str, Any] = doc.metadata.copy() if doc.metadata else {}
-            payload["doc_id"] = point_id  # stable identifier for indexing/cleanup
-            if doc.namespace:
-                payload["namespace"] = doc.namespace
-            if doc.text and TEXT_PREVIEW_CHARS > 0:
-                preview = doc.text[:TEXT_PREVIEW_CHARS]
-                if len(doc.text) > TEXT_PREVIEW_CHARS:
-                    preview += "…"
-                payload["text_preview"] = preview
-
-            points_to_upsert.append(
-                {"id": point_id, "vector": vector, "payload": payload}
-            )
+            batch.points.append(build_point(point_id, vector, _point_payload(doc, point_id), doc.text))
+        return batch
+
+    async def write_batch(batch: _PreparedBatch) -> _PreparedBatch:
+        chunk_start_index = batch.start
+        points_to_upsert = batch.points
 
         # If nothing to upsert, annotate batch outcome only when we had candidates
         if not points_to_upsert:
-            if had_candidates:
-                details.append(
+            if batch.had_candidates:
+                batch.details.append(
                     {
                         "batch_start": chunk_start_index,
                         "result": "No valid documents in batch",
                     }
                 )
-            continue
+            return batch
 
         # Upsert batch to Qdrant
         try:
             ok, msg = await qdrant_upsert(points_to_upsert)
             if ok:
-                upserted += len(points_to_upsert)
-                details.append(
+                batch.upserted += len(points_to_upsert)
+                batch.details.append(
                     {
                         "batch_start": chunk_start_index,
                         "result": f"Successfully upserted {len(points_to_upsert)} documents",
                     }
                 )
             else:
-                failed += len(points_to_upsert)
-                details.append(
+                batch.failed += len(points_to_upsert)
+                batch.details.append(
                     {
                         "batch_start": chunk_start_index,
                         "error": f"Qdrant upsert failed: {msg[:300]}",
@@ -186,13 +238,20 @@ async def rag_upsert(
             # Let HTTPException bubble up (e.g., dimension validation errors)
             raise
         except Exception as e:
-            failed += len(points_to_upsert)
-            details.append(
+            batch.failed += len(points_to_upsert)
+            batch.details.append(
                 {
                     "batch_start": chunk_start_index,
                     "error": f"Upsert exception: {str(e)[:300]}",
                 }
             )
+        return batch
+
+    # Embedding of batch N+1 overlaps the Qdrant write of batch N; details keep batch order
+    for batch in await run_pipeline(range(0, len(docs), batch_size), embed_batch, write_batch):
+        upserted += batch.upserted
+        failed += batch.failed
+        details.extend(batch.details)
 
     status = "ok" if failed == 0 else ("partial" if upserted > 0 else "error")
     return UpsertResponse(
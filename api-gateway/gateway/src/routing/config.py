@@ -0,0 +1,216 @@
+"""
+Routing Configuration
+
+Loads `model_registry.yaml` and `routing.yaml` from API_GATEWAY_CFG_DIR into an
+immutable RoutingSnapshot and hot-reloads them when their mtimes change.
+Parsing and validation run in a worker thread off the request path; a new
+snapshot is swapped in with a single reference assignment, so every request
+sees one consistent version. Invalid edits keep the last good snapshot.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any
+
+import yaml
+
+from ..metrics import routing_config_reloads, routing_config_version
+from .retry import RetryPolicy
+from .selector import Candidate, ModelSelectionAlgorithm
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILE = "model_registry.yaml"
+ROUTING_FILE = "routing.yaml"
+
+
+class ConfigError(ValueError):
+    """A configuration file exists but cannot be used."""
+
+
+class RoutingSnapshot:
+    """One loaded version of the routing config, with precompiled lookup tables."""
+
+    def __init__(
+        self,
+        version: int,
+        registry: dict[str, Any],
+        routing: dict[str, Any],
+    ) -> None:
+        self.version = version
+        self.registry = registry
+        self.routing = routing
+        self.loaded_at = time.time()
+
+        routing_section = routing.get("routing") or {}
+        self.default_group: str = routing_section.get("default_group", "default")
+        failover = routing_section.get("failover_order") or []
+        self.failover_order: tuple[str, ...] = tuple(str(m) for m in failover)
+        self.algo = ModelSelectionAlgorithm(routing)
+        self.retry_policy = RetryPolicy.from_config(routing)
+
+        # Compiled once per version: group -> candidates, name/id -> candidate,
+        # specialization -> model names. Requests only do dict lookups.
+        groups: dict[str, list[Candidate]] = {}
+        models: dict[str, Candidate] = {}
+        specializations: dict[str, set[str]] = {}
+        for entry in registry.get("models") or []:
+            candidate = self.algo.compile(entry)
+            groups.setdefault(candidate.group, []).append(candidate)
+            for key in (entry.get("name"), entry.get("id")):
+                if key:
+                    models[str(key)] = candidate
+            for spec in candidate.specializations:
+                specializations.setdefault(spec, set()).add(candidate.name)
+        self.groups: Mapping[str, tuple[Candidate, ...]] = MappingProxyType(
+            {group: tuple(members) for group, members in groups.items()}
+        )
+        self.models: Mapping[str, Candidate] = MappingProxyType(models)
+        self.by_specialization: Mapping[str, frozenset[str]] = MappingProxyType(
+            {spec: frozenset(names) for spec, names in specializations.items()}
+        )
+
+
+def _read_yaml(path: str, label: str) -> dict[str, Any]:
+    """Read one YAML mapping; a missing or empty file is an empty config."""
+    try:
+        with open(path) as f:
+            content = f.read()
+    except FileNotFoundError:
+        logger.warning(f"{label} file not found: {path}")
+        return {}
+    except PermissionError as e:
+        raise ConfigError(f"Permission denied reading {label}: {e}") from e
+
+    if not content.strip():
+        logger.warning(f"{label} file {path} is empty")
+        return {}
+    try:
+        data = yaml.safe_load(content)
+    except yaml.YAMLError as e:
+        raise ConfigError(f"YAML parse error in {label}: {e}") from e
+    if not isinstance(data, dict):
+        raise ConfigError(f"{label} must be a dictionary, got {type(data)}")
+    return data
+
+
+def _validate(registry: dict[str, Any], routing: dict[str, Any]) -> None:
+    models = registry.get("models", [])
+    if not isinstance(models, list):
+        raise ConfigError("Model registry 'models' field must be a list")
+    for i, model in enumerate(models):
+        if not isinstance(model, dict) or not (model.get("name") or model.get("id")):
+            raise ConfigError(f"Model registry entry {i} must be a mapping with a 'name'")
+        tier_score = model.get("tier_score", 0.5)
+        if isinstance(tier_score, bool) or not isinstance(tier_score, (int, float)):
+            raise ConfigError(f"Model registry entry {i} 'tier_score' must be a number")
+        context_length = model.get("context_length")
+        if context_length is not None and (
+            isinstance(context_length, bool)
+            or not isinstance(context_length, int)
+            or context_length <= 0
+        ):
+            raise ConfigError(f"Model registry entry {i} 'context_length' must be a positive integer")
+    section = routing.get("routing", {})
+    if not isinstance(section, dict):
+        raise ConfigError("Routing config 'routing' section must be a mapping")
+    if not isinstance(section.get("failover_order", []), list):
+        raise ConfigError("Routing config 'failover_order' must be a list")
+    if not isinstance(section.get("static_weights", {}), dict):
+        raise ConfigError("Routing config 'static_weights' must be a mapping")
+    try:
+        RetryPolicy.from_config(routing)
+    except (TypeError, ValueError) as e:
+        raise ConfigError(f"Routing config 'retries' section is invalid: {e}") from e
+
+
+class RoutingConfig:
+    """
+    Owner of the current RoutingSnapshot for one config directory.
+
+    `snapshot` is read on every request; `reload_if_changed()` stats both
+    files and only re-parses when an mtime (or size) changed. `ensure_watching()`
+    lazily starts a background poller on the running event loop.
+    """
+
+    def __init__(self, cfg_dir: str, interval_s: float | None = None) -> None:
+        self.cfg_dir = cfg_dir
+        self.interval_s = (
+            interval_s
+            if interval_s is not None
+            else float(os.environ.get("HX_ROUTING_RELOAD_INTERVAL_S", "5"))
+        )
+        self._stamp: tuple[Any, ...] | None = None
+        self._version = 0
+        self._task: asyncio.Task[None] | None = None
+        self.snapshot = RoutingSnapshot(0, {}, {})
+        self.reload_if_changed()
+
+    def _paths(self) -> tuple[str, str]:
+        return (
+            os.path.join(self.cfg_dir, REGISTRY_FILE),
+            os.path.join(self.cfg_dir, ROUTING_FILE),
+        )
+
+    def _file_stamp(self) -> tuple[Any, ...]:
+        stamp: list[Any] = []
+        for path in self._paths():
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def reload_if_changed(self) -> bool:
+        """Re-parse and swap in a new snapshot if either file changed; True if swapped."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+
+        registry_path, routing_path = self._paths()
+        try:
+            registry = _read_yaml(registry_path, "Model registry")
+            routing = _read_yaml(routing_path, "Routing config")
+            _validate(registry, routing)
+            # Compiling can still trip over values _validate does not model
+            snapshot = RoutingSnapshot(self._version + 1, registry, routing)
+        except (ConfigError, TypeError, ValueError) as e:
+            logger.error(f"Keeping routing config v{self._version}: {e}")
+            routing_config_reloads.labels(result="error").inc()
+            return False
+
+        self._version += 1
+        self.snapshot = snapshot
+        routing_config_version.set(self._version)
+        routing_config_reloads.labels(result="ok").inc()
+        logger.info(f"Loaded routing config v{self._version} from {self.cfg_dir}")
+        return True
+
+    def ensure_watching(self) -> None:
+        """Start the background mtime poller once an event loop is running."""
+        if self.interval_s <= 0 or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception as e:
+                logger.error(f"Routing config reload failed: {e}")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,48 @@
+"""
+Upstream Retry Policy
+
+Settings for re-dispatching failed upstream calls, read from the `retries`
+section of `routing.yaml`. ExecutionMiddleware retries connect errors,
+timeouts and 5xx replies with full-jitter exponential backoff, moving along
+the `failover_order` chosen by RoutingMiddleware, until `total` retries or
+the per-request `deadline_s` budget is spent.
+"""
+
+import random
+from typing import Any, NamedTuple
+
+# Upstream statuses worth retrying on another attempt / node
+RETRYABLE_STATUS = frozenset({500, 502, 503, 504})
+RETRY_SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# Inference endpoints have no side effects, so their POSTs can be replayed
+RETRY_SAFE_PATHS = ("/v1/chat/completions", "/v1/completions", "/v1/embeddings")
+
+
+class RetryPolicy(NamedTuple):
+    total: int = 0  # retries after the first attempt
+    backoff_base_s: float = 0.25
+    backoff_max_s: float = 2.0
+    deadline_s: float = 60.0  # budget for all attempts and backoff sleeps
+
+    @classmethod
+    def from_config(cls, routing_config: dict[str, Any]) -> "RetryPolicy":
+        """Build from a parsed routing.yaml document; missing keys keep defaults."""
+        retries = routing_config.get("retries") or {}
+        if not isinstance(retries, dict):
+            return cls()
+        defaults = cls()
+        return cls(
+            total=max(0, int(retries.get("total", defaults.total))),
+            backoff_base_s=float(retries.get("backoff_base_s", defaults.backoff_base_s)),
+            backoff_max_s=float(retries.get("backoff_max_s", defaults.backoff_max_s)),
+            deadline_s=float(retries.get("deadline_s", defaults.deadline_s)),
+        )
+
+    def backoff(self, retry: int) -> float:
+        """Full-jitter delay before retry number `retry` (0-based)."""
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2**retry))
+
+
+def is_retry_safe(method: str, path: str) -> bool:
+    """True when replaying the request upstream cannot cause duplicate side effects."""
+    return method.upper() in RETRY_SAFE_METHODS or path.startswith(RETRY_SAFE_PATHS)
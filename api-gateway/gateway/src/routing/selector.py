@@ -1,37 +1,237 @@
 """
 Model Selection Algorithm
 
-Placeholder implementation for routing middleware compatibility.
+Scores routing candidates from `model_registry.yaml` per request, using the
+strategy settings in `routing.yaml` (`static_weights`, `failover_order`,
+`features.load_source`) plus live load tracked by the gateway itself.
+Candidates whose `context_length` cannot hold the estimated request are
+never selected.
+
+Registry entries are compiled once per config load into immutable Candidate
+tuples with their static score pre-extracted, so per-request work is an O(1)
+group lookup plus scoring a handful of candidates.
 """
 
+import time
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any, NamedTuple
+
+from .tokens import PromptSize
+
+# Relative weight of each quality signal in a candidate's base score
+TIER_WEIGHT = 0.5
+STATIC_WEIGHT = 0.3
+SPECIALIZATION_WEIGHT = 0.2
+# Above this share of a model's context window, prefer models with more headroom
+HEADROOM_THRESHOLD = 0.5
+
+
+class LoadTracker:
+    """
+    In-process view of upstream load: in-flight requests and a latency EWMA per model.
+
+    ExecutionMiddleware calls `start()` before dispatching to a model and
+    `finish()` once the response (or stream) is complete.
+    """
+
+    def __init__(self, alpha: float = 0.3) -> None:
+        self.alpha = alpha
+        self._in_flight: dict[str, int] = {}
+        self._latency_ewma: dict[str, float] = {}
+
+    def start(self, model: str) -> float:
+        """Mark a request as in flight; returns the start timestamp for `finish()`."""
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        return time.monotonic()
+
+    def finish(self, model: str, started_at: float) -> None:
+        elapsed = time.monotonic() - started_at
+        self._in_flight[model] = max(0, self._in_flight.get(model, 0) - 1)
+        previous = self._latency_ewma.get(model)
+        self._latency_ewma[model] = (
+            elapsed
+            if previous is None
+            else self.alpha * elapsed + (1 - self.alpha) * previous
+        )
+
+    def in_flight(self, model: str) -> int:
+        return self._in_flight.get(model, 0)
+
+    def latency_ewma(self, model: str) -> float | None:
+        return self._latency_ewma.get(model)
+
+
+# Shared by RoutingMiddleware (reads) and ExecutionMiddleware (records)
+load_tracker = LoadTracker()
+
+
+class Candidate(NamedTuple):
+    """A registry model compiled for scoring; built once per config load."""
+
+    name: str
+    group: str
+    context_length: int  # 0 = unknown, never filtered
+    specializations: frozenset[str]
+    # TIER_WEIGHT * tier_score + STATIC_WEIGHT * static_weight
+    static_score: float
+    failover_rank: int
+    entry: Mapping[str, Any]
+
 
 class ModelSelectionAlgorithm:
     """
-    Simple model selection algorithm for routing requests.
-    This is a placeholder implementation to satisfy the middleware import.
+    Picks the best-scoring candidate for a request.
+
+    Base score blends registry `tier_score`, `static_weights` from routing.yaml
+    and a bonus when the request's domain (X-HX-Domain) is one of the model's
+    `specializations`, and is reduced once the request fills more than half
+    of the model's `context_length`. With `features.load_source: gateway` it is
+    discounted by the model's in-flight count and latency EWMA relative to
+    the other candidates. Ties fall back to `failover_order`.
     """
 
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        routing_config: dict[str, Any] | None = None,
+        tracker: LoadTracker | None = None,
+    ) -> None:
+        self._tracker = tracker or load_tracker
+        self._static_weights: dict[str, float] = {}
+        self._failover_order: list[str] = []
+        self._load_source = "none"
+        if routing_config:
+            self.configure(routing_config)
+
+    def configure(self, routing_config: dict[str, Any]) -> None:
+        """Apply a parsed routing.yaml document (missing sections keep defaults)."""
+        routing = routing_config.get("routing") or {}
+        features = routing_config.get("features") or {}
+        weights = routing.get("static_weights") or {}
+        failover = routing.get("failover_order") or []
+        self._static_weights = {
+            str(k): float(v) for k, v in weights.items() if isinstance(v, (int, float))
+        }
+        self._failover_order = [str(m) for m in failover] if isinstance(failover, list) else []
+        self._load_source = str(features.get("load_source") or "none")
+
+    def compile(self, entry: Mapping[str, Any]) -> Candidate:
+        """Pre-extract everything scoring needs from one registry entry."""
+        name = str(entry.get("name") or entry.get("id") or "")
+        context_length = entry.get("context_length")
+        specializations = entry.get("specializations") or []
+        return Candidate(
+            name=name,
+            group=str(entry.get("group")),
+            context_length=context_length if isinstance(context_length, int) and context_length > 0 else 0,
+            specializations=frozenset(str(s) for s in specializations),
+            static_score=TIER_WEIGHT * float(entry.get("tier_score", 0.5))
+            + STATIC_WEIGHT * self._static_weights.get(name, 0.0),
+            failover_rank=(
+                self._failover_order.index(name)
+                if name in self._failover_order
+                else len(self._failover_order)
+            ),
+            entry=entry,
+        )
+
+    def compile_all(self, entries: Iterable[Mapping[str, Any]]) -> tuple[Candidate, ...]:
+        return tuple(self.compile(entry) for entry in entries)
+
+    @staticmethod
+    def _context_usage(
+        candidate: Candidate, req_ctx: dict[str, Any], with_completion: bool = True
+    ) -> float:
+        """Share of the candidate's context window the request needs (0 if unknown)."""
+        size = req_ctx.get("prompt_size")
+        if not isinstance(size, PromptSize) or not candidate.context_length:
+            return 0.0
+        count = size.total_tokens if with_completion else size.prompt_tokens
+        return count(candidate.name) / candidate.context_length
+
+    def fits(self, candidate: Candidate, req_ctx: dict[str, Any]) -> bool:
+        """False when the estimated prompt exceeds the candidate's context_length.
+
+        max_tokens is left out: upstreams cap generation to the remaining window,
+        so a large completion budget only lowers the headroom score.
+        """
+        return self._context_usage(candidate, req_ctx, with_completion=False) <= 1.0
+
+    def _base_score(self, candidate: Candidate, req_ctx: dict[str, Any]) -> float:
+        # "specialists" is the precompiled specialization -> models set for the
+        # request's domain; fall back to the candidate's own set when absent.
+        specialists = req_ctx.get("specialists")
+        if specialists is not None:
+            specialized = candidate.name in specialists
+        else:
+            specialized = req_ctx.get("domain") in candidate.specializations
+        base = candidate.static_score + (SPECIALIZATION_WEIGHT if specialized else 0.0)
+        usage = self._context_usage(candidate, req_ctx)
+        if usage > HEADROOM_THRESHOLD:
+            # Linear falloff from full score at the threshold to zero at a full window
+            base *= max(0.0, (1.0 - usage) / (1.0 - HEADROOM_THRESHOLD))
+        return base
+
+    def score(
+        self,
+        candidate: Candidate,
+        req_ctx: dict[str, Any],
+        reference_latency: float | None = None,
+    ) -> float:
+        """Score one candidate; higher is better."""
+        base = self._base_score(candidate, req_ctx)
+        if self._load_source != "gateway":
+            return base
+
+        load_factor = 1.0 / (1.0 + self._tracker.in_flight(candidate.name))
+        latency = self._tracker.latency_ewma(candidate.name)
+        if latency is None or not reference_latency:
+            # Unmeasured models are scored optimistically so they get traffic
+            latency_factor = 1.0
+        else:
+            latency_factor = reference_latency / (reference_latency + latency)
+        return base * load_factor * latency_factor
+
+    def select(
+        self, candidates: Sequence[Candidate], req_ctx: dict[str, Any]
+    ) -> Candidate | None:
+        """Return the highest-scoring candidate that fits the request, or None."""
+        fitting = [c for c in candidates if self.fits(c, req_ctx)]
+        if not fitting:
+            return None
+
+        latencies = [
+            lat
+            for lat in (self._tracker.latency_ewma(c.name) for c in fitting)
+            if lat is not None
+        ]
+        reference = min(latencies) if latencies else None
+
+        return min(
+            fitting,
+            key=lambda c: (-self.score(c, req_ctx, reference), c.failover_rank),
+        )
 
-    def select_model(self, request_data: dict) -> str:
+    def select_model(self, request_data: dict[str, Any]) -> str:
         """
-        Select the appropriate model for the request.
+        Select a model name for the request (legacy single-argument API).
 
         Args:
-            request_data: The request data to analyze
+            request_data: Request context with optional `candidates` registry entries
 
         Returns:
-            str: The selected model identifier
+            str: The selected model identifier, or "default" if none qualify
         """
-        # Default implementation - return a default model
-        return "default"
+        candidates = self.compile_all(request_data.get("candidates") or [])
+        selected = self.select(candidates, request_data)
+        return selected.name if selected else "default"
 
-    def get_available_models(self) -> list:
+    def get_available_models(self) -> list[str]:
         """
-        Get list of available models.
+        Get list of models known from routing configuration.
 
         Returns:
-            list: List of available model identifiers
+            list: Model identifiers in failover order, then any weighted extras
         """
-        return ["default"]
+        models = list(self._failover_order)
+        models.extend(m for m in self._static_weights if m not in models)
+        return models or ["default"]
@@ -0,0 +1,109 @@
+"""
+Token Estimation
+
+Fast, dependency-free prompt size estimates for routing decisions. Character
+counts are gathered once from the already-parsed chat payload and converted
+to tokens per model family on demand (memoized), so checking a request
+against every candidate's `context_length` costs a dict lookup each.
+"""
+
+from functools import lru_cache
+from typing import Any
+
+# Average characters per token for ASCII-heavy text, by model family.
+# Conservative (slightly low) ratios so estimates err towards more tokens.
+CHARS_PER_TOKEN: dict[str, float] = {
+    "llama": 3.8,
+    "phi": 3.6,
+    "gemma": 4.0,
+    "qwen": 3.7,
+    "mistral": 3.6,
+    "default": 3.6,
+}
+
+# Chat templates add role markers and separators around every message
+TOKENS_PER_MESSAGE = 4
+# Non-ASCII text (CJK, emoji, ...) tokenizes at roughly one token per character
+TOKENS_PER_NON_ASCII_CHAR = 1.0
+
+
+@lru_cache(maxsize=256)
+def model_family(model: str | None) -> str:
+    """Map a model name such as `llm02-gemma2-2b` to a CHARS_PER_TOKEN family."""
+    if not model:
+        return "default"
+    name = model.lower()
+    for family in CHARS_PER_TOKEN:
+        if family != "default" and family in name:
+            return family
+    return "default"
+
+
+def _text_parts(content: Any) -> list[str]:
+    """Extract text from OpenAI-style content (plain string or list of parts)."""
+    if isinstance(content, str):
+        return [content]
+    if isinstance(content, list):
+        return [
+            part["text"]
+            for part in content
+            if isinstance(part, dict) and isinstance(part.get("text"), str)
+        ]
+    return []
+
+
+class PromptSize:
+    """Size of a chat request, convertible to per-family token estimates."""
+
+    __slots__ = ("_by_family", "ascii_chars", "completion_tokens", "messages", "other_chars")
+
+    def __init__(
+        self,
+        ascii_chars: int = 0,
+        other_chars: int = 0,
+        messages: int = 0,
+        completion_tokens: int = 0,
+    ) -> None:
+        self.ascii_chars = ascii_chars
+        self.other_chars = other_chars
+        self.messages = messages
+        self.completion_tokens = completion_tokens
+        self._by_family: dict[str, int] = {}
+
+    @classmethod
+    def from_payload(cls, payload: dict[str, Any]) -> "PromptSize":
+        """Measure a parsed /v1/chat/completions body in a single pass."""
+        ascii_chars = other_chars = 0
+        messages = payload.get("messages")
+        if not isinstance(messages, list):
+            messages = []
+        for message in messages:
+            if not isinstance(message, dict):
+                continue
+            for text in _text_parts(message.get("content")):
+                non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+                ascii_chars += len(text) - non_ascii
+                other_chars += non_ascii
+
+        completion = payload.get("max_completion_tokens") or payload.get("max_tokens")
+        completion_tokens = completion if isinstance(completion, int) and completion > 0 else 0
+        return cls(ascii_chars, other_chars, len(messages), completion_tokens)
+
+    def prompt_tokens(self, model: str | None = None) -> int:
+        family = model_family(model)
+        tokens = self._by_family.get(family)
+        if tokens is None:
+            tokens = int(
+                self.ascii_chars / CHARS_PER_TOKEN[family]
+                + self.other_chars * TOKENS_PER_NON_ASCII_CHAR
+                + self.messages * TOKENS_PER_MESSAGE
+            )
+            self._by_family[family] = tokens
+        return tokens
+
+    def total_tokens(self, model: str | None = None) -> int:
+        """Prompt estimate plus the requested completion budget (max_tokens).
+
+        Used for headroom scoring only; the hard context check uses prompt_tokens().
+        """
+        return self.prompt_tokens(model) + self.completion_tokens
@@ -0,0 +1,69 @@
+"""
+Two-stage batch pipeline for ingestion.
+
+Upserts used to run each batch's stages back to back: embed batch N, write
+it to Qdrant, then embed batch N+1, leaving the embedding node and Qdrant
+idle in turn. `run_pipeline` overlaps the stages across batches. While batch
+N is written, batch N+1 is embedded. Each stage has its own concurrency cap,
+and a bound on batches in flight provides backpressure: a new batch starts
+only when an earlier one has finished. Results come back in batch order.
+"""
+
+import asyncio
+import os
+from collections.abc import Awaitable, Callable, Sequence
+from typing import TypeVar
+
+T = TypeVar("T")
+P = TypeVar("P")
+R = TypeVar("R")
+
+UPSERT_EMBED_CONCURRENCY = int(os.getenv("RAG_UPSERT_EMBED_CONCURRENCY", "2"))
+UPSERT_QDRANT_CONCURRENCY = int(os.getenv("RAG_UPSERT_QDRANT_CONCURRENCY", "2"))
+# Batches embedded or waiting/being written at once (bounds buffered vectors)
+UPSERT_MAX_IN_FLIGHT = int(os.getenv("RAG_UPSERT_MAX_IN_FLIGHT", "4"))
+
+
+async def run_pipeline(
+    batches: Sequence[T],
+    first: Callable[[T], Awaitable[P]],
+    second: Callable[[P], Awaitable[R]],
+    first_concurrency: int = UPSERT_EMBED_CONCURRENCY,
+    second_concurrency: int = UPSERT_QDRANT_CONCURRENCY,
+    max_in_flight: int = UPSERT_MAX_IN_FLIGHT,
+) -> list[R]:
+    """
+    Run `second(await first(batch))` for every batch with the stages overlapped.
+
+    The first exception cancels the batches still running and is re-raised
+    unchanged (not wrapped in an ExceptionGroup), so route handlers can let
+    HTTPExceptions through as before.
+    """
+    first_slots = asyncio.Semaphore(max(1, first_concurrency))
+    second_slots = asyncio.Semaphore(max(1, second_concurrency))
+    in_flight = asyncio.Semaphore(max(1, max_in_flight))
+
+    async def run_one(batch: T) -> R:
+        try:
+            async with first_slots:
+                prepared = await first(batch)
+            async with second_slots:
+                return await second(prepared)
+        finally:
+            in_flight.release()
+
+    tasks: list[asyncio.Task[R]] = []
+    try:
+        for batch in batches:
+            await in_flight.acquire()  # backpressure: wait for a finished batch
+            tasks.append(asyncio.create_task(run_one(batch)))
+            # Surface failures early instead of queueing more work behind them
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    raise task.exception()  # type: ignore[misc]
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
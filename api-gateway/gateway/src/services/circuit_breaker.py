@@ -0,0 +1,165 @@
+"""
+Per-upstream circuit breakers.
+
+Each target (an upstream model, Qdrant, the embeddings endpoint) gets one
+CircuitBreaker tracking a rolling window of outcomes. Once the error rate in
+the window crosses `error_rate` the circuit opens and callers fail fast for
+`open_s` seconds instead of waiting out their timeouts. After that a limited
+number of half-open probes are let through; a successful probe closes the
+circuit, a failed one re-opens it.
+"""
+
+import math
+import os
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+import httpx
+from fastapi import HTTPException
+
+from ..metrics import circuit_breaker_state
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CB_ERROR_RATE = float(os.getenv("HX_CB_ERROR_RATE", "0.5"))
+CB_MIN_CALLS = int(os.getenv("HX_CB_MIN_CALLS", "5"))
+CB_WINDOW_S = float(os.getenv("HX_CB_WINDOW_S", "30"))
+CB_OPEN_S = float(os.getenv("HX_CB_OPEN_S", "15"))
+CB_HALF_OPEN_PROBES = int(os.getenv("HX_CB_HALF_OPEN_PROBES", "1"))
+# Calls slower than this count as failures (0 disables)
+CB_SLOW_CALL_S = float(os.getenv("HX_CB_SLOW_CALL_S", "0"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a target whose circuit is open."""
+
+    def __init__(self, target: str, retry_after: float) -> None:
+        super().__init__(f"Circuit open for {target}; retry in {retry_after:.0f}s")
+        self.target = target
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        target: str,
+        error_rate: float = CB_ERROR_RATE,
+        min_calls: int = CB_MIN_CALLS,
+        window_s: float = CB_WINDOW_S,
+        open_s: float = CB_OPEN_S,
+        half_open_probes: int = CB_HALF_OPEN_PROBES,
+        slow_call_s: float = CB_SLOW_CALL_S,
+    ) -> None:
+        self.target = target
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_s = window_s
+        self.open_s = open_s
+        self.half_open_probes = half_open_probes
+        self.slow_call_s = slow_call_s
+        self.state = CLOSED
+        self.latency_ewma: float | None = None
+        self._events: deque[tuple[float, bool]] = deque()  # (timestamp, failed)
+        self._changed_at = 0.0
+        self._probes = 0
+
+    def _set_state(self, state: str, now: float) -> None:
+        self.state = state
+        self._changed_at = now
+        self._probes = 0
+        circuit_breaker_state.labels(target=self.target).set(_STATE_VALUE[state])
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through."""
+        if self.state == CLOSED:
+            return 0.0
+        return max(0.0, self._changed_at + self.open_s - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now; in half-open state this claims a probe slot."""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self._changed_at < self.open_s:
+            if self.state == OPEN or self._probes >= self.half_open_probes:
+                return False
+        elif self.state == OPEN or self._probes >= self.half_open_probes:
+            # Cool-down over, or earlier probes never reported back: probe again
+            self._set_state(HALF_OPEN, now)
+        self._probes += 1
+        return True
+
+    def release(self) -> None:
+        """Give back a probe slot claimed by `allow()` without judging the target."""
+        if self.state == HALF_OPEN and self._probes:
+            self._probes -= 1
+
+    def record(self, ok: bool, latency: float | None = None) -> None:
+        """Report the outcome of an allowed call."""
+        now = time.monotonic()
+        if latency is not None:
+            self.latency_ewma = (
+                latency if self.latency_ewma is None else 0.3 * latency + 0.7 * self.latency_ewma
+            )
+            if self.slow_call_s and latency > self.slow_call_s:
+                ok = False
+
+        if self.state == HALF_OPEN:
+            if ok:
+                self._events.clear()
+                self._set_state(CLOSED, now)
+            else:
+                self._set_state(OPEN, now)
+            return
+        if self.state == OPEN:
+            return  # late result of a call made before the circuit opened
+
+        self._events.append((now, not ok))
+        while self._events and now - self._events[0][0] > self.window_s:
+            self._events.popleft()
+        if len(self._events) >= self.min_calls:
+            failures = sum(1 for _, failed in self._events if failed)
+            if failures / len(self._events) >= self.error_rate:
+                self._events.clear()
+                self._set_state(OPEN, now)
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Run one HTTP call through the breaker.
+
+        Transport errors and 5xx replies count as failures; transport errors are
+        re-raised. Raises CircuitOpenError without calling `send` when open.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.target, self.retry_after())
+        started = time.monotonic()
+        try:
+            response = await send()
+        except httpx.HTTPError:
+            self.record(False)
+            raise
+        except BaseException:
+            self.release()  # cancelled, or failed before reaching the target
+            raise
+        self.record(response.status_code < 500, time.monotonic() - started)
+        return response
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(target: str) -> CircuitBreaker:
+    """Return the process-wide breaker for `target`, creating it on first use."""
+    breaker = _breakers.get(target)
+    if breaker is None:
+        breaker = _breakers[target] = CircuitBreaker(target)
+    return breaker
+
+
+def circuit_open_http_error(e: CircuitOpenError) -> HTTPException:
+    """503 with Retry-After for route handlers that fail fast on an open circuit."""
+    return HTTPException(
+        503, str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
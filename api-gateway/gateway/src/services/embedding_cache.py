@@ -0,0 +1,201 @@
+"""
+Embedding caches for RAG search queries and upserted documents.
+
+Two tiers keyed by (embedding model, text): an in-process LRU bounded by
+entry count and TTL, and an optional shared tier. Vectors are stored as
+packed float32 bytes in both tiers, about 4 KiB for a 1024-dim embedding.
+
+- `embedding_cache` holds search queries, keyed by whitespace-normalized
+  text (HX_EMBED_CACHE_*). Its shared tier is Redis (REDIS_URL), when
+  HX_EMBED_CACHE_REDIS is set.
+- `document_embedding_cache` holds upserted chunks, keyed by their exact
+  text (HX_DOC_EMBED_CACHE_*). Re-ingesting an unchanged corpus then only
+  embeds new or edited chunks. A corpus is far larger than any per-worker
+  LRU and is re-synced across restarts, so the in-process tier is kept
+  small. The shared tier is persistent: an on-disk SQLite store per host
+  (HX_DOC_EMBED_CACHE_DB) by default, or Redis with HX_DOC_EMBED_CACHE_REDIS.
+"""
+
+import hashlib
+import os
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Protocol
+
+from prometheus_client import Counter
+
+from ..metrics import doc_embed_cache, embed_cache
+from ..utils.paths import DATA_DIR
+from .embedding_store import SqliteEmbeddingStore
+from .redis_service import RedisService
+
+EMBED_CACHE_SIZE = int(os.getenv("HX_EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL_S = int(os.getenv("HX_EMBED_CACHE_TTL_S", "3600"))
+EMBED_CACHE_REDIS = os.getenv("HX_EMBED_CACHE_REDIS", "false").lower() in ("true", "1", "yes")
+REDIS_KEY_PREFIX = "hx:emb:"
+
+# Hot in-process front only (~4 MB at 1024 dims); the shared tier holds the corpus
+DOC_EMBED_CACHE_SIZE = int(os.getenv("HX_DOC_EMBED_CACHE_SIZE", "1024"))
+DOC_EMBED_CACHE_TTL_S = int(os.getenv("HX_DOC_EMBED_CACHE_TTL_S", str(7 * 86400)))
+DOC_EMBED_CACHE_REDIS = os.getenv("HX_DOC_EMBED_CACHE_REDIS", "false").lower() in ("true", "1", "yes")
+# Empty disables the on-disk tier (ignored when HX_DOC_EMBED_CACHE_REDIS is set)
+DOC_EMBED_CACHE_DB = os.getenv(
+    "HX_DOC_EMBED_CACHE_DB", os.path.join(DATA_DIR, "embeddings", "documents.sqlite3")
+)
+DOC_REDIS_KEY_PREFIX = "hx:demb:"
+
+
+def normalize_query(text: str) -> str:
+    """Unicode-normalize and collapse whitespace; case is kept (embeddings are case-sensitive)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def pack_vector(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(data: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class SharedTier(Protocol):
+    """Binary key/value tier behind the in-process LRU (RedisService, SqliteEmbeddingStore)."""
+
+    async def get_bytes(self, key: str) -> bytes | None: ...
+
+    async def get_many_bytes(self, keys: list[str]) -> list[bytes | None]: ...
+
+    async def set_bytes(self, key: str, value: bytes, ttl_s: int) -> bool: ...
+
+    async def set_many_bytes(self, items: dict[str, bytes], ttl_s: int) -> bool: ...
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_entries: int = EMBED_CACHE_SIZE,
+        ttl_s: int = EMBED_CACHE_TTL_S,
+        shared: SharedTier | None = None,
+        key_prefix: str = REDIS_KEY_PREFIX,
+        normalize: bool = True,
+        metric: Counter = embed_cache,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._shared = shared
+        self._key_prefix = key_prefix
+        self._normalize = normalize
+        self._metric = metric
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def key(self, model: str, text: str) -> str:
+        if self._normalize:
+            text = normalize_query(text)
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def _remember(self, key: str, packed: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_s, packed)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _recall(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, packed = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return packed
+
+    async def get(self, model: str, text: str) -> list[float] | None:
+        key = self.key(model, text)
+        packed = self._recall(key)
+        if packed is not None:
+            self._metric.labels(result="hit_memory").inc()
+            return unpack_vector(packed)
+
+        if self._shared is not None:
+            packed = await self._shared.get_bytes(self._key_prefix + key)
+            if packed:
+                self._remember(key, packed)
+                self._metric.labels(result="hit_shared").inc()
+                return unpack_vector(packed)
+
+        self._metric.labels(result="miss").inc()
+        return None
+
+    async def get_many(self, model: str, texts: Sequence[str]) -> list[list[float] | None]:
+        """Cached vectors in input order (None = miss); memory misses share one shared-tier lookup."""
+        keys = [self.key(model, text) for text in texts]
+        found = [self._recall(key) for key in keys]
+        for packed in found:
+            if packed is not None:
+                self._metric.labels(result="hit_memory").inc()
+
+        missing = [i for i, packed in enumerate(found) if packed is None]
+        if missing and self._shared is not None:
+            fetched = await self._shared.get_many_bytes(
+                [self._key_prefix + keys[i] for i in missing]
+            )
+            for i, packed in zip(missing, fetched):
+                if packed:
+                    self._remember(keys[i], packed)
+                    self._metric.labels(result="hit_shared").inc()
+                    found[i] = packed
+
+        for packed in found:
+            if packed is None:
+                self._metric.labels(result="miss").inc()
+        return [unpack_vector(packed) if packed else None for packed in found]
+
+    async def put(self, model: str, text: str, vector: list[float]) -> None:
+        key = self.key(model, text)
+        packed = pack_vector(vector)
+        self._remember(key, packed)
+        if self._shared is not None:
+            await self._shared.set_bytes(self._key_prefix + key, packed, self.ttl_s)
+
+    async def put_many(self, model: str, items: Sequence[tuple[str, list[float]]]) -> None:
+        packed_by_key: dict[str, bytes] = {}
+        for text, vector in items:
+            key = self.key(model, text)
+            packed_by_key[key] = pack_vector(vector)
+            self._remember(key, packed_by_key[key])
+        if self._shared is not None and packed_by_key:
+            await self._shared.set_many_bytes(
+                {self._key_prefix + key: packed for key, packed in packed_by_key.items()},
+                self.ttl_s,
+            )
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def _document_tier() -> SharedTier | None:
+    if DOC_EMBED_CACHE_REDIS:
+        return RedisService()
+    if DOC_EMBED_CACHE_DB:
+        return SqliteEmbeddingStore(DOC_EMBED_CACHE_DB)
+    return None
+
+
+embedding_cache = EmbeddingCache(shared=RedisService() if EMBED_CACHE_REDIS else None)
+
+document_embedding_cache = EmbeddingCache(
+    max_entries=DOC_EMBED_CACHE_SIZE,
+    ttl_s=DOC_EMBED_CACHE_TTL_S,
+    shared=_document_tier(),
+    key_prefix=DOC_REDIS_KEY_PREFIX,
+    normalize=False,
+    metric=doc_embed_cache,
+)
@@ -0,0 +1,128 @@
+"""
+On-disk embedding store.
+
+Persistent tier for the document embedding cache: packed float32 vectors in
+a local SQLite database (stdlib `sqlite3`, WAL mode), keyed like the Redis
+tier and expiring after the cache TTL. It survives restarts and is shared by
+all workers on one host, so a nightly re-sync of a mostly unchanged corpus
+only embeds new or edited chunks without needing Redis.
+
+Vectors read back here are trusted as embeddings, so the database directory
+must be private to the service: it is created with mode 0700, and one that
+another user owns or can write to is refused.
+
+Like `RedisService`'s binary helpers, every method is best-effort: errors
+(a refused directory included) are logged and read as misses. SQLite calls run in a thread so they never
+block the event loop.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Callable
+from typing import TypeVar
+
+from ..utils.paths import ensure_private_dir
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Rows per `IN (...)` lookup, under SQLite's default bound-variable limit
+LOOKUP_CHUNK = 500
+# Expired rows are deleted at most this often (on write)
+PRUNE_INTERVAL_S = 3600.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_expiry ON embeddings (expires_at);
+"""
+
+
+class SqliteEmbeddingStore:
+    """Key -> packed vector bytes with expiry; same interface as RedisService's byte helpers."""
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._ready = False
+        self._pruned_at = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            ensure_private_dir(os.path.dirname(os.path.abspath(self.db_path)))
+        conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._ready = True
+        return conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T], default: T) -> T:
+        def work() -> T:
+            conn = self._connect()
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+        try:
+            return await asyncio.to_thread(work)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Embedding store {self.db_path} unavailable: {e}")
+            return default
+
+    async def get_many_bytes(self, keys: list[str]) -> list[bytes | None]:
+        """Stored vectors in key order; None for misses and expired rows."""
+        if not keys:
+            return []
+
+        def fetch(conn: sqlite3.Connection) -> list[bytes | None]:
+            now = time.time()
+            found: dict[str, bytes] = {}
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start : start + LOOKUP_CHUNK]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})"
+                    " AND expires_at > ?",
+                    (*chunk, now),
+                )
+                found.update(rows)
+            return [found.get(key) for key in keys]
+
+        return await self._run(fetch, [None] * len(keys))
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        return (await self.get_many_bytes([key]))[0]
+
+    async def set_many_bytes(self, items: dict[str, bytes], ttl_s: int) -> bool:
+        """Store vectors (replacing existing keys); expired rows are pruned now and then."""
+        if not items:
+            return True
+
+        def store(conn: sqlite3.Connection) -> bool:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, expires_at) VALUES (?, ?, ?)",
+                    [(key, value, now + ttl_s) for key, value in items.items()],
+                )
+                if now - self._pruned_at >= PRUNE_INTERVAL_S:
+                    self._pruned_at = now
+                    conn.execute("DELETE FROM embeddings WHERE expires_at <= ?", (now,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return True
+
+        return await self._run(store, False)
+
+    async def set_bytes(self, key: str, value: bytes, ttl_s: int) -> bool:
+        return await self.set_many_bytes({key: value}, ttl_s)
@@ -0,0 +1,107 @@
+"""
+Shared httpx clients.
+
+One long-lived AsyncClient per upstream target (Qdrant, the embeddings
+endpoint) so calls reuse keep-alive connections instead of paying TCP/TLS
+setup per request. `build_app` closes the registry in its lifespan; callers
+pass their own per-call timeout.
+"""
+
+import asyncio
+import logging
+import os
+from collections.abc import Iterable
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+QDRANT = "qdrant"
+EMBEDDINGS = "embeddings"
+RERANK = "rerank"
+
+# Per-target pool sizes; unknown targets use the "default" entry
+POOL_LIMITS: dict[str, httpx.Limits] = {
+    QDRANT: httpx.Limits(
+        max_connections=int(os.getenv("HX_QDRANT_MAX_CONNECTIONS", "50")),
+        max_keepalive_connections=int(os.getenv("HX_QDRANT_MAX_KEEPALIVE", "20")),
+    ),
+    EMBEDDINGS: httpx.Limits(
+        max_connections=int(os.getenv("HX_EMBEDDINGS_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("HX_EMBEDDINGS_MAX_KEEPALIVE", "10")),
+    ),
+    "default": httpx.Limits(max_connections=20, max_keepalive_connections=10),
+}
+HTTP2 = os.getenv("HX_HTTP2", "false").lower() in ("true", "1", "yes")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HttpClientRegistry:
+    """Lazily created, app-scoped AsyncClients keyed by event loop and target name."""
+
+    def __init__(
+        self,
+        limits: dict[str, httpx.Limits] | None = None,
+        http2: bool = HTTP2,
+    ) -> None:
+        self._limits = limits or POOL_LIMITS
+        if http2 and not _http2_available():
+            logger.warning("HX_HTTP2 is set but the 'h2' package is missing; using HTTP/1.1")
+            http2 = False
+        self._http2 = http2
+        # Pooled connections belong to the loop that opened them (tests and
+        # TestClient run a fresh loop per call), so clients are kept per loop
+        self._clients: dict[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]] = {}
+        self._closing: set[asyncio.Task] = set()
+
+    def get(self, target: str) -> httpx.AsyncClient:
+        """Return the shared client for `target`, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            self._dispose_other_loops(loop)
+            clients = self._clients[loop] = {}
+
+        client = clients.get(target)
+        if client is None or client.is_closed:
+            client = clients[target] = httpx.AsyncClient(
+                limits=self._limits.get(target, self._limits["default"]),
+                http2=self._http2,
+            )
+        return client
+
+    def _dispose_other_loops(self, current: asyncio.AbstractEventLoop) -> None:
+        """Close the clients of event loops that have been closed since they were created."""
+        for loop in [loop for loop in self._clients if loop is not current and loop.is_closed()]:
+            clients = self._clients.pop(loop)
+            # Their loop can no longer run transport callbacks; closing them here marks them
+            # closed and empties their pools, so the sockets are released with them
+            task = current.create_task(_aclose_all(clients.values()))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        clients = self._clients.pop(loop, {})
+        self._dispose_other_loops(loop)
+        await _aclose_all(clients.values())
+        await asyncio.gather(*self._closing)
+
+
+async def _aclose_all(clients: Iterable[httpx.AsyncClient]) -> None:
+    for client in clients:
+        try:
+            await client.aclose()
+        except RuntimeError as e:  # "Event loop is closed" for pools of a finished loop
+            logger.debug(f"Discarded client of a closed event loop: {e}")
+
+
+# Process-wide registry used by routes and services; closed by the app lifespan
+http_clients = HttpClientRegistry()
@@ -0,0 +1,411 @@
+"""
+Background ingestion jobs.
+
+Large Markdown/PDF uploads can be queued instead of processed inline. The
+route spools the document to disk, records a job, and answers 202 with a job
+id. A pool of worker tasks started by the app lifespan claims queued jobs
+and runs them, reporting progress that `/v1/rag/jobs/{id}` reads back.
+
+The queue is a local SQLite database (stdlib `sqlite3`, WAL mode), so jobs
+survive restarts and are shared by all workers on one host. A claimed job
+carries its worker's owner id and a lease that a heartbeat keeps renewing;
+only jobs whose lease has run out (their worker crashed or was stopped) are
+claimed again, so sibling processes never steal each other's running jobs.
+A job claimed HX_INGEST_MAX_ATTEMPTS times without finishing (it keeps
+crashing its worker) is marked failed instead of being retried forever.
+Finished jobs and orphaned spool files are pruned after a retention period.
+SQLite calls run in a thread so they never block the event loop.
+
+The spool directory is private to the service (see `utils.paths`), and only
+files inside it are ever read or deleted on a job's behalf.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import time
+import uuid
+from collections.abc import Awaitable, Callable, Coroutine
+from typing import Any, TypeVar
+
+from ..utils.paths import DATA_DIR, ensure_private_dir
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+INGEST_SPOOL_DIR = os.getenv("HX_INGEST_SPOOL_DIR", os.path.join(DATA_DIR, "ingest"))
+INGEST_DB_PATH = os.getenv("HX_INGEST_DB", os.path.join(INGEST_SPOOL_DIR, "jobs.sqlite3"))
+INGEST_WORKERS = int(os.getenv("HX_INGEST_WORKERS", "2"))
+INGEST_POLL_S = float(os.getenv("HX_INGEST_POLL_S", "1.0"))
+# A running job is reclaimable once its worker stops renewing the lease for this long
+INGEST_LEASE_S = float(os.getenv("HX_INGEST_LEASE_S", "60"))
+# Finished jobs (and orphaned spool files) are deleted after this long
+INGEST_RETENTION_S = float(os.getenv("HX_INGEST_RETENTION_S", str(7 * 86400)))
+# Claims per job before it is failed as a poison job
+INGEST_MAX_ATTEMPTS = int(os.getenv("HX_INGEST_MAX_ATTEMPTS", "3"))
+# Pruning runs at most this often, from an idle worker
+PRUNE_INTERVAL_S = 3600.0
+# Longest pause after repeated queue errors (database locked, disk full, ...)
+MAX_BACKOFF_S = 30.0
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    spool_path TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ingest_jobs_queue ON ingest_jobs (status, created_at);
+"""
+# Columns added after the first release; older databases get them on open
+_ADDED_COLUMNS = {
+    "owner": "TEXT",
+    "lease_until": "REAL",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+}
+
+_SPOOL_NAME = re.compile(r"^[0-9a-f]{32}\.\w+$")
+
+# (job, report_progress) -> result dict stored on the job
+JobHandler = Callable[
+    ["IngestJob", Callable[[dict[str, Any]], Awaitable[None]]], Coroutine[Any, Any, dict[str, Any]]
+]
+
+
+class IngestJob:
+    __slots__ = ("id", "kind", "params", "spool_path")
+
+    def __init__(self, id: str, kind: str, params: dict[str, Any], spool_path: str) -> None:
+        self.id = id
+        self.kind = kind
+        self.params = params
+        self.spool_path = spool_path
+
+
+class IngestJobStore:
+    """SQLite-backed job queue; every public method is async and runs SQL off the loop."""
+
+    def __init__(self, db_path: str = INGEST_DB_PATH, spool_dir: str = INGEST_SPOOL_DIR) -> None:
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        # Identifies this store's claims among all processes sharing the database
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._ready = False
+        self._pruned_at = 0.0
+        self._wakeup: asyncio.Event | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            ensure_private_dir(self.spool_dir)
+        conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+            for name, decl in _ADDED_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {name} {decl}")
+            self._ready = True
+        return conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        def work() -> T:
+            conn = self._connect()
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+        return await asyncio.to_thread(work)
+
+    def _spool_file(self, path: str) -> str:
+        """`path` if it names a spool file inside the spool dir; raises ValueError otherwise."""
+        real = os.path.realpath(path)
+        if (
+            os.path.dirname(real) != os.path.realpath(self.spool_dir)
+            or not _SPOOL_NAME.match(os.path.basename(real))
+        ):
+            raise ValueError(f"Spool path outside {self.spool_dir}: {path}")
+        return real
+
+    def _remove_spool(self, path: str) -> None:
+        try:
+            os.remove(self._spool_file(path))
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            logger.error(f"Not deleting spooled document: {e}")
+
+    async def read_spool(self, job: IngestJob) -> bytes:
+        """The job's spooled document; refuses paths outside the spool dir."""
+        path = self._spool_file(job.spool_path)
+
+        def read() -> bytes:
+            with open(path, "rb") as f:
+                return f.read()
+
+        return await asyncio.to_thread(read)
+
+    def _notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def enqueue(self, kind: str, data: bytes, params: dict[str, Any]) -> str:
+        """Spool `data` to disk and queue a job for it; returns the job id."""
+        job_id = uuid.uuid4().hex
+        spool_path = os.path.join(self.spool_dir, f"{job_id}.{kind}")
+
+        def insert(conn: sqlite3.Connection) -> None:
+            with open(spool_path, "wb") as f:
+                f.write(data)
+            conn.execute(
+                "INSERT INTO ingest_jobs (id, kind, status, params, spool_path, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), spool_path, time.time()),
+            )
+
+        await self._run(insert)
+        self._notify()
+        return job_id
+
+    async def claim(self) -> IngestJob | None:
+        """
+        Atomically lease the oldest claimable job to this store and return it.
+
+        Claimable means queued, or running under a lease that has expired
+        (rows from before leases existed have none and count as expired).
+        Jobs already claimed `INGEST_MAX_ATTEMPTS` times are failed on the way.
+        """
+
+        def take(conn: sqlite3.Connection) -> IngestJob | None:
+            now = time.time()
+            poisoned = []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = conn.execute(
+                        "SELECT id, kind, status, owner, params, spool_path, attempts FROM ingest_jobs"
+                        " WHERE status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?))"
+                        " ORDER BY created_at LIMIT 1",
+                        (QUEUED, RUNNING, now),
+                    ).fetchone()
+                    if row is None or row["attempts"] < INGEST_MAX_ATTEMPTS:
+                        break
+                    conn.execute(
+                        "UPDATE ingest_jobs SET status = ?, error = ?, finished_at = ?,"
+                        " lease_until = NULL WHERE id = ?",
+                        (FAILED, f"Gave up after {row['attempts']} attempts", now, row["id"]),
+                    )
+                    poisoned.append(row)
+                if row is not None:
+                    conn.execute(
+                        "UPDATE ingest_jobs SET status = ?, started_at = ?, owner = ?, lease_until = ?,"
+                        " attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, now, self.owner, now + INGEST_LEASE_S, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            for job in poisoned:
+                logger.error(f"Ingest job {job['id']} failed: gave up after {job['attempts']} attempts")
+                self._remove_spool(job["spool_path"])
+            if row is None:
+                return None
+            if row["status"] == RUNNING:
+                logger.warning(f"Reclaiming ingest job {row['id']}: lease of {row['owner']} expired")
+            return IngestJob(row["id"], row["kind"], json.loads(row["params"]), row["spool_path"])
+
+        return await self._run(take)
+
+    async def renew(self, job_id: str) -> bool:
+        """Extend this store's lease on a running job; False if the lease was lost."""
+
+        def extend(conn: sqlite3.Connection) -> bool:
+            cur = conn.execute(
+                "UPDATE ingest_jobs SET lease_until = ? WHERE id = ? AND status = ? AND owner = ?",
+                (time.time() + INGEST_LEASE_S, job_id, RUNNING, self.owner),
+            )
+            return cur.rowcount == 1
+
+        return await self._run(extend)
+
+    async def set_progress(self, job_id: str, progress: dict[str, Any]) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "UPDATE ingest_jobs SET progress = ? WHERE id = ? AND owner = ?",
+                (json.dumps(progress), job_id, self.owner),
+            )
+        )
+
+    async def finish(
+        self, job: IngestJob, result: dict[str, Any] | None = None, error: str | None = None
+    ) -> None:
+        """Record the outcome and drop the spooled document (unless the lease was lost)."""
+
+        def done(conn: sqlite3.Connection) -> None:
+            cur = conn.execute(
+                "UPDATE ingest_jobs SET status = ?, result = ?, error = ?, finished_at = ?,"
+                " lease_until = NULL WHERE id = ? AND status = ? AND owner = ?",
+                (
+                    FAILED if error is not None else SUCCEEDED,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job.id,
+                    RUNNING,
+                    self.owner,
+                ),
+            )
+            if cur.rowcount == 0:
+                logger.warning(f"Ingest job {job.id} was reclaimed by another worker; result dropped")
+                return
+            self._remove_spool(job.spool_path)
+
+        await self._run(done)
+
+    async def get(self, job_id: str) -> dict[str, Any] | None:
+        """Job status as a JSON-ready dict, or None if unknown."""
+
+        def fetch(conn: sqlite3.Connection) -> dict[str, Any] | None:
+            row = conn.execute(
+                "SELECT id, kind, status, progress, result, error, created_at, started_at,"
+                " finished_at, owner, lease_until, attempts FROM ingest_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            job["progress"] = json.loads(job["progress"] or "{}")
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            return job
+
+        return await self._run(fetch)
+
+    async def prune(self, retention_s: float = INGEST_RETENTION_S) -> int:
+        """
+        Delete jobs finished more than `retention_s` ago, and spool files no
+        live job refers to (left behind by a failed finish or enqueue).
+
+        Returns the number of jobs deleted.
+        """
+
+        def sweep(conn: sqlite3.Connection) -> int:
+            cutoff = time.time() - retention_s
+            deleted = conn.execute(
+                "DELETE FROM ingest_jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (SUCCEEDED, FAILED, cutoff),
+            ).rowcount
+            live = {
+                row["spool_path"]
+                for row in conn.execute(
+                    "SELECT spool_path FROM ingest_jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+                )
+            }
+            for entry in os.scandir(self.spool_dir):
+                if not _SPOOL_NAME.match(entry.name) or entry.path in live:
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    # Young files may belong to an enqueue that has not committed yet
+                    if entry.stat().st_mtime < time.time() - INGEST_LEASE_S:
+                        os.remove(entry.path)
+            return deleted
+
+        return await self._run(sweep)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Renew the lease on `job_id` until cancelled; returns once the lease is lost."""
+        while True:
+            await asyncio.sleep(INGEST_LEASE_S / 3)
+            try:
+                if not await self.renew(job_id):
+                    logger.warning(f"Ingest job {job_id} lease lost; stopping it")
+                    return
+            except (sqlite3.Error, OSError) as e:
+                # The lease runs for a while yet; the next beat retries
+                logger.warning(f"Ingest job {job_id} lease renewal failed: {e}")
+
+    async def _run_job(self, job: IngestJob, handler: JobHandler) -> None:
+        # Batches finish concurrently; write snapshots in call order so a
+        # stale one never lands after a newer one
+        lock = asyncio.Lock()
+
+        async def report(progress: dict[str, Any]) -> None:
+            async with lock:
+                try:
+                    await self.set_progress(job.id, progress)
+                except (sqlite3.Error, OSError) as e:
+                    logger.warning(f"Ingest job {job.id} progress not recorded: {e}")
+
+        run = asyncio.create_task(handler(job, report))
+        beat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            # Shutdown cancels this task; the job's lease then expires and it runs again
+            await asyncio.wait((run, beat), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            beat.cancel()
+            if not run.done():
+                run.cancel()
+            await asyncio.gather(run, beat, return_exceptions=True)
+
+        if run.cancelled():
+            return  # lease lost: the worker that reclaimed the job records its outcome
+        error = run.exception()
+        if error is None:
+            await self.finish(job, result=run.result())
+        else:
+            detail = getattr(error, "detail", None) or str(error)
+            logger.error(f"Ingest job {job.id} failed: {detail}")
+            await self.finish(job, error=str(detail)[:1000])
+
+    async def _work(self, handler: JobHandler) -> None:
+        assert self._wakeup is not None
+        backoff = 0.0
+        while True:
+            try:
+                job = await self.claim()
+                if job is not None:
+                    await self._run_job(job, handler)
+                elif time.time() - self._pruned_at >= PRUNE_INTERVAL_S:
+                    self._pruned_at = time.time()
+                    await self.prune()
+            except (sqlite3.Error, OSError) as e:
+                # e.g. "database is locked" or a full disk: keep the worker alive and back off
+                backoff = min(max(backoff * 2, INGEST_POLL_S), MAX_BACKOFF_S)
+                logger.error(f"Ingest queue error, retrying in {backoff:.1f}s: {e}")
+                await asyncio.sleep(backoff)
+                continue
+            backoff = 0.0
+            if job is None:
+                # Woken by a local enqueue, or poll for jobs queued by other processes
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=INGEST_POLL_S)
+                self._wakeup.clear()
+
+    def start_workers(self, handler: JobHandler, count: int = INGEST_WORKERS) -> list[asyncio.Task[None]]:
+        """Start `count` worker tasks on the running loop (the app lifespan cancels them)."""
+        self._wakeup = asyncio.Event()
+        return [asyncio.create_task(self._work(handler)) for _ in range(count)]
+
+
+# Process-wide store used by the loader routes, the jobs route and the app lifespan
+ingest_jobs = IngestJobStore()
@@ -1,7 +1,7 @@
 import os
 from typing import Optional
 
-import httpx
+from .http_clients import QDRANT, http_clients
 
 
 class QdrantService:
@@ -15,8 +15,8 @@ class QdrantService:
         if not self.url:
             return False
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                r = await client.get(f"{self.url}/collections")
-                return r.status_code == 200
+            client = http_clients.get(QDRANT)
+            r = await client.get(f"{self.url}/collections", timeout=self.timeout)
+            return r.status_code == 200
         except Exception:
             return False
@@ -11,6 +11,9 @@ from typing import Any, Optional
 
 import httpx
 
+from .http_clients import QDRANT, http_clients
+from .search_cache import filter_namespace, search_cache
+
 # Configuration from environment
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://192.168.10.30:6333").rstrip("/")
 QDRANT_COLLECTION = os.environ.get("QDRANT_COLLECTION", "hx_rag_default")
@@ -61,13 +64,15 @@ async def qdrant_delete_by_ids(ids: list[str]) -> tuple[bool, str, int]:
     body = {"points": norm, "wait": True}
 
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            logger.info(
-                "Deleting %d points by IDs from Qdrant collection %s",
-                len(norm),
-                QDRANT_COLLECTION,
-            )
-            response = await client.post(url, json=body)
+        logger.info(
+            "Deleting %d points by IDs from Qdrant collection %s",
+            len(norm),
+            QDRANT_COLLECTION,
+        )
+        try:
+            response = await http_clients.get(QDRANT).post(url, json=body, timeout=20.0)
+        finally:
+            search_cache.invalidate_all()  # point IDs don't tell us their namespaces
 
         ok = response.status_code == 200
         text = response.text
@@ -130,13 +135,19 @@ async def qdrant_delete_by_filter(qfilter: dict[str, Any]) -> tuple[bool, str, i
     body = {"filter": qfilter, "wait": True}
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            logger.info(
-                "Deleting points by filter from Qdrant collection %s: %s",
-                QDRANT_COLLECTION,
-                qfilter,
-            )
-            response = await client.post(url, json=body)
+        logger.info(
+            "Deleting points by filter from Qdrant collection %s: %s",
+            QDRANT_COLLECTION,
+            qfilter,
+        )
+        try:
+            response = await http_clients.get(QDRANT).post(url, json=body, timeout=30.0)
+        finally:
+            namespace = filter_namespace(qfilter)
+            if namespace:
+                search_cache.invalidate([namespace])
+            else:
+                search_cache.invalidate_all()
 
         ok = response.status_code == 200
         text = response.text
@@ -193,8 +204,7 @@ async def qdrant_count_points(
         body["filter"] = qfilter
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(url, json=body)
+        response = await http_clients.get(QDRANT).post(url, json=body, timeout=10.0)
 
         if response.status_code == 200:
             result = response.json()
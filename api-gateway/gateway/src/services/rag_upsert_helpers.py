@@ -1,13 +1,25 @@
 from __future__ import annotations
 
 import hashlib
+import logging
 import os
-from collections.abc import Sequence
+import uuid
+from collections.abc import Awaitable, Callable, Mapping, Sequence
 from typing import Any
 
-import httpx
 from fastapi import HTTPException
 
+from .circuit_breaker import CircuitOpenError, circuit_open_http_error, get_breaker
+from .embedding_cache import document_embedding_cache
+from .http_clients import EMBEDDINGS, QDRANT, http_clients
+from .search_cache import search_cache
+from .sparse import (
+    DENSE_VECTOR_NAME,
+    RAG_HYBRID_ENABLED,
+    SPARSE_VECTOR_NAME,
+    document_sparse_vector,
+)
+
 # ---- Env / Defaults ----
 GATEWAY_BASE = os.environ.get("GATEWAY_BASE", "http://127.0.0.1:4000").rstrip("/")
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://192.168.10.30:6333").rstrip("/")
@@ -16,11 +28,14 @@ EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "emb-premium")
 EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "1024"))
 LITELLM_PROXY_AUTH = os.environ.get("LITELLM_PROXY_AUTH")
 
+logger = logging.getLogger(__name__)
+
 
 # ---- Helper Functions ----
-def hash_id(ns: str | None, text: str) -> str:
-    base = f"{ns or ''}::{text}".encode()
-    return hashlib.sha256(base).hexdigest()[:32]
+def hash_id(ns: str | None, text: str, scope: str | None = None) -> str:
+    """Content-derived point id; `scope` (e.g. a source document) keeps equal text apart."""
+    base = f"{ns or ''}::{text}" if scope is None else f"{ns or ''}::{scope}::{text}"
+    return hashlib.sha256(base.encode()).hexdigest()[:32]
 
 
 def auth_headers(caller_auth: str) -> dict[str, str]:
@@ -47,10 +62,15 @@ async def embed_texts(
     ):
         raise HTTPException(401, "Authorization required to compute embeddings.")
     payload = {"model": EMBEDDING_MODEL, "input": list(texts)}
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        r = await client.post(
-            f"{GATEWAY_BASE}/v1/embeddings", headers=headers, json=payload
+    try:
+        client = http_clients.get(EMBEDDINGS)
+        r = await get_breaker(EMBEDDINGS).call(
+            lambda: client.post(
+                f"{GATEWAY_BASE}/v1/embeddings", headers=headers, json=payload, timeout=60.0
+            )
         )
+    except CircuitOpenError as e:
+        raise circuit_open_http_error(e) from e
     if r.status_code != 200:
         raise HTTPException(r.status_code, f"Embeddings error: {r.text}")
     try:
@@ -59,12 +79,57 @@ async def embed_texts(
         raise HTTPException(500, "Unexpected embedding response format.")
 
 
+async def cached_embed_texts(
+    texts: Sequence[str],
+    headers: dict[str, str],
+    embed: Callable[[Sequence[str], dict[str, str]], Awaitable[list[list[float]]]] = embed_texts,
+) -> list[list[float]]:
+    """
+    `embed` behind the document embedding cache.
+
+    Only texts without a cached vector for EMBEDDING_MODEL are sent, each
+    distinct text once. Like a short embeddings reply, the result stops at
+    the first text left without a vector.
+    """
+    cached = await document_embedding_cache.get_many(EMBEDDING_MODEL, texts)
+    vectors = {text: vector for text, vector in zip(texts, cached) if vector is not None}
+    missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+    if missing:
+        fresh = list(zip(missing, await embed(missing, headers)))
+        vectors.update(fresh)
+        await document_embedding_cache.put_many(EMBEDDING_MODEL, fresh)
+
+    result: list[list[float]] = []
+    for text in texts:
+        if text not in vectors:
+            break
+        result.append(vectors[text])
+    return result
+
+
+def build_point(
+    point_id: str,
+    vector: list[float],
+    payload: dict[str, Any],
+    text: str | None = None,
+) -> dict[str, Any]:
+    """Qdrant point; in hybrid mode vectors are named and `text` adds a sparse BM25 vector."""
+    if not RAG_HYBRID_ENABLED:
+        return {"id": point_id, "vector": vector, "payload": payload}
+    vectors: dict[str, Any] = {DENSE_VECTOR_NAME: vector}
+    if text:
+        vectors[SPARSE_VECTOR_NAME] = document_sparse_vector(text)
+    return {"id": point_id, "vector": vectors, "payload": payload}
+
+
 def _validate_point_vectors(points: list[dict[str, Any]]) -> None:
     """Raise HTTPException(400) if any vector length != EMBEDDING_DIM."""
     if EMBEDDING_DIM <= 0:
         return
     for i, p in enumerate(points):
         v = p.get("vector")
+        if isinstance(v, dict):  # named vectors (hybrid collections)
+            v = v.get(DENSE_VECTOR_NAME)
         if v is None:
             raise HTTPException(400, f"Point {i} missing 'vector'")
         if len(v) != EMBEDDING_DIM:
@@ -76,6 +141,72 @@ def _validate_point_vectors(points: list[dict[str, Any]]) -> None:
 async def qdrant_upsert(points: list[dict[str, Any]]) -> tuple[bool, str]:
     _validate_point_vectors(points)
     url = f"{QDRANT_URL}/collections/{QDRANT_COLLECTION}/points?wait=true"
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        r = await client.put(url, json={"points": points})
+    try:
+        client = http_clients.get(QDRANT)
+        r = await get_breaker(QDRANT).call(
+            lambda: client.put(url, json={"points": points}, timeout=30.0)
+        )
+    except CircuitOpenError as e:
+        return False, str(e)
+    finally:
+        # Even a failed upsert may have partially applied
+        search_cache.invalidate((p.get("payload") or {}).get("namespace") for p in points)
     return r.status_code == 200, r.text
+
+
+async def qdrant_set_payloads(payloads: Mapping[str, dict[str, Any]]) -> tuple[bool, str]:
+    """
+    Replace the payload of existing points, leaving their vectors alone.
+
+    One batch-update call with an `overwrite_payload` per point, so unchanged
+    chunks get the same payload a full upsert would have written (fresh
+    timestamps/TTL) without being re-embedded.
+    """
+    if not payloads:
+        return True, ""
+    url = f"{QDRANT_URL}/collections/{QDRANT_COLLECTION}/points/batch?wait=true"
+    body = {
+        "operations": [
+            {"overwrite_payload": {"payload": payload, "points": [point_id]}}
+            for point_id, payload in payloads.items()
+        ]
+    }
+    try:
+        client = http_clients.get(QDRANT)
+        r = await get_breaker(QDRANT).call(lambda: client.post(url, json=body, timeout=30.0))
+    except CircuitOpenError as e:
+        return False, str(e)
+    finally:
+        search_cache.invalidate(payload.get("namespace") for payload in payloads.values())
+    return r.status_code == 200, r.text
+
+
+def _canonical_id(point_id: Any) -> str:
+    # Qdrant echoes 32-hex string ids back in hyphenated UUID form
+    try:
+        return str(uuid.UUID(str(point_id)))
+    except ValueError:
+        return str(point_id)
+
+
+async def qdrant_existing_ids(ids: Sequence[str]) -> set[str]:
+    """
+    Which of `ids` already exist in the collection (one batched retrieve call).
+
+    Returned ids are the caller's own strings. On any error the set is empty,
+    so callers fall back to writing everything.
+    """
+    if not ids:
+        return set()
+    url = f"{QDRANT_URL}/collections/{QDRANT_COLLECTION}/points"
+    body = {"ids": list(dict.fromkeys(ids)), "with_payload": False, "with_vector": False}
+    try:
+        client = http_clients.get(QDRANT)
+        r = await get_breaker(QDRANT).call(lambda: client.post(url, json=body, timeout=15.0))
+        if r.status_code != 200:
+            raise RuntimeError(f"{r.status_code} {r.text[:200]}")
+        found = {_canonical_id(p.get("id")) for p in r.json().get("result") or []}
+    except Exception as e:
+        logger.warning(f"Existing point lookup failed, upserting all chunks: {e}")
+        return set()
+    return {i for i in ids if _canonical_id(i) in found}
@@ -12,6 +12,7 @@ class RedisService:
         self.url = url or os.getenv("REDIS_URL", "")
         self.timeout = timeout_s
         self._client: aioredis.Redis | None = None
+        self._raw_client: aioredis.Redis | None = None
 
     async def connect(self) -> None:
         if not self.url or self._client:
@@ -32,3 +33,67 @@ class RedisService:
         if not self._client:
             raise RuntimeError("redis client not available")
         await self._client.ping()
+
+    async def _bytes_client(self) -> aioredis.Redis | None:
+        # Separate connection pool without decode_responses for binary values
+        if not self.url:
+            return None
+        if self._raw_client is None:
+            self._raw_client = aioredis.from_url(
+                self.url,
+                decode_responses=False,
+                socket_connect_timeout=self.timeout,
+                socket_timeout=self.timeout,
+            )
+        return self._raw_client
+
+    async def get_bytes(self, key: str) -> bytes | None:
+        """Best-effort binary GET; None on miss, timeout or connection error."""
+        try:
+            client = await self._bytes_client()
+            if not client:
+                return None
+            value = await asyncio.wait_for(client.get(key), timeout=self.timeout)
+            return value if isinstance(value, bytes) else None
+        except Exception:
+            return None
+
+    async def set_bytes(self, key: str, value: bytes, ttl_s: int) -> bool:
+        """Best-effort binary SET with expiry; False if Redis is unavailable."""
+        try:
+            client = await self._bytes_client()
+            if not client:
+                return False
+            await asyncio.wait_for(client.set(key, value, ex=ttl_s), timeout=self.timeout)
+            return True
+        except Exception:
+            return False
+
+    async def get_many_bytes(self, keys: list[str]) -> list[bytes | None]:
+        """Best-effort binary MGET; all None if Redis is unavailable."""
+        if not keys:
+            return []
+        try:
+            client = await self._bytes_client()
+            if not client:
+                return [None] * len(keys)
+            values = await asyncio.wait_for(client.mget(keys), timeout=self.timeout)
+            return [v if isinstance(v, bytes) else None for v in values]
+        except Exception:
+            return [None] * len(keys)
+
+    async def set_many_bytes(self, items: dict[str, bytes], ttl_s: int) -> bool:
+        """Best-effort pipelined binary SETs with expiry; False if Redis is unavailable."""
+        if not items:
+            return True
+        try:
+            client = await self._bytes_client()
+            if not client:
+                return False
+            pipe = client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(key, value, ex=ttl_s)
+            await asyncio.wait_for(pipe.execute(), timeout=self.timeout)
+            return True
+        except Exception:
+            return False
@@ -0,0 +1,209 @@
+"""
+Re-ranking and diversification of RAG search candidates.
+
+Search fetches a wider candidate set (RAG_RERANK_CANDIDATES) and the top
+`limit` are picked here, so fewer but better chunks reach the chat prompt.
+The local scorer blends cosine similarity between the query and each
+candidate's stored dense vector with lexical overlap between the query terms
+and the candidate's payload text. Cosine similarity is computed in one numpy
+matrix product when numpy is installed.
+
+When RAG_RERANK_MODEL is set, `routes/rag.py` asks that cross-encoder model
+through the gateway's /v1/rerank endpoint instead.
+
+Maximal marginal relevance (MMR) then picks the final `limit` hits. Each pick
+trades the hit's relevance against its similarity to the hits already
+picked, so overlapping neighbouring chunks don't crowd out other
+information.
+"""
+
+import math
+import os
+from collections.abc import Sequence
+from types import ModuleType
+from typing import Any
+
+from .sparse import DENSE_VECTOR_NAME, tokenize
+
+# Optional fast path: matrix products instead of Python loops per candidate pair
+np: ModuleType | None
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only when numpy is absent
+    np = None
+
+RAG_RERANK_CANDIDATES = int(os.environ.get("RAG_RERANK_CANDIDATES", "40"))
+RAG_RERANK_LEXICAL_WEIGHT = float(os.environ.get("RAG_RERANK_LEXICAL_WEIGHT", "0.3"))
+# Cross-encoder served behind /v1/rerank; empty = local scorer
+RAG_RERANK_MODEL = os.environ.get("RAG_RERANK_MODEL", "")
+RAG_RERANK_TEXT_FIELDS = tuple(
+    f.strip()
+    for f in os.environ.get("RAG_RERANK_TEXT_FIELDS", "text,text_preview,content").split(",")
+    if f.strip()
+)
+# MMR trade-off: 1.0 = relevance only, 0.0 = diversity only
+RAG_MMR_LAMBDA = float(os.environ.get("RAG_MMR_LAMBDA", "0.5"))
+
+
+def hit_text(hit: dict[str, Any]) -> str:
+    """Payload text used for lexical scoring (first non-empty RAG_RERANK_TEXT_FIELDS entry)."""
+    payload = hit.get("payload") or {}
+    for field in RAG_RERANK_TEXT_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, str) and value:
+            return value
+    return ""
+
+
+def hit_vector(hit: dict[str, Any]) -> list[float] | None:
+    """Dense vector returned with a hit (`with_vectors`), named or not."""
+    vector = hit.get("vector")
+    if isinstance(vector, dict):
+        vector = vector.get(DENSE_VECTOR_NAME)
+    return vector if isinstance(vector, list) and vector else None
+
+
+def _unit_rows(vectors: list[list[float] | None], dims: int) -> list[list[float] | None]:
+    """L2-normalized copies of `vectors`; None for missing, mismatched or zero vectors."""
+    rows: list[list[float] | None] = []
+    for v in vectors:
+        norm = math.sqrt(sum(x * x for x in v)) if v is not None and len(v) == dims else 0.0
+        rows.append([x / norm for x in v] if v is not None and norm else None)
+    return rows
+
+
+def _unit_matrix(vectors: list[list[float] | None], dims: int) -> Any:
+    """Row-normalized float32 `np.ndarray`; zero rows for missing, mismatched or zero vectors."""
+    assert np is not None
+    matrix = np.zeros((len(vectors), dims), dtype=np.float32)
+    for i, v in enumerate(vectors):
+        if v is not None and len(v) == dims:
+            matrix[i] = v
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _cosines(query: Sequence[float], vectors: list[list[float] | None]) -> list[float]:
+    """Cosine similarity of `query` to each vector (0.0 for missing or mismatched ones)."""
+    dims = len(query)
+    if not dims or not vectors:
+        return [0.0] * len(vectors)
+    if np is not None:
+        q = _unit_matrix([list(query)], dims)[0]
+        cosines: list[float] = (_unit_matrix(vectors, dims) @ q).tolist()
+        return cosines
+    q_unit = _unit_rows([list(query)], dims)[0]
+    if q_unit is None:
+        return [0.0] * len(vectors)
+    return [
+        sum(a * b for a, b in zip(q_unit, row)) if row is not None else 0.0
+        for row in _unit_rows(vectors, dims)
+    ]
+
+
+def _lexical_overlap(query_terms: set[str], text: str) -> float:
+    """Share of the query's terms that occur in `text`."""
+    if not query_terms or not text:
+        return 0.0
+    return len(query_terms & set(tokenize(text))) / len(query_terms)
+
+
+def rerank_local(
+    query_vector: Sequence[float],
+    query_text: str | None,
+    hits: list[dict[str, Any]],
+    limit: int,
+    lexical_weight: float = RAG_RERANK_LEXICAL_WEIGHT,
+) -> list[dict[str, Any]]:
+    """
+    Top `limit` hits by blended cosine + lexical score.
+
+    Each returned hit's `score` is the blended score; the score it was
+    retrieved with is kept as `retrieval_score`.
+    """
+    if not hits:
+        return []
+    query_terms = set(tokenize(query_text or ""))
+    weight = lexical_weight if query_terms else 0.0
+    cosines = _cosines(query_vector, [hit_vector(hit) for hit in hits])
+    scored = [
+        (
+            (1 - weight) * cosine + weight * _lexical_overlap(query_terms, hit_text(hit)),
+            hit,
+        )
+        for cosine, hit in zip(cosines, hits)
+    ]
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return [rescored(hit, score) for score, hit in scored[:limit]]
+
+
+def rescored(hit: dict[str, Any], score: float) -> dict[str, Any]:
+    """Copy of `hit` carrying a re-rank `score`."""
+    return {**hit, "retrieval_score": hit.get("score"), "score": score}
+
+
+def without_vector(hit: dict[str, Any]) -> dict[str, Any]:
+    """Copy of `hit` without the vector fetched for scoring."""
+    return {k: v for k, v in hit.items() if k != "vector"}
+
+
+def _relevance(hits: list[dict[str, Any]]) -> list[float]:
+    """Hit scores min-max scaled to [0, 1], so MMR works on any score scale (cosine, RRF, rerank)."""
+    scores = [float(hit.get("score") or 0.0) for hit in hits]
+    low, high = min(scores), max(scores)
+    if high <= low:
+        return [1.0] * len(scores)
+    return [(s - low) / (high - low) for s in scores]
+
+
+def mmr_select(
+    hits: list[dict[str, Any]], limit: int, lambda_mult: float = RAG_MMR_LAMBDA
+) -> list[dict[str, Any]]:
+    """
+    Pick `limit` hits by maximal marginal relevance.
+
+    Hits are assumed ranked; relevance is their scaled score, redundancy the
+    highest cosine similarity of a hit's vector to any hit picked so far
+    (hits without a vector are never considered redundant).
+    """
+    if len(hits) <= 1 or limit <= 0:
+        return hits[:limit]
+    vectors = [hit_vector(hit) for hit in hits]
+    dims = max((len(v) for v in vectors if v is not None), default=0)
+    relevance = _relevance(hits)
+    picks = min(limit, len(hits))
+    order: list[int] = []
+
+    if np is not None:
+        unit = _unit_matrix(vectors, dims)
+        similarity = unit @ unit.T
+        weighted = lambda_mult * np.asarray(relevance, dtype=np.float32)
+        redundancy = np.zeros(len(hits), dtype=np.float32)
+        taken = np.zeros(len(hits), dtype=bool)
+        for _ in range(picks):
+            marginal = weighted - (1 - lambda_mult) * redundancy
+            marginal[taken] = -np.inf
+            i = int(np.argmax(marginal))
+            order.append(i)
+            taken[i] = True
+            np.maximum(redundancy, similarity[i], out=redundancy)
+        return [hits[i] for i in order]
+
+    unit_rows = _unit_rows(vectors, dims)
+    redundancy_list = [0.0] * len(hits)
+    remaining = set(range(len(hits)))
+    for _ in range(picks):
+        i = max(
+            sorted(remaining),
+            key=lambda j: lambda_mult * relevance[j] - (1 - lambda_mult) * redundancy_list[j],
+        )
+        order.append(i)
+        remaining.discard(i)
+        picked = unit_rows[i]
+        if picked is not None:
+            for j in remaining:
+                row = unit_rows[j]
+                if row is not None:
+                    sim = sum(a * b for a, b in zip(picked, row))
+                    redundancy_list[j] = max(redundancy_list[j], sim)
+    return [hits[i] for i in order]
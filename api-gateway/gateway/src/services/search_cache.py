@@ -0,0 +1,121 @@
+"""
+RAG search result cache with namespace-scoped invalidation.
+
+Entries are keyed by (embedding model, query text or vector hash, limit,
+score threshold, namespace) and tagged with the generation they were
+computed under. Qdrant writes bump generation counters instead of scanning
+the cache:
+
+- a write touching namespace N invalidates searches filtered on N,
+- every write invalidates unfiltered searches,
+- writes of unknown scope (delete by IDs, arbitrary filters) invalidate all.
+
+A search reads its generation *before* calling Qdrant, so a write that lands
+mid-search leaves the stored entry already stale. Counters are per process;
+with several workers HX_SEARCH_CACHE_TTL_S bounds how long another worker's
+write can go unseen.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+from ..metrics import search_cache_lookups
+from .embedding_cache import normalize_query, pack_vector
+
+SEARCH_CACHE_SIZE = int(os.getenv("HX_SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL_S = float(os.getenv("HX_SEARCH_CACHE_TTL_S", "30"))
+
+Generation = tuple[int, int]
+
+
+class SearchResultCache:
+    def __init__(
+        self, max_entries: int = SEARCH_CACHE_SIZE, ttl_s: float = SEARCH_CACHE_TTL_S
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._epoch = 0  # bumped by writes of unknown scope
+        self._unfiltered = 0  # bumped by every write
+        self._namespaces: dict[str, int] = {}
+        # key -> (expires_at, namespace, generation, result)
+        self._entries: OrderedDict[str, tuple[float, str | None, Generation, Any]] = OrderedDict()
+
+    @staticmethod
+    def key(
+        model: str,
+        query: str | None,
+        vector: list[float] | None,
+        limit: int,
+        threshold: float | None,
+        namespace: str | None,
+        **options: Any,
+    ) -> str:
+        """Cache key; `options` carries any extra parameters that change the result."""
+        h = hashlib.sha256()
+        if vector is not None:
+            h.update(b"v\0" + pack_vector(vector))
+        else:
+            h.update(b"q\0" + f"{model}\0{normalize_query(query or '')}".encode())
+        h.update(json.dumps([limit, threshold, namespace, options], sort_keys=True).encode())
+        return h.hexdigest()
+
+    def generation(self, namespace: str | None) -> Generation:
+        if namespace:
+            return self._epoch, self._namespaces.get(namespace, 0)
+        return self._epoch, self._unfiltered
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, namespace, generation, result = entry
+            if expires_at > time.monotonic() and generation == self.generation(namespace):
+                self._entries.move_to_end(key)
+                search_cache_lookups.labels(result="hit").inc()
+                return result
+            del self._entries[key]
+        search_cache_lookups.labels(result="miss").inc()
+        return None
+
+    def put(
+        self, key: str, namespace: str | None, generation: Generation, result: Any
+    ) -> None:
+        """Store `result` computed under `generation` (read before the search ran)."""
+        if self.max_entries <= 0 or generation != self.generation(namespace):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_s, namespace, generation, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, namespaces: Iterable[str | None]) -> None:
+        """Record a write to `namespaces` (None = points without a namespace)."""
+        self._unfiltered += 1
+        for namespace in set(namespaces):
+            if namespace:
+                self._namespaces[namespace] = self._namespaces.get(namespace, 0) + 1
+
+    def invalidate_all(self) -> None:
+        """Record a write whose affected namespaces are unknown."""
+        self._epoch += 1
+        self._entries.clear()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def filter_namespace(qfilter: dict[str, Any] | None) -> str | None:
+    """Namespace a Qdrant filter is confined to (a `must` namespace match), if any."""
+    for cond in (qfilter or {}).get("must") or []:
+        if isinstance(cond, dict) and cond.get("key") == "namespace":
+            value = (cond.get("match") or {}).get("value")
+            if isinstance(value, str) and value:
+                return value
+    return None
+
+
+search_cache = SearchResultCache()
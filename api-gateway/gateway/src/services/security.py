@@ -7,11 +7,14 @@ including write-scope validation for admin operations.
 
 from __future__ import annotations
 
+import logging
 import os
 from typing import Optional
 
 from fastapi import Header, HTTPException, Request
 
+logger = logging.getLogger(__name__)
+
 # Environment configuration - fail fast for production
 ENV = os.environ.get("ENV", "dev")
 if ENV == "prod":
@@ -94,3 +97,47 @@ async def get_embedding_auth(authorization: str | None = Header(default=None, al
         return fallback
         
     raise HTTPException(status_code=401, detail="Authorization required for embedding operations")
+
+
+async def require_gateway_auth(request: Request) -> str:
+    """
+    FastAPI dependency for the RAG read routes (search / search_batch).
+
+    These routes are mounted outside the pipeline's SecurityMiddleware and can
+    answer from the query-embedding or search-result caches (or a caller's own
+    vector) without any upstream call, so the bearer key is checked here, the
+    same way SecurityMiddleware checks it. Returns the header so it can be
+    forwarded to the embedding / rerank services.
+
+    Deprecated: callers that send no Authorization header are still let in
+    with the service's EMBEDDING_AUTH_HEADER, as before the key check existed,
+    unless HX_RAG_ENV_AUTH_FALLBACK=false. The fallback goes away next release.
+
+    Raises:
+        HTTPException: 401 if the Authorization header is missing or invalid
+    """
+    from ..middlewares.security import SecurityMiddleware
+
+    security = getattr(request.app.state, "security", None)
+    if security is None:
+        security = request.app.state.security = SecurityMiddleware()
+
+    auth = request.headers.get("authorization", "")
+    fallback = os.getenv("EMBEDDING_AUTH_HEADER")
+    if (
+        not auth
+        and fallback
+        and os.getenv("HX_RAG_ENV_AUTH_FALLBACK", "true").lower() in ("true", "1", "yes")
+    ):
+        logger.warning(
+            f"Deprecated: {request.url.path} called without Authorization; using"
+            " EMBEDDING_AUTH_HEADER. Send the gateway key, or set HX_RAG_ENV_AUTH_FALLBACK=false"
+        )
+        return fallback
+    if not security.is_authorized(auth):
+        raise HTTPException(
+            status_code=401,
+            detail="Unauthorized",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return auth
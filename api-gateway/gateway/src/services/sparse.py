@@ -0,0 +1,78 @@
+"""
+Sparse lexical vectors for hybrid RAG search.
+
+Documents are turned into BM25-weighted term vectors at upsert time and
+stored next to the dense embedding as a Qdrant sparse vector. The collection
+declares that vector with `"modifier": "idf"`, so Qdrant supplies the IDF
+half of BM25. Queries use unit weights, and dense and sparse hits are merged
+with reciprocal rank fusion.
+
+Token ids are CRC32 hashes, so no vocabulary has to be shared between
+writers. Compound tokens such as `llm-02` or `hx_rag_default` are kept
+whole, and their parts are indexed as well.
+"""
+
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Any
+
+RAG_HYBRID_ENABLED = os.environ.get("RAG_HYBRID_ENABLED", "false").lower() in ("true", "1", "yes")
+SPARSE_VECTOR_NAME = os.environ.get("RAG_SPARSE_VECTOR_NAME", "bm25")
+# Name of the dense vector in a hybrid collection ("" = the default vector)
+DENSE_VECTOR_NAME = os.environ.get("RAG_DENSE_VECTOR_NAME", "")
+BM25_K1 = float(os.environ.get("RAG_BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("RAG_BM25_B", "0.75"))
+BM25_AVG_DOC_TOKENS = float(os.environ.get("RAG_BM25_AVG_DOC_TOKENS", "200"))
+RRF_K = int(os.environ.get("RAG_RRF_K", "60"))
+
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[-_.:/][^\W_]+)*")
+_SEPARATOR_RE = re.compile(r"[-_.:/]")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens: list[str] = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if _SEPARATOR_RE.search(token):
+            tokens.extend(part for part in _SEPARATOR_RE.split(token) if part)
+    return tokens
+
+
+def _token_id(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def _to_sparse(weights: dict[int, float]) -> dict[str, list[Any]]:
+    indices = sorted(weights)
+    return {"indices": indices, "values": [weights[i] for i in indices]}
+
+
+def document_sparse_vector(text: str) -> dict[str, list[Any]]:
+    """BM25 term-frequency weights for a stored chunk (IDF is applied by Qdrant)."""
+    tokens = tokenize(text)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / BM25_AVG_DOC_TOKENS)
+    weights: dict[int, float] = {}
+    for token, tf in Counter(tokens).items():
+        idx = _token_id(token)
+        weights[idx] = weights.get(idx, 0.0) + tf * (BM25_K1 + 1) / (tf + norm)
+    return _to_sparse(weights)
+
+
+def query_sparse_vector(text: str) -> dict[str, list[Any]]:
+    return _to_sparse({_token_id(token): 1.0 for token in tokenize(text)})
+
+
+def rrf_fuse(rankings: list[list[dict[str, Any]]], limit: int, k: int = RRF_K) -> list[dict[str, Any]]:
+    """Merge ranked Qdrant hit lists; each hit's `score` becomes its fused RRF score."""
+    scores: dict[Any, float] = {}
+    hits: dict[Any, dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            point_id = hit.get("id")
+            scores[point_id] = scores.get(point_id, 0.0) + 1.0 / (k + rank + 1)
+            hits.setdefault(point_id, hit)
+    ordered = sorted(scores, key=scores.__getitem__, reverse=True)[:limit]
+    return [{**hits[point_id], "score": scores[point_id]} for point_id in ordered]
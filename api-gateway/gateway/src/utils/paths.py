@@ -0,0 +1,28 @@
+"""
+On-disk state locations.
+
+Spooled uploads and caches live under HX_DATA_DIR, a directory owned by the
+gateway's service account, never a shared temp dir where another local user
+could plant or swap files before the gateway reads them.
+"""
+
+import os
+
+DATA_DIR = os.getenv("HX_DATA_DIR", "/opt/HX-Infrastructure-/api-gateway/data")
+
+
+def ensure_private_dir(path: str) -> str:
+    """
+    Create `path` (mode 0700) if needed and check that only this user can write it.
+
+    Raises:
+        PermissionError: if the directory belongs to another user or is
+            group/world-writable
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(
+            f"{path} must be owned by uid {os.getuid()} and not group/world-writable"
+        )
+    return path
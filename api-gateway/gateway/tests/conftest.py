@@ -1,6 +1,9 @@
+import os
 import pathlib
 import sys
 
+import pytest
+
 # Resolve the project root directory (which is 'gateway/')
 project_root = pathlib.Path(__file__).resolve().parents[1]
 
@@ -9,3 +12,26 @@ project_root = pathlib.Path(__file__).resolve().parents[1]
 project_root_path = str(project_root)
 if project_root_path not in sys.path:
     sys.path.insert(0, project_root_path)
+
+# Keep the document embedding cache in memory; an on-disk tier would outlive the test run
+os.environ.setdefault("HX_DOC_EMBED_CACHE_DB", "")
+
+
+@pytest.fixture(autouse=True)
+def _reset_process_state():
+    """Breakers and caches are process-wide; keep one test's traffic out of the next."""
+    from src.services import circuit_breaker
+    from src.services.embedding_cache import document_embedding_cache, embedding_cache
+    from src.services.search_cache import search_cache
+
+    resets = (
+        circuit_breaker._breakers.clear,
+        embedding_cache.clear,
+        document_embedding_cache.clear,
+        search_cache.clear,
+    )
+    for reset in resets:
+        reset()
+    yield
+    for reset in resets:
+        reset()
@@ -90,10 +90,10 @@ async def test_transform_middleware_maps_prompt_to_input():
     result_context = await middleware.process(context)
 
     assert "response" not in result_context
-    assert "transformed_body" in result_context
+    assert result_context["payload"].dirty
     import json
 
-    transformed_payload = json.loads(result_context["transformed_body"])
+    transformed_payload = json.loads(result_context["payload"].to_bytes())
     assert "input" in transformed_payload
     assert "prompt" not in transformed_payload
     assert transformed_payload["input"] == "hello"
@@ -113,7 +113,7 @@ async def test_transform_middleware_ignores_other_paths():
     )
     context = {"request": request}
     result_context = await middleware.process(context)
-    assert "transformed_body" not in result_context
+    assert "payload" not in result_context
 
 
 # --- Full Pipeline Smoke Test ---
@@ -145,3 +145,720 @@ def test_full_pipeline_smoke_test_auth_failure(mock_request):
     assert "Unauthorized" in response.text
     # The execution middleware should not be called if auth fails
     mock_request.assert_not_called()
+
+
+# --- Streaming Pass-through Tests ---
+
+
+def _mock_upstream(handler):
+    import httpx
+
+    return httpx.AsyncClient(
+        base_url="http://test-upstream", transport=httpx.MockTransport(handler)
+    )
+
+
+@pytest.mark.asyncio
+async def test_execution_middleware_streams_sse_chunks():
+    """Streaming chat completions are relayed chunk by chunk, not buffered."""
+    import httpx
+    from src.middlewares.execution import ExecutionMiddleware
+    from starlette.responses import StreamingResponse
+
+    chunks = [b'data: {"delta": "Hel"}\n\n', b'data: {"delta": "lo"}\n\n', b"data: [DONE]\n\n"]
+
+    class ChunkStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for chunk in chunks:
+                yield chunk
+
+    def handler(request):
+        return httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, stream=ChunkStream()
+        )
+
+    middleware = ExecutionMiddleware()
+    middleware._client = _mock_upstream(handler)
+    request = Request(
+        {
+            "type": "http",
+            "path": "/v1/chat/completions",
+            "method": "POST",
+            "query_string": b"",
+            "headers": [],
+        }
+    )
+    context = {"request": request, "stream": True, "transformed_body": b"{}"}
+    result_context = await middleware.process(context)
+
+    response = result_context["response"]
+    assert isinstance(response, StreamingResponse)
+    assert response.headers["x-accel-buffering"] == "no"
+    received = [chunk async for chunk in response.body_iterator]
+    assert b"".join(received) == b"".join(chunks)
+
+
+@pytest.mark.asyncio
+async def test_execution_middleware_streaming_buffers_upstream_errors():
+    """Upstream errors in streaming mode come back as regular buffered responses."""
+    import httpx
+    from src.middlewares.execution import ExecutionMiddleware
+    from starlette.responses import StreamingResponse
+
+    def handler(request):
+        return httpx.Response(503, json={"error": "overloaded"})
+
+    middleware = ExecutionMiddleware()
+    middleware._client = _mock_upstream(handler)
+    request = Request(
+        {
+            "type": "http",
+            "path": "/v1/chat/completions",
+            "method": "POST",
+            "query_string": b"",
+            "headers": [(b"accept", b"text/event-stream")],
+        }
+    )
+    context = {"request": request, "transformed_body": b"{}"}
+    result_context = await middleware.process(context)
+
+    response = result_context["response"]
+    assert not isinstance(response, StreamingResponse)
+    assert response.status_code == 503
+    assert b"overloaded" in response.body
+
+
+# --- Request Body Forwarding Tests ---
+
+
+@pytest.mark.asyncio
+async def test_execution_middleware_streams_uninspected_body_upstream():
+    """Bodies no stage inspected are streamed upstream with their original length."""
+    import httpx
+    from src.middlewares.execution import ExecutionMiddleware
+
+    body = b'{"model": "llm01-llama3.2-3b", "prompt": "hi"}'
+    seen = {}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def handler(request):
+        seen["content"] = await request.aread()
+        seen["headers"] = request.headers
+        return httpx.Response(200, json={"ok": True})
+
+    middleware = ExecutionMiddleware()
+    middleware._client = _mock_upstream(handler)
+    request = Request(
+        {
+            "type": "http",
+            "path": "/v1/completions",
+            "method": "POST",
+            "query_string": b"",
+            "headers": [(b"content-length", str(len(body)).encode())],
+        },
+        receive,
+    )
+    context = {"request": request}
+    result_context = await middleware.process(context)
+
+    assert result_context["response"].status_code == 200
+    assert "request_body_bytes" not in context
+    assert not hasattr(request, "_body")  # never buffered via request.body()
+    assert seen["content"] == body
+    assert seen["headers"]["content-length"] == str(len(body))
+    assert "transfer-encoding" not in seen["headers"]
+
+
+@pytest.mark.asyncio
+async def test_read_body_is_shared_between_stages():
+    """Stages that inspect the body read it once into the pipeline context."""
+    from src.middlewares.base import read_body
+
+    calls = []
+
+    async def mock_body():
+        calls.append(1)
+        return b'{"input": "x"}'
+
+    request = Request({"type": "http", "path": "/v1/embeddings", "headers": []})
+    request.body = mock_body
+    context = {"request": request}
+
+    assert await read_body(context) == b'{"input": "x"}'
+    assert await read_body(context) == b'{"input": "x"}'
+    assert context["request_body_bytes"] == b'{"input": "x"}'
+    assert len(calls) == 1
+
+
+# --- Shared Request Payload Tests ---
+
+
+@pytest.mark.asyncio
+async def test_request_payload_parses_once_and_serializes_only_when_dirty():
+    """The shared payload is parsed lazily once and re-serialized only after a change."""
+    import json
+
+    from src.middlewares import payload as payload_module
+    from src.middlewares.payload import get_payload
+
+    raw = b'{"model": "m", "messages": []}'
+    loads_calls = []
+    real_loads = payload_module._loads
+
+    def counting_loads(data):
+        loads_calls.append(data)
+        return real_loads(data)
+
+    async def mock_body():
+        return raw
+
+    request = Request({"type": "http", "path": "/v1/chat/completions", "headers": []})
+    request.body = mock_body
+    context = {"request": request}
+
+    with patch.object(payload_module, "_loads", counting_loads):
+        payload = await get_payload(context)
+        assert payload.data["model"] == "m"
+        assert (await get_payload(context)).data is payload.data
+        assert payload.to_bytes() is raw  # untouched body is forwarded as-is
+
+        payload.data["model"] = "llm02-phi3"
+        payload.mark_dirty()
+        assert json.loads(payload.to_bytes())["model"] == "llm02-phi3"
+        assert not payload.dirty
+
+    assert len(loads_calls) == 1
+
+
+# --- Effective Body Contract Tests ---
+
+
+@pytest.mark.asyncio
+async def test_routed_model_reaches_upstream(tmp_path, monkeypatch):
+    """The model chosen by RoutingMiddleware is what ExecutionMiddleware sends."""
+    import json
+
+    import httpx
+    from src.middlewares import routing as routing_module
+    from src.middlewares.execution import ExecutionMiddleware
+    from src.middlewares.routing import RoutingMiddleware
+
+    (tmp_path / "routing.yaml").write_text(
+        "routing:\n  default_group: hx-chat\n  failover_order: [llm02-phi3]\n"
+    )
+    (tmp_path / "model_registry.yaml").write_text("models: []\n")
+    monkeypatch.setattr(routing_module, "CFG_DIR", str(tmp_path))
+
+    seen = {}
+
+    def handler(request):
+        seen["body"] = json.loads(request.content)
+        seen["headers"] = request.headers
+        return httpx.Response(200, json={"ok": True})
+
+    body = b'{"messages": [{"role": "user", "content": "hi"}]}'
+
+    async def mock_body():
+        return body
+
+    request = Request(
+        {
+            "type": "http",
+            "path": "/v1/chat/completions",
+            "method": "POST",
+            "query_string": b"",
+            "headers": [(b"content-encoding", b"identity")],
+        }
+    )
+    request.body = mock_body
+
+    execution = ExecutionMiddleware()
+    execution._client = _mock_upstream(handler)
+    context = {"request": request}
+    context = await RoutingMiddleware().process(context)
+    context = await execution.process(context)
+
+    assert context["routed_model"] == "llm02-phi3"
+    assert context["response"].status_code == 200
+    assert seen["body"]["model"] == "llm02-phi3"
+    assert seen["body"]["messages"][0]["content"] == "hi"
+    assert "content-encoding" not in seen["headers"]
+
+
+# --- Model Selection Tests ---
+
+REGISTRY_CANDIDATES = [
+    {"name": "llm01-llama3.2-3b", "tier_score": 0.8, "specializations": ["general"]},
+    {"name": "llm02-phi3", "tier_score": 0.75, "specializations": ["code"]},
+]
+ROUTING_CONFIG = {
+    "routing": {
+        "failover_order": ["llm02-phi3", "llm01-llama3.2-3b"],
+        "static_weights": {"llm01-llama3.2-3b": 0.4, "llm02-phi3": 0.4},
+    },
+    "features": {"load_source": "gateway"},
+}
+
+
+def test_selector_prefers_tier_and_specialization():
+    """Without load data, tier score decides unless the domain matches a specialization."""
+    from src.routing.selector import LoadTracker, ModelSelectionAlgorithm
+
+    algo = ModelSelectionAlgorithm(ROUTING_CONFIG, tracker=LoadTracker())
+    assert algo.select(algo.compile_all(REGISTRY_CANDIDATES), {}).name == "llm01-llama3.2-3b"
+    assert algo.select(algo.compile_all(REGISTRY_CANDIDATES), {"domain": "code"}).name == "llm02-phi3"
+    assert algo.select([], {}) is None
+
+
+def test_selector_balances_by_in_flight_and_latency():
+    """Busy or slow models lose traffic to idle, fast ones."""
+    from src.routing.selector import LoadTracker, ModelSelectionAlgorithm
+
+    tracker = LoadTracker()
+    algo = ModelSelectionAlgorithm(ROUTING_CONFIG, tracker=tracker)
+
+    started = tracker.start("llm01-llama3.2-3b")
+    assert algo.select(algo.compile_all(REGISTRY_CANDIDATES), {}).name == "llm02-phi3"
+    tracker.finish("llm01-llama3.2-3b", started)
+    assert tracker.in_flight("llm01-llama3.2-3b") == 0
+
+    tracker.finish("llm01-llama3.2-3b", started - 10.0)  # slow history
+    tracker.finish("llm02-phi3", tracker.start("llm02-phi3"))  # fast history
+    assert algo.select(algo.compile_all(REGISTRY_CANDIDATES), {}).name == "llm02-phi3"
+
+    # Load signals are ignored unless routing.yaml opts in
+    static_algo = ModelSelectionAlgorithm(
+        {**ROUTING_CONFIG, "features": {"load_source": "none"}}, tracker=tracker
+    )
+    assert static_algo.select(algo.compile_all(REGISTRY_CANDIDATES), {}).name == "llm01-llama3.2-3b"
+
+
+# --- Token Estimation Tests ---
+
+
+def test_prompt_size_estimates_per_family():
+    """Token estimates scale with text, count CJK per char and include max_tokens."""
+    from src.routing.tokens import PromptSize, model_family
+
+    payload = {
+        "messages": [
+            {"role": "system", "content": "a" * 360},
+            {"role": "user", "content": [{"type": "text", "text": "日本語"}]},
+        ],
+        "max_tokens": 100,
+    }
+    size = PromptSize.from_payload(payload)
+    assert model_family("llm02-gemma2-2b") == "gemma"
+    assert model_family("unknown-model") == "default"
+    assert size.prompt_tokens("llm02-gemma2-2b") == int(360 / 4.0 + 3 + 2 * 4)
+    assert size.total_tokens("llm02-gemma2-2b") == size.prompt_tokens("llm02-gemma2-2b") + 100
+    assert PromptSize.from_payload({}).total_tokens() == 0
+
+
+def test_selector_skips_models_without_context_headroom():
+    """Models whose context_length cannot hold the request are never selected."""
+    from src.routing.selector import LoadTracker, ModelSelectionAlgorithm
+    from src.routing.tokens import PromptSize
+
+    algo = ModelSelectionAlgorithm(tracker=LoadTracker())
+    candidates = algo.compile_all(
+        [
+            {"name": "small", "tier_score": 0.9, "context_length": 1024},
+            {"name": "large", "tier_score": 0.5, "context_length": 32768},
+        ]
+    )
+    short = {"prompt_size": PromptSize(ascii_chars=400)}
+    long = {"prompt_size": PromptSize(ascii_chars=8000)}
+    assert algo.select(candidates, short).name == "small"
+    assert algo.select(candidates, long).name == "large"
+    assert algo.select(candidates[:1], long) is None
+
+
+@pytest.mark.asyncio
+async def test_routing_rejects_requests_no_model_can_hold(tmp_path, monkeypatch):
+    """Oversized prompts get a 400 instead of a doomed upstream call."""
+    import json
+
+    from src.middlewares import routing as routing_module
+    from src.middlewares.routing import RoutingMiddleware
+
+    (tmp_path / "routing.yaml").write_text("routing:\n  default_group: hx-chat\n")
+    (tmp_path / "model_registry.yaml").write_text(
+        "models:\n  - {name: llm02-phi3, group: hx-chat, context_length: 256}\n"
+    )
+    monkeypatch.setattr(routing_module, "CFG_DIR", str(tmp_path))
+
+    async def run(payload):
+        body = json.dumps(payload).encode()
+
+        async def mock_body():
+            return body
+
+        request = Request(
+            {"type": "http", "path": "/v1/chat/completions", "method": "POST", "headers": []}
+        )
+        request.body = mock_body
+        return await RoutingMiddleware().process({"request": request})
+
+    long_prompt = [{"role": "user", "content": "word " * 2000}]
+    for payload in ({"messages": long_prompt}, {"model": "llm02-phi3", "messages": long_prompt}):
+        context = await run(payload)
+        assert context["response"].status_code == 400
+        assert b"context_length_exceeded" in context["response"].body
+
+    context = await run({"messages": [{"role": "user", "content": "hi"}]})
+    assert "response" not in context
+    assert context["routed_model"] == "llm02-phi3"
+
+    # A large completion budget is capped upstream, not rejected here
+    for payload in (
+        {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 8192},
+        {"model": "llm02-phi3", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 8192},
+    ):
+        context = await run(payload)
+        assert "response" not in context
+        assert context["routed_model"] == "llm02-phi3"
+
+
+def test_selector_scores_completion_budget_as_headroom_only():
+    """max_tokens lowers a model's score but never disqualifies it."""
+    from src.routing.selector import LoadTracker, ModelSelectionAlgorithm
+    from src.routing.tokens import PromptSize
+
+    algo = ModelSelectionAlgorithm(tracker=LoadTracker())
+    small, large = algo.compile_all(
+        [
+            {"name": "small", "tier_score": 0.9, "context_length": 1024},
+            {"name": "large", "tier_score": 0.5, "context_length": 32768},
+        ]
+    )
+    req_ctx = {"prompt_size": PromptSize(ascii_chars=40, completion_tokens=8192)}
+    assert algo.fits(small, req_ctx)
+    assert algo.select([small, large], req_ctx).name == "large"
+    assert algo.select([small], req_ctx).name == "small"
+
+
+# --- Routing Config Reload Tests ---
+
+
+def test_routing_config_hot_reloads_and_keeps_last_good(tmp_path):
+    """Edits are swapped in as a new version; broken edits keep the previous one."""
+    import os
+
+    from src.routing.config import RoutingConfig
+
+    registry = tmp_path / "model_registry.yaml"
+    routing = tmp_path / "routing.yaml"
+    registry.write_text("models:\n  - {name: llm02-phi3, group: hx-chat}\n")
+    routing.write_text("routing:\n  default_group: hx-chat\n")
+
+    config = RoutingConfig(str(tmp_path), interval_s=0)
+    first = config.snapshot
+    assert first.version == 1
+    assert [c.name for c in first.groups["hx-chat"]] == ["llm02-phi3"]
+    assert config.reload_if_changed() is False  # unchanged files are not re-parsed
+
+    def touch(path, text):
+        path.write_text(text)
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    touch(
+        registry,
+        "models:\n  - {name: llm02-phi3, group: hx-chat}\n"
+        "  - {name: llm01-llama3.2-3b, group: hx-chat}\n",
+    )
+    assert config.reload_if_changed() is True
+    assert config.snapshot.version == 2
+    assert len(config.snapshot.groups["hx-chat"]) == 2
+    assert len(first.groups["hx-chat"]) == 1  # old snapshot is untouched
+
+    touch(routing, "routing: [not, a, mapping]\n")
+    assert config.reload_if_changed() is False
+    assert config.snapshot.version == 2
+
+
+def test_routing_config_rejects_bad_numeric_fields_without_crashing(tmp_path):
+    """A bad tier_score/context_length is a reload error, at startup and on hot reload."""
+    import os
+
+    from src.metrics import routing_config_reloads
+    from src.routing.config import RoutingConfig
+
+    errors = routing_config_reloads.labels(result="error")
+    registry = tmp_path / "model_registry.yaml"
+    registry.write_text("models:\n  - {name: llm02-phi3, group: hx-chat, tier_score: high}\n")
+    before = errors._value.get()
+
+    config = RoutingConfig(str(tmp_path), interval_s=0)
+    assert config.snapshot.version == 0 and not config.snapshot.groups
+    assert errors._value.get() == before + 1
+
+    def touch(text):
+        registry.write_text(text)
+        st = os.stat(registry)
+        os.utime(registry, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    touch("models:\n  - {name: llm02-phi3, group: hx-chat, tier_score: 0.8}\n")
+    assert config.reload_if_changed() is True and config.snapshot.version == 1
+
+    touch("models:\n  - {name: llm02-phi3, group: hx-chat, context_length: 8k}\n")
+    assert config.reload_if_changed() is False
+    assert config.snapshot.version == 1
+    assert errors._value.get() == before + 2
+
+
+def test_routing_snapshot_precompiles_group_and_specialization_index():
+    """Candidates are compiled once per version with static scores and indexes."""
+    from src.routing.config import RoutingSnapshot
+    from src.routing.selector import STATIC_WEIGHT, TIER_WEIGHT
+
+    registry = {
+        "models": [
+            {**entry, "group": "hx-chat", "id": f"id-{entry['name']}"}
+            for entry in REGISTRY_CANDIDATES
+        ]
+    }
+    # Static scoring only: the snapshot uses the process-wide load tracker
+    snapshot = RoutingSnapshot(1, registry, {**ROUTING_CONFIG, "features": {}})
+
+    group = snapshot.groups["hx-chat"]
+    assert isinstance(group, tuple)
+    assert [c.name for c in group] == ["llm01-llama3.2-3b", "llm02-phi3"]
+    assert group[1].static_score == TIER_WEIGHT * 0.75 + STATIC_WEIGHT * 0.4
+    assert group[1].failover_rank == 0
+    assert snapshot.models["id-llm02-phi3"] is group[1]
+    assert snapshot.by_specialization["code"] == frozenset({"llm02-phi3"})
+
+    specialists = snapshot.by_specialization["code"]
+    req_ctx = {"domain": "code", "specialists": specialists}
+    assert snapshot.algo.select(group, req_ctx).name == "llm02-phi3"
+
+
+# --- Retry / Failover Tests ---
+
+
+@pytest.mark.asyncio
+async def test_execution_fails_over_to_next_model_on_upstream_errors(tmp_path, monkeypatch):
+    """Connect errors and 5xx are retried on the next model in failover_order."""
+    import json
+
+    import httpx
+    from src.middlewares import routing as routing_module
+    from src.middlewares.execution import ExecutionMiddleware
+    from src.middlewares.routing import RoutingMiddleware
+
+    (tmp_path / "routing.yaml").write_text(
+        "routing:\n  default_group: hx-chat\n"
+        "  failover_order: [llm02-phi3, llm01-llama3.2-3b, llm02-gemma2-2b]\n"
+        "retries:\n  total: 2\n  backoff_base_s: 0\n"
+    )
+    (tmp_path / "model_registry.yaml").write_text("models: []\n")
+    monkeypatch.setattr(routing_module, "CFG_DIR", str(tmp_path))
+
+    seen = []
+
+    def handler(request):
+        model = json.loads(request.content)["model"]
+        seen.append(model)
+        if model == "llm02-phi3":
+            raise httpx.ConnectError("node down", request=request)
+        if model == "llm01-llama3.2-3b":
+            return httpx.Response(503, json={"error": "overloaded"})
+        return httpx.Response(200, json={"model": model})
+
+    async def mock_body():
+        return b'{"messages": [{"role": "user", "content": "hi"}]}'
+
+    request = Request(
+        {
+            "type": "http",
+            "path": "/v1/chat/completions",
+            "method": "POST",
+            "query_string": b"",
+            "headers": [],
+        }
+    )
+    request.body = mock_body
+
+    execution = ExecutionMiddleware()
+    execution._client = _mock_upstream(handler)
+    context = await RoutingMiddleware().process({"request": request})
+    context = await execution.process(context)
+
+    assert seen == ["llm02-phi3", "llm01-llama3.2-3b", "llm02-gemma2-2b"]
+    assert context["response"].status_code == 200
+    assert context["routed_model"] == "llm02-gemma2-2b"
+
+
+@pytest.mark.asyncio
+async def test_execution_does_not_retry_unsafe_requests_or_past_deadline():
+    """Requests with side effects and requests out of deadline budget get one attempt."""
+    import httpx
+    from src.middlewares.execution import ExecutionMiddleware
+    from src.routing.retry import RetryPolicy
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503, json={"error": "overloaded"})
+
+    middleware = ExecutionMiddleware()
+    middleware._client = _mock_upstream(handler)
+
+    def make_context(path, policy):
+        request = Request(
+            {"type": "http", "path": path, "method": "POST", "query_string": b"", "headers": []}
+        )
+        return {"request": request, "transformed_body": b"{}", "retry_policy": policy}
+
+    retry_twice = RetryPolicy(total=2, backoff_base_s=0)
+    result = await middleware.process(make_context("/key/generate", retry_twice))
+    assert result["response"].status_code == 503
+    assert calls == ["/key/generate"]
+
+    calls.clear()
+    no_budget = RetryPolicy(total=2, backoff_base_s=0, deadline_s=0)
+    result = await middleware.process(make_context("/v1/embeddings", no_budget))
+    assert result["response"].status_code == 503
+    assert calls == ["/v1/embeddings"]
+
+    calls.clear()
+    result = await middleware.process(make_context("/v1/embeddings", retry_twice))
+    assert calls == ["/v1/embeddings"] * 3
+
+
+# --- Circuit Breaker Tests ---
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_fails_fast_and_half_opens(monkeypatch):
+    """A failing target is cut off, then probed once the cool-down expires."""
+    import httpx
+    from src.services import circuit_breaker as cb
+
+    now = [100.0]
+    monkeypatch.setattr(cb.time, "monotonic", lambda: now[0])
+    breaker = cb.CircuitBreaker("qdrant", error_rate=0.5, min_calls=2, open_s=10)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise httpx.ConnectError("down")
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(failing)
+    assert breaker.state == cb.OPEN
+
+    with pytest.raises(cb.CircuitOpenError) as excinfo:
+        await breaker.call(failing)
+    assert len(calls) == 2  # failed fast without touching the target
+    assert excinfo.value.retry_after == 10
+
+    now[0] += 10
+    assert breaker.allow() is True  # the single half-open probe
+    assert breaker.state == cb.HALF_OPEN
+    assert breaker.allow() is False
+    breaker.record(True, 0.01)
+    assert breaker.state == cb.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_execution_skips_models_with_open_circuits():
+    """An open circuit fails over immediately, or returns 503 when nothing is left."""
+    import json
+
+    import httpx
+    from src.middlewares.execution import ExecutionMiddleware
+    from src.middlewares.payload import RequestPayload
+    from src.routing.retry import RetryPolicy
+    from src.services.circuit_breaker import OPEN, get_breaker
+
+    breaker = get_breaker("upstream:llm02-phi3")
+    for _ in range(breaker.min_calls):
+        breaker.record(False)
+    assert breaker.state == OPEN
+
+    seen = []
+
+    def handler(request):
+        seen.append(json.loads(request.content)["model"])
+        return httpx.Response(200, json={"ok": True})
+
+    middleware = ExecutionMiddleware()
+    middleware._client = _mock_upstream(handler)
+
+    def make_context(failover):
+        request = Request(
+            {
+                "type": "http",
+                "path": "/v1/chat/completions",
+                "method": "POST",
+                "query_string": b"",
+                "headers": [],
+            }
+        )
+        return {
+            "request": request,
+            "payload": RequestPayload(b'{"model": "llm02-phi3"}'),
+            "routed_model": "llm02-phi3",
+            "failover_models": failover,
+            "retry_policy": RetryPolicy(total=1, backoff_base_s=0),
+        }
+
+    result = await middleware.process(make_context(("llm01-llama3.2-3b",)))
+    assert result["response"].status_code == 200
+    assert seen == ["llm01-llama3.2-3b"]
+
+    result = await middleware.process(make_context(()))
+    assert result["response"].status_code == 503
+    assert "retry-after" in result["response"].headers
+    assert seen == ["llm01-llama3.2-3b"]
+
+
+# --- Shared HTTP Client Tests ---
+
+
+@pytest.mark.asyncio
+async def test_http_client_registry_reuses_one_client_per_target():
+    """Qdrant/embedding calls share pooled clients until the app shuts down."""
+    from src.services.http_clients import EMBEDDINGS, QDRANT, HttpClientRegistry
+
+    registry = HttpClientRegistry()
+    qdrant = registry.get(QDRANT)
+    assert registry.get(QDRANT) is qdrant
+    assert registry.get(EMBEDDINGS) is not qdrant
+
+    await registry.aclose()
+    assert qdrant.is_closed
+    assert registry.get(QDRANT) is not qdrant
+    await registry.aclose()
+
+
+def test_http_client_registry_disposes_clients_of_closed_loops():
+    """A new event loop gets fresh clients; the finished loop's clients are closed, not leaked."""
+    import asyncio
+
+    from src.services.http_clients import QDRANT, HttpClientRegistry
+
+    registry = HttpClientRegistry()
+
+    async def get():
+        return registry.get(QDRANT)
+
+    first = asyncio.run(get())
+    assert not first.is_closed
+
+    async def next_loop():
+        client = registry.get(QDRANT)
+        await registry.aclose()
+        return client
+
+    second = asyncio.run(next_loop())
+    assert second is not first
+    assert first.is_closed and second.is_closed
+    assert registry._clients == {}
@@ -36,8 +36,10 @@ os.environ.setdefault("EMBEDDING_DIM", "1024")  # dimension validation guard
 os.environ.setdefault("QDRANT_URL", "http://127.0.0.1:6333")  # local test instance
 os.environ.setdefault("QDRANT_COLLECTION", "hx_rag_default")
 os.environ.setdefault("ADMIN_KEY", "sk-test-admin")  # admin authentication
+os.environ.setdefault("HX_MASTER_KEY", "test-master-key")  # gateway bearer key
 os.environ.setdefault("EMBEDDING_MODEL", "emb-premium")
 os.environ.setdefault("GATEWAY_BASE", "http://127.0.0.1:4000")
+os.environ.setdefault("HX_DOC_EMBED_CACHE_DB", "")  # no on-disk tier shared across runs
 # Additional auth keys for compatibility
 os.environ.setdefault("RAG_WRITE_KEY", "test-admin-key")
 os.environ.setdefault("HX_ADMIN_KEY", "test-admin-key")  # security layer expects this
@@ -81,3 +83,24 @@ def respx_embedding():
     # with respx.mock:
     #     yield respx
     pytest.skip("respx not configured - use monkeypatch mocking instead")
+
+
+@pytest.fixture(autouse=True)
+def _reset_process_state():
+    # Tests patch the embedder/Qdrant; cached vectors, results or open breakers
+    # must not let one test skip another's fake
+    from gateway.src.services import circuit_breaker
+    from gateway.src.services.embedding_cache import document_embedding_cache, embedding_cache
+    from gateway.src.services.search_cache import search_cache
+
+    resets = (
+        circuit_breaker._breakers.clear,
+        document_embedding_cache.clear,
+        embedding_cache.clear,
+        search_cache.clear,
+    )
+    for reset in resets:
+        reset()
+    yield
+    for reset in resets:
+        reset()
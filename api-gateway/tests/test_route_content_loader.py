@@ -7,6 +7,7 @@ Test suite for RAG content loader operations including:
 - Error handling for various content types
 """
 
+import json
 from io import BytesIO
 
 # Import the route modules we're testing
@@ -508,3 +509,455 @@ class TestContentLoaderResponseFormat:
         assert response_data["status"] == "ok"
         assert response_data["upserted"] > 0
         assert response_data["failed"] == 0
+
+
+# --- Incremental / Batched Loader Tests ---
+
+
+@pytest.mark.asyncio
+async def test_loader_if_changed_embeds_only_new_chunks_and_prunes_stale(monkeypatch):
+    """Refreshing a document writes the diff and deletes chunks the new version dropped."""
+    from gateway.src.models.rag_upsert_models import UpsertDoc
+    from gateway.src.routes import rag_content_loader as loader
+
+    embedded, upserted, refreshed, deleted = [], [], [], []
+
+    async def fake_existing(ids):
+        return {ids[0]}
+
+    async def fake_set_payloads(payloads):
+        refreshed.append(payloads)
+        return True, "ok"
+
+    async def fake_embed(texts, headers):
+        embedded.extend(texts)
+        return [[0.1] for _ in texts]
+
+    async def fake_upsert(points):
+        upserted.extend(points)
+        return True, "ok"
+
+    async def fake_delete(qfilter):
+        deleted.append(qfilter)
+        return True, "ok", 3
+
+    monkeypatch.setattr(loader, "qdrant_existing_ids", fake_existing)
+    monkeypatch.setattr(loader, "embed_texts", fake_embed)
+    monkeypatch.setattr(loader, "qdrant_upsert", fake_upsert)
+    monkeypatch.setattr(loader, "delete_by_filter", fake_delete)
+    monkeypatch.setattr(loader, "set_payloads", fake_set_payloads)
+    docs = [
+        UpsertDoc(text=t, namespace="ops", metadata={"expires_at": 2000})
+        for t in ("kept", "edited", "added")
+    ]
+
+    written, failed, details = await loader._store_chunks(
+        docs, "ops", "runbook.md", True, True, batch_size=10
+    )
+    ids = [loader.hash_id("ops", d.text, "runbook.md") for d in docs]
+    assert (written, failed) == (2, 0) and embedded == ["edited", "added"]
+    assert all(p["payload"]["source_doc"] == "runbook.md" for p in upserted)
+    # The skipped chunk is not re-embedded, but its payload (TTL included) is rewritten
+    assert refreshed == [
+        {ids[0]: {"expires_at": 2000, "namespace": "ops", "source_doc": "runbook.md"}}
+    ]
+    assert details == [
+        {"skipped_unchanged": 1},
+        {"batch_start": 0, "result": "upserted 2 chunks"},
+        {"deleted_stale": 3},
+    ]
+    [qfilter] = deleted
+    assert qfilter["must_not"] == [{"has_id": ids}]
+    assert {"key": "source_doc", "match": {"value": "runbook.md"}} in qfilter["must"]
+
+
+@pytest.mark.asyncio
+async def test_loader_chunk_ids_are_scoped_per_source_doc(monkeypatch):
+    """Equal text in two documents is two points; a failed refresh keeps stale cleanup off."""
+    from gateway.src.models.rag_upsert_models import UpsertDoc
+    from gateway.src.routes import rag_content_loader as loader
+
+    deleted = []
+
+    async def fake_existing(ids):
+        return set(ids)
+
+    async def fake_set_payloads(payloads):
+        return False, "qdrant unavailable"
+
+    async def fake_delete(qfilter):
+        deleted.append(qfilter)
+        return True, "ok", 0
+
+    monkeypatch.setattr(loader, "qdrant_existing_ids", fake_existing)
+    monkeypatch.setattr(loader, "set_payloads", fake_set_payloads)
+    monkeypatch.setattr(loader, "delete_by_filter", fake_delete)
+    assert loader.hash_id("ops", "shared", "a.md") != loader.hash_id("ops", "shared", "b.md")
+
+    docs = [UpsertDoc(text="shared", namespace="ops")]
+    written, failed, details = await loader._store_chunks(
+        docs, "ops", "a.md", True, True, batch_size=10
+    )
+    assert (written, failed) == (0, 1)
+    assert details == [
+        {"skipped_unchanged": 1},
+        {"error": "Payload refresh of unchanged chunks failed: qdrant unavailable"},
+        {"error": "Stale chunk cleanup skipped: some writes failed"},
+    ]
+    assert deleted == []
+
+
+def test_pdf_reupload_without_source_doc_matches_baseline_ids(client, monkeypatch):
+    """A PDF stored under unscoped ids is refreshed in place, not duplicated, on re-upload."""
+    from types import SimpleNamespace
+
+    from gateway.src.routes import rag_content_loader as loader
+    from gateway.src.services import rag_upsert_helpers as upsvc
+
+    texts = ["page one", "page two"]
+    baseline = {upsvc.hash_id("docs:pdf", t) for t in texts}
+    looked_up, upserted, refreshed = [], [], []
+
+    def fake_load_pdf_bytes(pdf_bytes, namespace, metadata, chunk_chars, overlap):
+        return [SimpleNamespace(id=None, text=t, namespace=namespace, metadata={}) for t in texts]
+
+    async def fake_existing(ids):
+        looked_up.extend(ids)
+        return set(ids) & baseline
+
+    async def fake_upsert(points):
+        upserted.extend(points)
+        return True, "ok"
+
+    async def fake_set_payloads(payloads):
+        refreshed.append(payloads)
+        return True, "ok"
+
+    monkeypatch.setattr(loader, "load_pdf_bytes", fake_load_pdf_bytes)
+    monkeypatch.setattr(loader, "qdrant_existing_ids", fake_existing)
+    monkeypatch.setattr(loader, "qdrant_upsert", fake_upsert)
+    monkeypatch.setattr(loader, "set_payloads", fake_set_payloads)
+    monkeypatch.setenv("ADMIN_KEY", "test-admin-key")  # conftest's ADMIN_KEY wins over RAG_WRITE_KEY
+
+    response = client.post(
+        "/v1/rag/upsert_pdf",
+        files={"file": ("manual.pdf", BytesIO(b"%PDF-1.4 mock"), "application/pdf")},
+        data={"namespace": "docs:pdf", "if_changed": "true"},
+        headers={"X-HX-Admin-Key": "test-admin-key"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["upserted"] == 0
+    assert set(looked_up) == baseline and upserted == []
+    # The refresh tags the old points with the file name so delete_stale can find them later
+    [payloads] = refreshed
+    assert set(payloads) == baseline
+    assert all(p["source_doc"] == "manual.pdf" for p in payloads.values())
+
+
+@pytest.mark.asyncio
+async def test_loader_batches_report_per_batch_outcomes(monkeypatch):
+    """Loader chunks are embedded/upserted per batch; one failed batch leaves the rest written."""
+    from gateway.src.models.rag_upsert_models import UpsertDoc
+    from gateway.src.routes import rag_content_loader as loader
+
+    embed_calls, deleted = [], []
+
+    async def fake_embed(texts, headers):
+        embed_calls.append(list(texts))
+        if "bad" in texts:
+            raise HTTPException(504, "embedding timeout")
+        return [[0.1] for _ in texts]
+
+    async def fake_upsert(points):
+        return True, "ok"
+
+    async def fake_delete(qfilter):
+        deleted.append(qfilter)
+        return True, "ok", 0
+
+    monkeypatch.setattr(loader, "embed_texts", fake_embed)
+    monkeypatch.setattr(loader, "qdrant_upsert", fake_upsert)
+    monkeypatch.setattr(loader, "delete_by_filter", fake_delete)
+    docs = [UpsertDoc(text=t, namespace="ops") for t in ("a", "b", "bad", "c", "d")]
+
+    written, failed, details = await loader._store_chunks(
+        docs, "ops", "guide.md", False, True, batch_size=2
+    )
+    assert sorted(map(len, embed_calls)) == [1, 2, 2]
+    assert (written, failed) == (3, 2)
+    assert details[:3] == [
+        {"batch_start": 0, "result": "upserted 2 chunks"},
+        {"batch_start": 2, "error": "embedding timeout"},
+        {"batch_start": 4, "result": "upserted 1 chunks"},
+    ]
+    assert deleted == []  # no stale cleanup after a partial refresh
+
+    with pytest.raises(HTTPException) as excinfo:
+        await loader._store_chunks(docs[2:3], "ops", None, False, False, batch_size=2)
+    assert excinfo.value.status_code == 504
+
+
+# --- Background Ingestion Tests ---
+
+
+@pytest.mark.asyncio
+async def test_ingest_jobs_run_queued_markdown(monkeypatch, tmp_path):
+    """Background ingestion spools the upload, runs it on a worker and records progress/result."""
+    import asyncio
+
+    from gateway.src.routes import rag_content_loader as loader
+    from gateway.src.services.ingest_jobs import IngestJobStore
+
+    async def fake_embed(texts, headers):
+        return [[0.1] for _ in texts]
+
+    async def fake_upsert(points):
+        return True, "ok"
+
+    monkeypatch.setattr(loader, "embed_texts", fake_embed)
+    monkeypatch.setattr(loader, "qdrant_upsert", fake_upsert)
+    store = IngestJobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path))
+    monkeypatch.setattr(loader, "ingest_jobs", store)
+
+    req = loader.MarkdownUpsertRequest(
+        text="# Ops\n\n" + "Restart the gateway after rotating keys. " * 20,
+        namespace="ops",
+        chunk_chars=200,
+        overlap=0,
+        batch_size=2,
+        background=True,
+    )
+    response = await loader.upsert_markdown(req)
+    assert response.status_code == 202
+    job_id = json.loads(response.body)["job_id"]
+    assert (await store.get(job_id))["status"] == "queued"
+
+    workers = store.start_workers(loader.run_ingest_job, count=1)
+    try:
+        for _ in range(200):
+            job = await store.get(job_id)
+            if job["status"] not in ("queued", "running"):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    assert job["status"] == "succeeded", job["error"]
+    assert job["result"]["upserted"] == job["progress"]["chunks_done"] > 0
+    assert job["progress"]["batches_done"] == job["progress"]["batches_total"]
+    assert list(tmp_path.glob("*.markdown")) == []  # spool file removed
+    assert await store.get("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_ingest_jobs_lease_keeps_sibling_workers_off_running_jobs(monkeypatch, tmp_path):
+    """A second process on the same queue only takes a running job once its lease expires."""
+    import asyncio
+
+    from gateway.src.services import ingest_jobs
+    from gateway.src.services.ingest_jobs import IngestJobStore
+
+    monkeypatch.setattr(ingest_jobs, "INGEST_LEASE_S", 0.15)
+    db = str(tmp_path / "jobs.sqlite3")
+    first, second = IngestJobStore(db, str(tmp_path)), IngestJobStore(db, str(tmp_path))
+    job_id = await first.enqueue("markdown", b"# doc", {})
+
+    # A heartbeat keeps renewing the lease of a job that outlives it
+    release = asyncio.Event()
+
+    async def slow_handler(job, progress):
+        await release.wait()
+        return {"upserted": 1}
+
+    workers = first.start_workers(slow_handler, count=1)
+    try:
+        for _ in range(100):
+            if (await first.get(job_id))["status"] == "running":
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.3)  # two lease lengths
+        assert await second.claim() is None
+        release.set()
+        for _ in range(100):
+            job = await first.get(job_id)
+            if job["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    assert job["status"] == "succeeded" and job["owner"] == first.owner
+
+    # A crashed owner stops renewing: the job is reclaimed after expiry, and
+    # the stale owner can neither renew nor record a result
+    job_id = await first.enqueue("markdown", b"# doc", {})
+    stale = await first.claim()
+    assert await second.claim() is None
+    await asyncio.sleep(0.2)
+    reclaimed = await second.claim()
+    assert reclaimed.id == stale.id == job_id
+    assert await first.renew(job_id) is False
+    await first.finish(stale, result={"upserted": 1})
+    assert (await first.get(job_id))["status"] == "running"
+    await second.finish(reclaimed, result={"upserted": 2})
+    assert (await first.get(job_id))["result"] == {"upserted": 2}
+
+
+@pytest.mark.asyncio
+async def test_ingest_jobs_upgrade_a_queue_created_before_leases(tmp_path):
+    """Older databases gain the lease columns; their leaseless running jobs are reclaimable."""
+    import sqlite3
+
+    from gateway.src.services.ingest_jobs import IngestJobStore
+
+    db = str(tmp_path / "jobs.sqlite3")
+    with sqlite3.connect(db) as conn:
+        conn.execute(
+            "CREATE TABLE ingest_jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+            " params TEXT NOT NULL, spool_path TEXT NOT NULL, progress TEXT NOT NULL DEFAULT '{}',"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        conn.execute(
+            "INSERT INTO ingest_jobs (id, kind, status, params, spool_path, created_at)"
+            " VALUES ('old', 'markdown', 'running', '{}', 'old.markdown', 0)"
+        )
+    store = IngestJobStore(db, str(tmp_path))
+    job = await store.claim()
+    assert job.id == "old"
+    assert (await store.get("old"))["owner"] == store.owner
+
+
+@pytest.mark.asyncio
+async def test_ingest_jobs_fail_poison_jobs_and_stay_inside_the_spool_dir(monkeypatch, tmp_path):
+    """Jobs that keep losing their worker are failed; foreign spool paths are never touched."""
+    import asyncio
+    import os
+    import sqlite3
+
+    from gateway.src.services import ingest_jobs
+    from gateway.src.services.ingest_jobs import IngestJobStore
+
+    monkeypatch.setattr(ingest_jobs, "INGEST_LEASE_S", 0.05)
+    monkeypatch.setattr(ingest_jobs, "INGEST_MAX_ATTEMPTS", 2)
+    spool = tmp_path / "spool"
+    db = str(spool / "jobs.sqlite3")
+    store = IngestJobStore(db, str(spool))
+    job_id = await store.enqueue("markdown", b"# doc", {})
+    assert os.stat(spool).st_mode & 0o777 == 0o700
+
+    for _ in range(2):
+        assert (await store.claim()).id == job_id
+        await asyncio.sleep(0.1)  # the worker "crashed": its lease runs out
+    assert await store.claim() is None
+    job = await store.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2
+    assert job["error"] == "Gave up after 2 attempts"
+    assert list(spool.glob("*.markdown")) == []
+
+    outside = tmp_path / "secret.markdown"
+    outside.write_bytes(b"not yours")
+    with sqlite3.connect(db) as conn:
+        conn.execute(
+            "INSERT INTO ingest_jobs (id, kind, status, params, spool_path, created_at)"
+            " VALUES ('planted', 'markdown', 'queued', '{}', ?, 0)",
+            (str(outside),),
+        )
+    job = await store.claim()
+    with pytest.raises(ValueError, match="outside"):
+        await store.read_spool(job)
+    await store.finish(job, error="Spool path outside spool dir")
+    assert outside.read_bytes() == b"not yours"
+
+    # A spool dir other users can write to is refused
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    with pytest.raises(PermissionError):
+        await IngestJobStore(str(shared / "jobs.sqlite3"), str(shared)).enqueue("pdf", b"%PDF", {})
+
+
+@pytest.mark.asyncio
+async def test_ingest_workers_back_off_on_queue_errors(monkeypatch, tmp_path):
+    """A locked database or full disk is logged and retried; the worker keeps running."""
+    import asyncio
+    import sqlite3
+
+    from gateway.src.services import ingest_jobs
+    from gateway.src.services.ingest_jobs import IngestJobStore
+
+    monkeypatch.setattr(ingest_jobs, "INGEST_POLL_S", 0.01)
+    store = IngestJobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path))
+    job_id = await store.enqueue("markdown", b"# doc", {})
+
+    failures = [sqlite3.OperationalError("database is locked"), OSError("disk full")]
+    real_claim = store.claim
+
+    async def flaky_claim():
+        if failures:
+            raise failures.pop(0)
+        return await real_claim()
+
+    async def failing_progress(job_id, progress):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def handler(job, progress):
+        await progress({"chunks_done": 1})
+        return {"upserted": 1}
+
+    monkeypatch.setattr(store, "claim", flaky_claim)
+    monkeypatch.setattr(store, "set_progress", failing_progress)
+    workers = store.start_workers(handler, count=1)
+    try:
+        for _ in range(200):
+            job = await store.get(job_id)
+            if job["status"] == "succeeded":
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    assert failures == [] and job["status"] == "succeeded"
+    assert job["progress"] == {}  # progress is best-effort
+
+
+@pytest.mark.asyncio
+async def test_ingest_jobs_prune_finished_jobs_and_orphan_spool_files(monkeypatch, tmp_path):
+    """Old finished jobs and unreferenced spool files go; live jobs and the database stay."""
+    import os
+
+    from gateway.src.services import ingest_jobs
+    from gateway.src.services.ingest_jobs import IngestJobStore
+
+    monkeypatch.setattr(ingest_jobs, "INGEST_LEASE_S", 0.0)
+    store = IngestJobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path))
+    done_id = await store.enqueue("markdown", b"# done", {})
+    await store.finish(await store.claim(), result={"upserted": 1})
+    queued_id = await store.enqueue("markdown", b"# queued", {})
+    orphan = tmp_path / f"{'a' * 32}.pdf"
+    orphan.write_bytes(b"%PDF")
+    os.utime(orphan, (0, 0))
+
+    assert await store.prune(retention_s=3600) == 0  # finished too recently
+    assert not orphan.exists()
+    assert await store.prune(retention_s=-1) == 1
+    assert await store.get(done_id) is None
+    assert (await store.get(queued_id))["status"] == "queued"
+    assert (tmp_path / f"{queued_id}.markdown").exists()
+    assert (tmp_path / "jobs.sqlite3").exists()
+
+
+@pytest.mark.asyncio
+async def test_background_ingestion_rejected_without_workers(monkeypatch, tmp_path):
+    """With HX_INGEST_WORKERS=0 nothing would run a queued job, so the route refuses it."""
+    from gateway.src.routes import rag_content_loader as loader
+
+    monkeypatch.setattr(loader, "INGEST_WORKERS", 0)
+    req = loader.MarkdownUpsertRequest(text="# Ops", namespace="ops", background=True)
+    with pytest.raises(HTTPException) as exc:
+        await loader.upsert_markdown(req)
+    assert exc.value.status_code == 503
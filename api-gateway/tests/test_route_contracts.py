@@ -5,6 +5,8 @@ Tests the basic contract for each route: 200 (success), 401 (unauthorized), 422
 These tests ensure routes maintain their expected behavior patterns and prevent drift.
 """
 
+import os
+
 import pytest
 
 
@@ -44,18 +46,48 @@ class TestRouteContracts:
                 "http://127.0.0.1:6333/collections/hx_rag_default/points/search"
             ).respond(200, json={"result": [], "status": "ok"})
 
-        response = client.post("/v1/rag/search", json=self.VALID_RAG_SEARCH)
+        headers = {"Authorization": f"Bearer {os.environ['HX_MASTER_KEY']}"}
+        response = client.post(
+            "/v1/rag/search", json=self.VALID_RAG_SEARCH, headers=headers
+        )
         assert response.status_code == 200
         data = response.json()
         assert "status" in data
 
+    def test_route_rag_search_401(self, client, monkeypatch):
+        """RAG search should return 401 without a valid gateway key"""
+        monkeypatch.setenv("HX_RAG_ENV_AUTH_FALLBACK", "false")
+        response = client.post("/v1/rag/search", json=self.VALID_RAG_SEARCH)
+        assert response.status_code == 401
+        headers = {"Authorization": "Bearer not-the-master-key"}
+        response = client.post(
+            "/v1/rag/search", json=self.VALID_RAG_SEARCH, headers=headers
+        )
+        assert response.status_code == 401
+
     def test_route_rag_search_422(self, client):
         """RAG search should return 422 with invalid data"""
+        headers = {"Authorization": f"Bearer {os.environ['HX_MASTER_KEY']}"}
         response = client.post(
-            "/v1/rag/search", json={}
+            "/v1/rag/search", json={}, headers=headers
         )  # Missing required query or vector
         assert response.status_code == 422
 
+    def test_route_rag_search_batch_401(self, client, monkeypatch):
+        """RAG batch search should return 401 without a valid gateway key"""
+        monkeypatch.setenv("HX_RAG_ENV_AUTH_FALLBACK", "false")
+        searches = {"searches": [self.VALID_RAG_SEARCH]}
+        response = client.post("/v1/rag/search_batch", json=searches)
+        assert response.status_code == 401
+
+    def test_route_rag_search_batch_422(self, client):
+        """RAG batch search should return 422 without any searches"""
+        headers = {"Authorization": f"Bearer {os.environ['HX_MASTER_KEY']}"}
+        response = client.post(
+            "/v1/rag/search_batch", json={"searches": []}, headers=headers
+        )
+        assert response.status_code == 422
+
     def test_route_rag_upsert_401(self, client):
         """RAG upsert should return 401 without admin auth"""
         response = client.post("/v1/rag/upsert", json=self.VALID_RAG_UPSERT)
@@ -187,6 +219,7 @@ class TestRouteDiscovery:
         # List of routes we expect to have contract tests for
         expected_routes = {
             "POST /v1/rag/search",
+            "POST /v1/rag/search_batch",
             "POST /v1/rag/upsert",
             "POST /v1/rag/delete/by_ids",
             "POST /v1/rag/delete/by_namespace",
@@ -194,6 +227,7 @@ class TestRouteDiscovery:
             "DELETE /v1/rag/document",
             "POST /v1/rag/upsert_markdown",
             "POST /v1/rag/upsert_pdf",
+            "GET /v1/rag/jobs/{job_id}",
         }
 
         actual_routes = set(v1_routes)
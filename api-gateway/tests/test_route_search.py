@@ -0,0 +1,646 @@
+# tests/test_route_search.py
+"""
+Test suite for RAG search operations including:
+- Query embedding and search result caches
+- Single and batch search routes
+- Hybrid (dense + sparse) retrieval
+- Re-ranking and MMR diversification
+- NDJSON responses and payload projection
+"""
+
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+# --- Query Embedding Cache Tests ---
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_lru_ttl_and_redis_tier(monkeypatch):
+    """Repeated queries hit memory, then Redis; entries expire and evict LRU-first."""
+    from gateway.src.services import embedding_cache as ec
+
+    class FakeRedis:
+        def __init__(self):
+            self.store = {}
+
+        async def get_bytes(self, key):
+            return self.store.get(key)
+
+        async def set_bytes(self, key, value, ttl_s):
+            self.store[key] = value
+            return True
+
+    now = [0.0]
+    monkeypatch.setattr(ec.time, "monotonic", lambda: now[0])
+    redis = FakeRedis()
+    cache = ec.EmbeddingCache(max_entries=2, ttl_s=60, shared=redis)
+
+    assert await cache.get("emb", "what is hx?") is None
+    await cache.put("emb", "what is hx?", [0.5, -1.25])
+    assert await cache.get("emb", "  what is   hx? ") == [0.5, -1.25]  # normalized key
+    assert await cache.get("other-model", "what is hx?") is None
+    assert len(next(iter(redis.store.values()))) == 2 * 4  # packed float32
+
+    await cache.put("emb", "b", [1.0])
+    await cache.put("emb", "c", [2.0])  # evicts the least recently used entry
+    assert cache.key("emb", "what is hx?") not in cache._entries
+
+    now[0] += 61  # memory entries expired; the shared tier repopulates memory
+    assert await cache.get("emb", "b") == [1.0]
+    assert cache.key("emb", "b") in cache._entries
+
+
+# --- Search Result Cache Tests ---
+
+
+def test_search_cache_invalidates_by_namespace_generation():
+    """Writes invalidate only the searches that could see them."""
+    from gateway.src.services.search_cache import SearchResultCache, filter_namespace
+
+    cache = SearchResultCache(max_entries=10, ttl_s=60)
+    keys = {
+        ns: cache.key("emb", "q", None, 5, None, ns) for ns in ("docs", "wiki", None)
+    }
+    for ns, key in keys.items():
+        cache.put(key, ns, cache.generation(ns), {"ns": ns})
+    assert cache.get(keys["docs"]) == {"ns": "docs"}
+
+    cache.invalidate(["wiki"])
+    assert cache.get(keys["docs"]) == {"ns": "docs"}
+    assert cache.get(keys["wiki"]) is None
+    assert cache.get(keys[None]) is None  # unfiltered searches see every write
+
+    # A write that lands while a search runs leaves its result uncached
+    generation = cache.generation("docs")
+    cache.invalidate(["docs"])
+    cache.put(keys["docs"], "docs", generation, {"stale": True})
+    assert cache.get(keys["docs"]) is None
+
+    cache.put(keys["docs"], "docs", cache.generation("docs"), {"ns": "docs"})
+    cache.invalidate_all()
+    assert cache.get(keys["docs"]) is None
+
+    ns_filter = {"must": [{"key": "namespace", "match": {"value": "docs"}}]}
+    assert filter_namespace(ns_filter) == "docs"
+    assert filter_namespace({"should": ns_filter["must"]}) is None
+
+
+# --- RAG Search Route Tests ---
+
+
+def test_rag_search_accepts_vector_namespace_and_threshold(client, monkeypatch):
+    """Precomputed vectors skip embedding; filters are passed through to Qdrant."""
+    from gateway.src.routes import rag
+
+    searches = []
+
+    async def fake_post(path, body):
+        searches.append((path, body))
+        return {"status": "ok", "result": []}
+
+    async def no_embedding(text, auth):
+        raise AssertionError("embedding must not be computed for a precomputed vector")
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    monkeypatch.setattr(rag, "_compute_embedding", no_embedding)
+    headers = {"Authorization": "Bearer test-master-key"}
+    body = {"vector": [0.1, 0.2], "limit": 3, "score_threshold": 0.5, "namespace": "docs"}
+
+    response = client.post("/v1/rag/search", json=body, headers=headers)
+    assert response.status_code == 200
+    [(path, search)] = searches
+    assert path == "points/search"
+    assert (search["vector"], search["limit"], search["score_threshold"]) == ([0.1, 0.2], 3, 0.5)
+    assert search["filter"]["must"][0]["match"]["value"] == "docs"
+
+    assert client.post("/v1/rag/search", json={}, headers=headers).status_code == 422
+    blank = client.post("/v1/rag/search", json={"query": "  "}, headers=headers)
+    assert blank.status_code == 422
+
+
+def test_rag_search_batch_uses_one_embedding_and_one_qdrant_call(client, monkeypatch):
+    """Batch search embeds unique texts once and sends one Qdrant batch request."""
+    from gateway.src.routes import rag
+
+    embed_calls, qdrant_calls = [], []
+
+    async def fake_embeddings(texts, auth):
+        embed_calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def fake_post(path, body):
+        qdrant_calls.append((path, body))
+        return {
+            "status": "ok",
+            "result": [[{"id": i, "score": s["vector"][0]}] for i, s in enumerate(body["searches"])],
+        }
+
+    monkeypatch.setattr(rag, "_compute_embeddings", fake_embeddings)
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    headers = {"Authorization": "Bearer test-master-key"}
+    searches = [
+        {"query": "alpha"},
+        {"query": "alpha", "namespace": "docs"},
+        {"vector": [9.0], "limit": 2},
+    ]
+
+    response = client.post("/v1/rag/search_batch", json={"searches": searches}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["result"][0]["score"] for r in results] == [5.0, 5.0, 9.0]
+    assert embed_calls == [["alpha"]]
+    assert len(qdrant_calls) == 1 and qdrant_calls[0][0] == "points/search/batch"
+    assert qdrant_calls[0][1]["searches"][1]["filter"]["must"][0]["match"]["value"] == "docs"
+
+    # Repeating the batch is served from the search result cache
+    response = client.post("/v1/rag/search_batch", json={"searches": searches}, headers=headers)
+    assert response.json()["results"] == results
+    assert len(qdrant_calls) == 1
+
+    bad = client.post("/v1/rag/search_batch", json={"searches": [{"query": " "}]}, headers=headers)
+    assert bad.status_code == 422
+
+
+# --- Search Authentication Tests ---
+
+
+def test_rag_search_checks_key_before_cached_query_embedding(client, monkeypatch):
+    """A cached query embedding is never served to a caller with a bad key."""
+    from gateway.src.routes import rag
+
+    embed_calls = []
+
+    async def fake_embeddings(texts, auth):
+        embed_calls.append(auth)
+        return [[0.5] for _ in texts]
+
+    async def fake_post(path, body):
+        return {"status": "ok", "result": [{"id": 1, "score": 0.9}]}
+
+    monkeypatch.setattr(rag, "_compute_embeddings", fake_embeddings)
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    monkeypatch.setenv("HX_RAG_ENV_AUTH_FALLBACK", "false")
+    good = {"Authorization": "Bearer test-master-key"}
+    body = {"query": "rotate keys", "namespace": "ops"}
+
+    assert client.post("/v1/rag/search", json=body, headers=good).status_code == 200
+    assert embed_calls == ["Bearer test-master-key"]
+    rag.search_cache.clear()  # leave only the query embedding cached
+
+    for auth in ("Bearer bogus", "x", None):
+        headers = {"Authorization": auth} if auth else {}
+        response = client.post("/v1/rag/search", json=body, headers=headers)
+        assert response.status_code == 401
+        batch = client.post("/v1/rag/search_batch", json={"searches": [body]}, headers=headers)
+        assert batch.status_code == 401
+    assert len(embed_calls) == 1
+
+
+def test_rag_search_checks_key_before_search_cache(client, monkeypatch):
+    """Cached search results (single or batch) are only served to a valid gateway key."""
+    from gateway.src.routes import rag
+
+    posted = []
+
+    async def fake_embeddings(texts, auth):
+        return [[0.5] for _ in texts]
+
+    async def fake_post(path, body):
+        posted.append(path)
+        if path == "points/search/batch":
+            return {"status": "ok", "result": [[{"id": 1, "score": 0.9}] for _ in body["searches"]]}
+        return {"status": "ok", "result": [{"id": 1, "score": 0.9}]}
+
+    monkeypatch.setattr(rag, "_compute_embeddings", fake_embeddings)
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    good = {"Authorization": "Bearer test-master-key"}
+    bogus = {"Authorization": "Bearer bogus"}
+    body = {"query": "rotate keys", "namespace": "secret"}
+
+    warm = client.post("/v1/rag/search", json=body, headers=good)
+    assert warm.status_code == 200
+    assert client.post("/v1/rag/search", json=body, headers=good).json() == warm.json()
+    assert len(posted) == 1  # second call was a cache hit
+
+    assert client.post("/v1/rag/search", json=body, headers=bogus).status_code == 401
+    batch = {"searches": [body]}
+    assert client.post("/v1/rag/search_batch", json=batch, headers=bogus).status_code == 401
+    assert client.post("/v1/rag/search_batch", json=batch, headers=good).status_code == 200
+    assert len(posted) == 1
+
+
+def test_rag_search_vector_only_still_needs_a_valid_key(client, monkeypatch):
+    """Precomputed vectors skip the embedding call, not authentication."""
+    from gateway.src.routes import rag
+
+    posted = []
+
+    async def fake_post(path, body):
+        posted.append(body)
+        return {"status": "ok", "result": [{"id": 1, "score": 0.9, "payload": {"doc_id": "a"}}]}
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    monkeypatch.setenv("HX_RAG_ENV_AUTH_FALLBACK", "false")
+    body = {"vector": [0.1, 0.2], "namespace": "secret"}
+
+    for headers in ({"Authorization": "x"}, {"Authorization": "Bearer bogus"}, {}):
+        assert client.post("/v1/rag/search", json=body, headers=headers).status_code == 401
+        batch = client.post("/v1/rag/search_batch", json={"searches": [body]}, headers=headers)
+        assert batch.status_code == 401
+    assert posted == []
+
+    headers = {"Authorization": "Bearer test-master-key"}
+    assert client.post("/v1/rag/search", json=body, headers=headers).status_code == 200
+    assert len(posted) == 1
+
+
+def test_rag_search_keeps_the_deprecated_env_auth_fallback(client, monkeypatch, caplog):
+    """Header-less callers still get EMBEDDING_AUTH_HEADER (with a warning) until it is switched off."""
+    from gateway.src.routes import rag
+
+    embed_calls = []
+
+    async def fake_embeddings(texts, auth):
+        embed_calls.append(auth)
+        return [[0.5] for _ in texts]
+
+    async def fake_post(path, body):
+        return {"status": "ok", "result": [{"id": 1, "score": 0.9}]}
+
+    monkeypatch.setattr(rag, "_compute_embeddings", fake_embeddings)
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    monkeypatch.setenv("EMBEDDING_AUTH_HEADER", "Bearer test-embedding-key")
+    body = {"query": "legacy caller", "namespace": "ops"}
+
+    with caplog.at_level("WARNING", logger="gateway.src.services.security"):
+        assert client.post("/v1/rag/search", json=body).status_code == 200
+    assert embed_calls == ["Bearer test-embedding-key"]
+    assert "EMBEDDING_AUTH_HEADER" in caplog.text
+    # A wrong key is still rejected; only the missing header falls back
+    bogus = {"Authorization": "Bearer bogus"}
+    assert client.post("/v1/rag/search", json=body, headers=bogus).status_code == 401
+
+    monkeypatch.setenv("HX_RAG_ENV_AUTH_FALLBACK", "false")
+    assert client.post("/v1/rag/search", json=body).status_code == 401
+    monkeypatch.setenv("HX_RAG_ENV_AUTH_FALLBACK", "true")
+    monkeypatch.delenv("EMBEDDING_AUTH_HEADER")
+    assert client.post("/v1/rag/search", json=body).status_code == 401
+
+
+# --- Hybrid Retrieval Tests ---
+
+
+def test_sparse_vectors_keep_compound_terms_and_rrf_rewards_agreement(monkeypatch):
+    """Hostnames/error codes are indexed whole and by part; RRF favors hits found by both legs."""
+    from gateway.src.services import rag_upsert_helpers as upsvc
+    from gateway.src.services.sparse import (
+        document_sparse_vector,
+        query_sparse_vector,
+        rrf_fuse,
+        tokenize,
+    )
+
+    assert tokenize("Timeout on LLM-02 (E1042)") == ["timeout", "on", "llm-02", "llm", "02", "e1042"]
+    doc = document_sparse_vector("llm-02 llm-02 restarted")
+    assert doc["indices"] == sorted(doc["indices"])
+    assert len(doc["indices"]) == len(set(doc["indices"])) == 4
+    assert set(query_sparse_vector("llm-02")["indices"]) <= set(doc["indices"])
+
+    dense = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    sparse = [{"id": "c"}, {"id": "d"}]
+    fused = rrf_fuse([dense, sparse], limit=2, k=60)
+    assert [hit["id"] for hit in fused] == ["c", "a"]
+    assert fused[0]["score"] == 1 / 63 + 1 / 61
+
+    monkeypatch.setattr(upsvc, "RAG_HYBRID_ENABLED", True)
+    point = upsvc.build_point("p1", [0.1], {"namespace": "ops"}, "llm-02 down")
+    assert point["vector"][""] == [0.1]
+    assert point["vector"]["bm25"]["indices"]
+
+
+def test_rag_search_hybrid_fuses_dense_and_sparse_legs(client, monkeypatch):
+    """Hybrid search sends both legs in one batch request and returns fused top-`limit`."""
+    from gateway.src.routes import rag
+
+    posted = []
+
+    async def fake_embeddings(texts, auth):
+        return [[0.5] for _ in texts]
+
+    async def fake_post(path, body):
+        posted.append((path, body))
+        dense = [{"id": "a", "score": 0.9}, {"id": "b", "score": 0.8}]
+        sparse = [{"id": "b", "score": 7.0}, {"id": "c", "score": 5.0}]
+        return {"status": "ok", "result": [dense, sparse]}
+
+    monkeypatch.setattr(rag, "RAG_HYBRID_ENABLED", True)
+    monkeypatch.setattr(rag, "_compute_embeddings", fake_embeddings)
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    headers = {"Authorization": "Bearer test-master-key"}
+    body = {"query": "llm-02 timeout", "limit": 2, "mode": "hybrid", "score_threshold": 0.3}
+
+    response = client.post("/v1/rag/search", json=body, headers=headers)
+    assert response.status_code == 200
+    assert [hit["id"] for hit in response.json()["result"]] == ["b", "a"]
+    path, batch = posted[0]
+    assert path == "points/search/batch"
+    dense_leg, sparse_leg = batch["searches"]
+    assert dense_leg["limit"] == sparse_leg["limit"] == 4
+    assert dense_leg["score_threshold"] == 0.3 and "score_threshold" not in sparse_leg
+    assert sparse_leg["vector"]["name"] == "bm25"
+
+    monkeypatch.setattr(rag, "RAG_HYBRID_ENABLED", False)
+    assert client.post("/v1/rag/search", json=body, headers=headers).status_code == 400
+
+
+# --- Re-ranking Tests ---
+
+
+def test_rerank_local_blends_cosine_and_lexical_overlap():
+    """Stored vectors and payload text reorder candidates."""
+    from gateway.src.services.rerank import rerank_local
+
+    hits = [
+        {"id": "a", "score": 0.9, "vector": [1.0, 0.0], "payload": {"text": "gpu memory"}},
+        {"id": "b", "score": 0.8, "vector": [0.6, 0.8], "payload": {"text_preview": "llm-02 timeout"}},
+        {"id": "c", "score": 0.7, "vector": None, "payload": {}},
+    ]
+    ranked = rerank_local([0.6, 0.8], "llm-02 timeout", hits, limit=2, lexical_weight=0.5)
+    assert [hit["id"] for hit in ranked] == ["b", "a"]
+    assert ranked[0]["score"] == pytest.approx(1.0)
+    assert ranked[0]["retrieval_score"] == 0.8
+    assert rerank_local([1.0], None, [], limit=3) == []
+
+
+def test_rag_search_rerank_fetches_candidates_and_returns_limit(client, monkeypatch):
+    """Re-ranked search over-fetches K candidates with vectors, then cuts to `limit`."""
+    from gateway.src.routes import rag
+
+    posted = []
+
+    async def fake_post(path, body):
+        posted.append((path, body))
+        return {
+            "status": "ok",
+            "result": [
+                {"id": "far", "score": 0.9, "vector": [0.0, 1.0]},
+                {"id": "near", "score": 0.5, "vector": [1.0, 0.0]},
+            ],
+        }
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    headers = {"Authorization": "Bearer test-master-key"}
+    body = {"vector": [1.0, 0.0], "limit": 1, "rerank": True, "rerank_candidates": 10}
+
+    response = client.post("/v1/rag/search", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["result"] == [{"id": "near", "score": 1.0, "retrieval_score": 0.5}]
+    path, search = posted[0]
+    assert path == "points/search"
+    assert search["limit"] == 10 and search["with_vectors"] is True
+
+    # Upstream cross-encoder failures fall back to retrieval order
+    async def failing_upstream(query, hits, limit, auth):
+        raise HTTPException(503, "rerank down")
+
+    monkeypatch.setattr(rag, "RAG_RERANK_MODEL", "rerank-premium")
+    monkeypatch.setattr(rag, "_rerank_upstream", failing_upstream)
+    body = {"query": "gpu", "vector": [1.0, 0.0], "limit": 1, "rerank": True}
+    response = client.post("/v1/rag/search", json=body, headers=headers)
+    assert [hit["id"] for hit in response.json()["result"]] == ["far"]
+    assert posted[-1][1]["with_vectors"] is False
+
+
+def test_rag_search_cross_encoder_reads_text_outside_selected_fields(client, monkeypatch):
+    """`fields` without a text field still sends hit text to the cross-encoder, then projects."""
+    from gateway.src.routes import rag
+
+    posted, documents = [], []
+
+    async def fake_post(path, body):
+        posted.append(body)
+        return {
+            "status": "ok",
+            "result": [
+                {"id": 1, "score": 0.9, "payload": {"doc_id": "a", "text": "cpu notes"}},
+                {"id": 2, "score": 0.8, "payload": {"doc_id": "b", "text": "gpu drivers"}},
+            ],
+        }
+
+    async def fake_upstream(query, hits, limit, auth):
+        documents.extend(rag.hit_text(hit) for hit in hits)
+        return [rag.rescored(hits[1], 0.99)]
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    monkeypatch.setattr(rag, "RAG_RERANK_MODEL", "rerank-premium")
+    monkeypatch.setattr(rag, "_rerank_upstream", fake_upstream)
+    body = {"query": "gpu", "vector": [1.0], "limit": 1, "rerank": True, "fields": ["doc_id"]}
+
+    response = client.post(
+        "/v1/rag/search", json=body, headers={"Authorization": "Bearer test-master-key"}
+    )
+    assert response.status_code == 200
+    assert posted[0]["with_payload"] == {"include": ["doc_id", *rag.RAG_RERANK_TEXT_FIELDS]}
+    assert documents == ["cpu notes", "gpu drivers"]
+    [hit] = response.json()["result"]
+    assert hit["id"] == 2 and hit["payload"] == {"doc_id": "b"}
+
+
+def test_mmr_skips_near_duplicate_chunks():
+    """MMR prefers a less relevant but distinct hit over an overlapping neighbour."""
+    from gateway.src.services import rerank
+
+    hits = [
+        {"id": "a", "score": 0.95, "vector": [1.0, 0.0]},
+        {"id": "a-overlap", "score": 0.94, "vector": [0.99, 0.05]},
+        {"id": "b", "score": 0.80, "vector": [0.0, 1.0]},
+    ]
+    assert [h["id"] for h in rerank.mmr_select(hits, 2, lambda_mult=0.5)] == ["a", "b"]
+    assert [h["id"] for h in rerank.mmr_select(hits, 2, lambda_mult=1.0)] == ["a", "a-overlap"]
+
+    with patch.object(rerank, "np", None):
+        assert [h["id"] for h in rerank.mmr_select(hits, 2, lambda_mult=0.5)] == ["a", "b"]
+
+
+def test_rag_search_mmr_requests_vectors_and_strips_them(client, monkeypatch):
+    """MMR search over-fetches with vectors and returns diversified hits without vectors."""
+    from gateway.src.routes import rag
+
+    posted = []
+
+    async def fake_post(path, body):
+        posted.append(body)
+        return {
+            "status": "ok",
+            "result": [
+                {"id": "a", "score": 0.95, "vector": [1.0, 0.0]},
+                {"id": "a-overlap", "score": 0.94, "vector": [1.0, 0.01]},
+                {"id": "b", "score": 0.80, "vector": [0.0, 1.0]},
+            ],
+        }
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    headers = {"Authorization": "Bearer test-master-key"}
+    body = {"vector": [1.0, 0.0], "limit": 2, "mmr": True, "mmr_lambda": 0.5}
+
+    response = client.post("/v1/rag/search", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["result"] == [{"id": "a", "score": 0.95}, {"id": "b", "score": 0.80}]
+    assert posted[0]["with_vectors"] is True
+    assert posted[0]["limit"] == rag.RAG_RERANK_CANDIDATES
+
+
+def test_rag_search_cache_key_tracks_refinement_candidates():
+    """MMR-only searches with different candidate counts never share a cache entry."""
+    from gateway.src.routes import rag
+
+    def key(**extra):
+        return rag._cache_key(rag.RagSearchRequest(vector=[1.0], limit=2, **extra))
+
+    assert key(mmr=True, rerank_candidates=10) != key(mmr=True, rerank_candidates=80)
+    assert key(rerank=True, rerank_candidates=10) != key(rerank=True, rerank_candidates=80)
+    assert key(mmr=True) != key(rerank=True, mmr=True)
+    assert key(rerank_candidates=10) == key(rerank_candidates=80)  # unused without refining
+
+
+def test_rag_search_cache_key_keeps_query_text_that_scores_hits():
+    """With a vector, hybrid and re-ranked searches still key on the query that scores hits."""
+    from gateway.src.routes import rag
+
+    def key(query, **extra):
+        return rag._cache_key(rag.RagSearchRequest(vector=[1.0], query=query, **extra))
+
+    assert key("llm-02 error", mode="hybrid") != key("completely different", mode="hybrid")
+    assert key("llm-02  error", mode="hybrid") == key("llm-02 error", mode="hybrid")
+    assert key("llm-02 error", rerank=True) != key("completely different", rerank=True)
+    assert key("llm-02 error") == key("completely different")  # dense-only: vector decides
+
+
+# --- Search Response Format Tests ---
+
+
+def test_rag_search_streams_ndjson_with_selected_fields(client, monkeypatch):
+    """Accept: application/x-ndjson yields one hit per line; `fields` becomes a payload selector."""
+    from gateway.src.routes import rag
+
+    posted = []
+
+    async def fake_post(path, body):
+        posted.append(body)
+        return {
+            "status": "ok",
+            "result": [
+                {"id": 1, "score": 0.9, "payload": {"doc_id": "a"}},
+                {"id": 2, "score": 0.8, "payload": {"doc_id": "b"}},
+            ],
+        }
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    headers = {"Authorization": "Bearer test-master-key", "Accept": "application/x-ndjson"}
+    body = {"vector": [0.1], "limit": 2, "fields": ["doc_id"]}
+
+    response = client.post("/v1/rag/search", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [hit["payload"]["doc_id"] for hit in lines] == ["a", "b"]
+    assert posted[0]["with_payload"] == {"include": ["doc_id"]}
+
+    # Cached results are rendered per request, so plain JSON still works
+    headers["Accept"] = "application/json"
+    response = client.post("/v1/rag/search", json=body, headers=headers)
+    assert response.json()["result"] == lines
+    assert len(posted) == 1
+
+
+def test_rag_scroll_streams_pages_as_ndjson(client, monkeypatch):
+    """NDJSON scroll follows next_page_offset page by page; JSON returns a single page."""
+    from gateway.src.routes import rag
+
+    posted = []
+    pages = {
+        None: {"points": [{"id": 1, "payload": {"doc_id": "a"}}], "next_page_offset": 2},
+        2: {"points": [{"id": 2, "payload": {"doc_id": "b"}}], "next_page_offset": 3},
+        3: {"points": [{"id": 3, "payload": {"doc_id": "c"}}], "next_page_offset": None},
+    }
+
+    async def fake_post(path, body):
+        posted.append((path, body))
+        if body.get("offset") == "broken":
+            raise HTTPException(503, "qdrant down")
+        return {"status": "ok", "result": pages[body.get("offset")]}
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    headers = {"Authorization": "Bearer test-master-key", "Accept": "application/x-ndjson"}
+    body = {"namespace": "docs", "limit": 1, "fields": ["doc_id"]}
+
+    response = client.post("/v1/rag/scroll", json=body, headers=headers)
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [1, 2, 3]
+    assert [b.get("offset") for _, b in posted] == [None, 2, 3]
+    path, first = posted[0]
+    assert path == "points/scroll" and first["with_payload"] == {"include": ["doc_id"]}
+    assert first["filter"] == {"must": [{"key": "namespace", "match": {"value": "docs"}}]}
+
+    posted.clear()
+    response = client.post("/v1/rag/scroll", json={**body, "max_points": 2}, headers=headers)
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [1, 2]
+    assert len(posted) == 2
+
+    # A failure after the first page ends the stream with an error line
+    pages[2] = {**pages[2], "next_page_offset": "broken"}
+    response = client.post("/v1/rag/scroll", json=body, headers=headers)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line.get("id") for line in lines[:2]] == [1, 2]
+    assert lines[2] == {"error": "Scroll stopped after 2 points: qdrant down"}
+
+    headers["Accept"] = "application/json"
+    response = client.post("/v1/rag/scroll", json=body, headers=headers)
+    assert response.json() == {"status": "ok", "result": pages[None]}
+
+
+def test_rag_search_payload_projection_selectors(client, monkeypatch):
+    """Default projection excludes bookkeeping keys; scoring text is fetched but not returned."""
+    from gateway.src.routes import rag
+
+    posted = []
+
+    async def fake_post(path, body):
+        posted.append(body)
+        return {
+            "status": "ok",
+            "result": [
+                {
+                    "id": 1,
+                    "score": 0.9,
+                    "vector": [1.0],
+                    "payload": {"doc_id": "a", "text_preview": "gpu"},
+                }
+            ],
+        }
+
+    monkeypatch.setattr(rag, "_qdrant_post", fake_post)
+    headers = {"Authorization": "Bearer test-master-key"}
+
+    def search(**extra):
+        response = client.post(
+            "/v1/rag/search", json={"vector": [1.0], **extra}, headers=headers
+        )
+        return response, (posted[-1]["with_payload"] if posted else None)
+
+    _, selector = search()
+    assert selector == {"exclude": sorted(rag.RAG_SEARCH_EXCLUDE_FIELDS)}
+    _, selector = search(exclude_fields=[])
+    assert selector is True
+    _, selector = search(fields=[])
+    assert selector is False
+
+    response, selector = search(query="gpu", fields=["doc_id"], rerank=True)
+    assert selector == {"include": ["doc_id", *rag.RAG_RERANK_TEXT_FIELDS]}
+    assert response.json()["result"][0]["payload"] == {"doc_id": "a"}
+
+    response, _ = search(fields=["doc_id"], exclude_fields=["text_preview"])
+    assert response.status_code == 422
@@ -4,6 +4,7 @@ import os
 # We'll patch at the route module import site
 import gateway.src.routes.rag_upsert as route
 import pytest
+from fastapi import HTTPException
 
 
 @pytest.fixture(autouse=True)
@@ -101,3 +102,229 @@ def test_upsert_requires_text_or_vector(client):
     assert "Document must provide either" in r.text and (
         "text" in r.text and "vector" in r.text
     )
+
+
+# --- Upsert Embedding Cache Tests ---
+
+
+@pytest.mark.asyncio
+async def test_cached_embed_texts_only_embeds_unseen_chunks():
+    """Re-ingesting a corpus embeds only new chunks, each distinct text once."""
+    from gateway.src.services import rag_upsert_helpers as upsvc
+
+    calls = []
+
+    async def fake_embed(texts, headers):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    first = await upsvc.cached_embed_texts(["aa", "b", "aa"], {}, fake_embed)
+    assert first == [[2.0], [1.0], [2.0]]
+    assert calls == [["aa", "b"]]
+
+    again = await upsvc.cached_embed_texts(["b", "ccc", "aa"], {}, fake_embed)
+    assert again == [[1.0], [3.0], [2.0]]
+    assert calls[-1] == ["ccc"]
+
+    # Whitespace is significant for documents (unlike search queries)
+    await upsvc.cached_embed_texts(["b "], {}, fake_embed)
+    assert calls[-1] == ["b "]
+
+    async def short_reply(texts, headers):
+        return [[9.0]]
+
+    assert await upsvc.cached_embed_texts(["x", "y", "b"], {}, short_reply) == [[9.0]]
+
+
+@pytest.mark.asyncio
+async def test_document_embeddings_persist_on_disk_across_restarts(monkeypatch, tmp_path):
+    """The on-disk tier outlives the worker: a fresh cache over the same file skips re-embedding."""
+    from gateway.src.services import embedding_store
+    from gateway.src.services.embedding_cache import EmbeddingCache
+
+    db = str(tmp_path / "emb" / "documents.sqlite3")
+    first = EmbeddingCache(max_entries=1, ttl_s=60, shared=embedding_store.SqliteEmbeddingStore(db))
+    texts = [f"chunk {i}" for i in range(3)]
+    await first.put_many("emb", [(t, [float(i)]) for i, t in enumerate(texts)])
+
+    # A restarted worker has an empty in-process tier; a 1-entry LRU would miss a sequential scan
+    restarted = EmbeddingCache(max_entries=1, ttl_s=60, shared=embedding_store.SqliteEmbeddingStore(db))
+    assert await restarted.get_many("emb", [*texts, "new"]) == [[0.0], [1.0], [2.0], None]
+
+    # Expired rows read as misses and are pruned on a later write
+    now = [embedding_store.time.time() + 61]
+    monkeypatch.setattr(embedding_store.time, "time", lambda: now[0])
+    assert await restarted._shared.get_many_bytes([restarted.key("emb", texts[0])]) == [None]
+    restarted._shared._pruned_at = 0.0
+    await restarted.put("emb", "fresh", [9.0])
+    with embedding_store.sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 1
+
+    # An unusable path degrades to misses instead of failing the upsert
+    (tmp_path / "file").write_text("")
+    broken = embedding_store.SqliteEmbeddingStore(str(tmp_path / "file" / "x.sqlite3"))
+    assert await broken.get_many_bytes(["k"]) == [None]
+    assert await broken.set_bytes("k", b"v", 60) is False
+
+
+@pytest.mark.asyncio
+async def test_document_embedding_store_only_uses_a_private_directory(tmp_path):
+    """The store's directory is created 0700; a directory others can write to is never opened."""
+    import os
+
+    from gateway.src.services import embedding_store
+
+    private = tmp_path / "emb"
+    store = embedding_store.SqliteEmbeddingStore(str(private / "documents.sqlite3"))
+    assert await store.set_bytes("k", b"v", 60) is True
+    assert os.stat(private).st_mode & 0o777 == 0o700
+
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    planted = embedding_store.SqliteEmbeddingStore(str(shared / "documents.sqlite3"))
+    assert await planted.get_many_bytes(["k"]) == [None]
+    assert await planted.set_bytes("k", b"v", 60) is False
+    assert list(shared.iterdir()) == []
+
+
+# --- Incremental Upsert Tests ---
+
+
+@pytest.mark.asyncio
+async def test_qdrant_existing_ids_matches_uuid_echoes(monkeypatch):
+    """Qdrant returns hex ids in UUID form; lookups map them back to the caller's ids."""
+    import httpx
+
+    from gateway.src.services import rag_upsert_helpers as upsvc
+
+    stored = "0123456789abcdef0123456789abcdef"
+
+    def handler(request):
+        assert request.url.path.endswith("/points")
+        return httpx.Response(200, json={"result": [{"id": "01234567-89ab-cdef-0123-456789abcdef"}]})
+
+    mock = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(upsvc.http_clients, "get", lambda target: mock)
+    assert await upsvc.qdrant_existing_ids([stored, "f" * 32]) == {stored}
+
+    def failing(request):
+        return httpx.Response(500, text="boom")
+
+    mock = httpx.AsyncClient(transport=httpx.MockTransport(failing))
+    assert await upsvc.qdrant_existing_ids([stored]) == set()
+
+
+def test_upsert_if_changed_refreshes_payload_of_unchanged_docs(client, monkeypatch):
+    """Unchanged text is not re-embedded, but its payload (TTL fields) is rewritten."""
+    embedded, refreshed = [], []
+
+    async def fake_existing(ids):
+        return {ids[0]}
+
+    async def fake_embed_texts(texts, headers):
+        embedded.extend(texts)
+        return [_vec() for _ in texts]
+
+    async def fake_qdrant_upsert(points):
+        return True, "ok"
+
+    async def fake_set_payloads(payloads):
+        refreshed.append(payloads)
+        return True, "ok"
+
+    monkeypatch.setattr(route, "qdrant_existing_ids", fake_existing)
+    monkeypatch.setattr(route, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(route, "qdrant_upsert", fake_qdrant_upsert)
+    monkeypatch.setattr(route, "qdrant_set_payloads", fake_set_payloads)
+    monkeypatch.setenv("ADMIN_KEY", "test-admin-key")  # conftest's ADMIN_KEY wins over RAG_WRITE_KEY
+    payload = {
+        "documents": [
+            {"text": "same old", "namespace": "docs:test", "metadata": {"expires_at": 2000}},
+            {"text": "brand new", "namespace": "docs:test"},
+        ],
+        "if_changed": True,
+    }
+    headers = {"X-HX-Admin-Key": os.getenv("RAG_WRITE_KEY", "")}
+    r = client.post("/v1/rag/upsert", json=payload, headers=headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["upserted"] == 1 and embedded == ["brand new"]
+    point_id = route.hash_id("docs:test", "same old")
+    assert refreshed == [
+        {
+            point_id: {
+                "expires_at": 2000,
+                "doc_id": point_id,
+                "namespace": "docs:test",
+                "text_preview": "same old",
+            }
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_qdrant_set_payloads_overwrites_each_point_in_one_call(monkeypatch):
+    """Payload refreshes go out as one batch update, one overwrite per point."""
+    import json
+
+    import httpx
+
+    from gateway.src.services import rag_upsert_helpers as upsvc
+
+    bodies = []
+
+    def handler(request):
+        assert request.url.path.endswith("/points/batch")
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={"status": "ok"})
+
+    mock = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(upsvc.http_clients, "get", lambda target: mock)
+    ok, _ = await upsvc.qdrant_set_payloads({"a": {"namespace": "ns", "n": 1}, "b": {"n": 2}})
+    assert ok
+    assert bodies == [
+        {
+            "operations": [
+                {"overwrite_payload": {"payload": {"namespace": "ns", "n": 1}, "points": ["a"]}},
+                {"overwrite_payload": {"payload": {"n": 2}, "points": ["b"]}},
+            ]
+        }
+    ]
+    assert await upsvc.qdrant_set_payloads({}) == (True, "")
+
+
+@pytest.mark.asyncio
+async def test_run_pipeline_overlaps_stages_and_keeps_batch_order():
+    """Embedding of the next batch runs while the previous one is written; results stay ordered."""
+    import asyncio
+
+    from gateway.src.services.batch_pipeline import run_pipeline
+
+    events = []
+
+    async def embed(batch):
+        events.append(("embed", batch))
+        await asyncio.sleep(0.01 if batch == 0 else 0)
+        return batch
+
+    async def write(batch):
+        events.append(("write", batch))
+        await asyncio.sleep(0.02)
+        events.append(("written", batch))
+        return batch * 10
+
+    results = await run_pipeline(
+        [0, 1, 2], embed, write, first_concurrency=1, second_concurrency=1, max_in_flight=3
+    )
+    assert results == [0, 10, 20]
+    assert events.index(("embed", 1)) < events.index(("written", 0))
+
+    async def failing_write(batch):
+        if batch == 1:
+            raise HTTPException(400, "bad dims")
+        await asyncio.sleep(0.05)
+        return batch
+
+    with pytest.raises(HTTPException) as excinfo:
+        await run_pipeline([0, 1, 2, 3], embed, failing_write, max_in_flight=2)
+    assert excinfo.value.status_code == 400